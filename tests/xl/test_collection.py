@@ -0,0 +1,114 @@
+import os
+import shutil
+from unittest.mock import patch
+
+import pytest
+from gi.repository import Gio
+
+from xl import collection, settings, trax
+
+
+def make_library(tmp_path):
+    data = os.path.join(os.path.dirname(__file__), '..', 'data', 'music')
+    shutil.copytree(data, str(tmp_path / 'music'))
+    c = collection.Collection('test', location=str(tmp_path / 'music.db'))
+    library = collection.Library(
+        Gio.File.new_for_path(str(tmp_path / 'music')).get_uri()
+    )
+    c.add_library(library)
+    library.rescan()
+    return c, library
+
+
+class TestQuickRescan:
+    def test_unchanged_directories_are_skipped(self, tmp_path):
+        c, library = make_library(tmp_path)
+        count = len(c)
+        assert count > 0
+        with patch('xl.trax.read_file_tags', wraps=trax.read_file_tags) as read:
+            library.rescan(quick=True)
+        assert not read.called
+        assert len(c) == count
+
+    def test_missing_tracks_are_added(self, tmp_path):
+        c, library = make_library(tmp_path)
+        count = len(c)
+        c.save_to_location()
+
+        c2 = collection.Collection('test2', location=str(tmp_path / 'music.db'))
+        c2.remove(next(iter(c2)))
+        c2.get_libraries()[0].rescan(quick=True)
+        assert len(c2) == count
+
+    def test_full_verify(self, tmp_path):
+        c, library = make_library(tmp_path)
+        settings.set_option('collection/scan_verify_interval', 0)
+        try:
+            with patch('xl.trax.read_file_tags', wraps=trax.read_file_tags) as read:
+                library.rescan(quick=True)
+        finally:
+            settings.set_option('collection/scan_verify_interval', 7)
+        assert read.call_count >= len(c)
+
+
+def scanned_tags(c):
+    return {
+        tr.get_loc_for_io(): {
+            tag: tr.get_tag_raw(tag)
+            for tag in tr.list_tags()
+            if not tag.startswith('__') or tag == '__length'
+        }
+        for tr in c
+    }
+
+
+class TestWorkers:
+    @pytest.mark.parametrize('processes', [False, True])
+    def test_rescan_with_workers(self, tmp_path, processes):
+        settings.set_option('collection/scan_workers', 1)
+        try:
+            c, library = make_library(tmp_path)
+        finally:
+            settings.set_option('collection/scan_workers', 4)
+        assert len(c) > 0
+
+        c2 = collection.Collection('test2', location=str(tmp_path / 'music2.db'))
+        c2.add_library(collection.Library(library.location))
+        settings.set_option('collection/scan_processes', processes)
+        try:
+            c2.get_libraries()[0].rescan()
+        finally:
+            settings.set_option('collection/scan_processes', False)
+        assert scanned_tags(c2) == scanned_tags(c)
+
+
+class TestBackgroundLoad:
+    def test_tracks_created_while_loading(self, tmp_path):
+        c, library = make_library(tmp_path)
+        tr = next(iter(c))
+        loc = tr.get_loc_for_io()
+        tr.set_tags(title='stored')
+        c.save_to_location()
+        del c, library, tr
+        trax.Track._Track__tracksdict.clear()
+
+        c2 = collection.Collection(
+            'test2', location=str(tmp_path / 'music.db'), background=True
+        )
+        # a playlist entry, created before or after its stored record
+        tr = trax.Track(loc)
+        assert c2.wait_loaded(5)
+        assert tr.get_tag_raw('title') == ['stored']
+
+    def test_rescan_waits_for_load(self, tmp_path):
+        c, library = make_library(tmp_path)
+        c._loaded.clear()
+        try:
+            with patch.object(library, 'rescan', wraps=library.rescan) as rescan:
+                c.rescan_libraries()
+            assert not rescan.called
+            # rescheduled by its timer
+            assert library.rescan(quick=True)
+        finally:
+            c._loaded.set()
+        assert c._Collection__pending_rescan == (False, False)
@@ -0,0 +1,113 @@
+from unittest.mock import patch
+
+import pytest
+
+from xl import collection, playlist
+from xl.trax import Track
+
+
+def make_tracks(titles):
+    tracks = []
+    for title in titles:
+        tr = Track('/playlist/%s.mp3' % title, scan=False)
+        tr.set_tags(title=title)
+        tracks.append(tr)
+    return tracks
+
+
+def titles(pl):
+    return [tr.get_tag_raw('title', join=True) for tr in pl]
+
+
+class TestSortedPlaylist:
+    def setup_method(self):
+        self.pl = playlist.Playlist('test', make_tracks(['d', 'b', 'f']))
+
+    def test_sort(self):
+        self.pl.sort(['title'])
+        assert titles(self.pl) == ['b', 'd', 'f']
+        assert self.pl.get_sort_order() is None
+        self.pl.append(make_tracks(['a'])[0])
+        assert titles(self.pl) == ['b', 'd', 'f', 'a']
+
+    # inserted one by one, or merged in one go
+    @pytest.mark.parametrize('ratio', [1, 0])
+    def test_insert_sorted(self, ratio):
+        self.pl.sort(['title'], keep_sorted=True)
+        assert self.pl.get_sort_order() == (('title',), False)
+        tracks = make_tracks(['e', 'a'])
+        with patch('xl.playlist._SORTED_INSERT_RATIO', ratio), patch(
+            'xl.event.log_event'
+        ) as log_event:
+            self.pl.extend(tracks)
+        assert titles(self.pl) == ['a', 'b', 'd', 'e', 'f']
+        log_event.assert_called_once()
+        assert log_event.call_args[0][0] == 'playlist_tracks_added'
+        assert [i for i, _tr in log_event.call_args[0][2]] == [0, 3]
+
+    @pytest.mark.parametrize('ratio', [1, 0])
+    def test_insert_sorted_reversed(self, ratio):
+        self.pl.sort(['title'], reverse=True, keep_sorted=True)
+        with patch('xl.playlist._SORTED_INSERT_RATIO', ratio):
+            self.pl.extend(make_tracks(['a', 'c', 'g', 'e']))
+            assert titles(self.pl) == ['g', 'f', 'e', 'd', 'c', 'b', 'a']
+            del self.pl[0]
+            self.pl.append(make_tracks(['h'])[0])
+        assert titles(self.pl) == ['h', 'f', 'e', 'd', 'c', 'b', 'a']
+
+    def test_positional_change_stops_sorting(self):
+        self.pl.sort(['title'], keep_sorted=True)
+        self.pl[0:0] = make_tracks(['z'])
+        assert self.pl.get_sort_order() is None
+        self.pl.append(make_tracks(['a'])[0])
+        assert titles(self.pl) == ['z', 'b', 'd', 'f', 'a']
+
+    @pytest.mark.parametrize('reverse', [False, True])
+    def test_tag_change_updates_sort_key(self, reverse):
+        self.pl.sort(['title'], reverse=reverse, keep_sorted=True)
+        track = self.pl[1]
+        track.set_tags(title='c')
+        assert self.pl.get_sort_order() == (('title',), reverse)
+        self.pl.append(make_tracks(['e'])[0])
+        expected = ['b', 'c', 'e', 'f']
+        assert titles(self.pl) == (expected[::-1] if reverse else expected)
+
+    def test_tag_change_out_of_order_stops_sorting(self):
+        self.pl.sort(['title'], keep_sorted=True)
+        self.pl[0].set_tags(title='z')
+        assert self.pl.get_sort_order() is None
+        self.pl.append(make_tracks(['a'])[0])
+        assert titles(self.pl) == ['z', 'd', 'f', 'a']
+
+    def test_other_tag_changes_are_ignored(self):
+        self.pl.sort(['title'], keep_sorted=True)
+        with patch.object(playlist.Playlist, '_Playlist__get_sort_key') as get_key:
+            self.pl[0].set_tags(artist='someone')
+        assert not get_key.called
+        assert self.pl.get_sort_order() == (('title',), False)
+
+    def test_tag_change_after_insert(self):
+        self.pl.sort(['title'], keep_sorted=True)
+        self.pl[0].set_tags(title='c')
+        self.pl.extend(make_tracks(['a', 'e']))
+        assert titles(self.pl) == ['a', 'c', 'd', 'e', 'f']
+        # positions of the tracks moved by the insert
+        self.pl[3].set_tags(title='z')
+        assert self.pl.get_sort_order() is None
+
+
+class TestSmartPlaylist:
+    def test_generated_once_collection_is_loaded(self):
+        c = collection.Collection('test')
+        c.add_tracks(make_tracks(['smart-a', 'smart-b']))
+        sp = playlist.SmartPlaylist('smart', collection=c)
+        sp.add_param('title', '==', 'smart-a')
+        c._loaded.clear()
+        try:
+            # not from some of the tracks, on the main thread
+            pl = sp.get_playlist()
+            assert titles(pl) == []
+        finally:
+            c._loaded.set()
+        playlist._fill_smart_playlists('collection_loaded', c, None)
+        assert titles(pl) == ['smart-a']
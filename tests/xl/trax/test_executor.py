@@ -0,0 +1,128 @@
+import threading
+import time
+from unittest.mock import patch
+
+from xl.trax import SearchExecutor, SearchSession, track
+from xl.trax.index import TagIndex
+from xl.trax.search import TracksMatcher
+
+
+class TestSearchExecutor:
+    def setup_method(self):
+        self.tracks = [
+            track.Track('/executor/%d.mp3' % i, scan=False) for i in range(200)
+        ]
+        for i, tr in enumerate(self.tracks):
+            tr.set_tag_raw('artist', 'foo' if i % 3 == 0 else 'bar')
+        self.expected = self.tracks[::3]
+        self.idle = []
+
+    def start(self, executor, **kwargs):
+        with patch('xl.trax.executor.GLib.idle_add', self.idle_add):
+            return executor.start(self.tracks, [TracksMatcher('artist==foo')], **kwargs)
+
+    def idle_add(self, func):
+        self.idle.append(func)
+        return len(self.idle)
+
+    def run_idle(self):
+        while self.idle:
+            func = self.idle.pop(0)
+            while func():
+                pass
+
+    def test_results_are_delivered_in_slices(self):
+        executor = SearchExecutor(budget=0)
+        found = []
+        done = []
+        task = self.start(executor, on_results=found.append, on_done=done.append)
+        assert not task.done
+        assert len(self.idle) == 1
+        self.run_idle()
+        assert task.done
+        assert len(found) > 1
+        assert [srtr.track for batch in found for srtr in batch] == self.expected
+        assert [srtr.track for srtr in done[0]] == self.expected
+
+    def test_small_searches_complete_right_away(self):
+        executor = SearchExecutor(budget=10)
+        done = []
+        task = self.start(executor, on_done=done.append)
+        assert task.done
+        assert not self.idle
+        assert len(done) == 1
+
+    def test_new_search_cancels_previous(self):
+        executor = SearchExecutor(budget=0)
+        done = []
+        with patch('xl.trax.executor.GLib.source_remove'):
+            first = self.start(executor, on_done=done.append)
+            second = self.start(executor, on_done=done.append)
+        assert first.cancelled
+        assert executor.is_running()
+        self.run_idle()
+        assert not executor.is_running()
+        assert second.done
+        assert len(done) == 1
+
+    def test_session(self):
+        session = SearchSession(self.tracks)
+        executor = SearchExecutor(budget=10)
+        done = []
+        session.start_search(executor, 'artist==foo', on_done=done.append)
+        assert [srtr.track for srtr in done[0]] == self.expected
+        # the results are reused by the next searches
+        assert [srtr.track for srtr in session.search('artist==foo')] == (self.expected)
+        assert len(session._results) == 1
+
+    def test_indexed_search_is_prepared_in_a_thread(self):
+        executor = SearchExecutor(budget=10)
+        done = []
+        prepared = threading.Event()
+        index = TagIndex(lambda: self.tracks)
+
+        def idle_add(func, *args):
+            self.idle.append(lambda: func(*args))
+            prepared.set()
+            return len(self.idle)
+
+        with patch('xl.trax.executor.GLib.idle_add', idle_add):
+            task = executor.start(
+                self.tracks,
+                [TracksMatcher('artist==foo')],
+                on_done=done.append,
+                index=index,
+            )
+            assert not task.done
+            assert prepared.wait(5)
+        self.run_idle()
+        assert task.done
+        assert [srtr.track for srtr in done[0]] == self.expected
+
+    def test_cancelled_while_preparing(self):
+        executor = SearchExecutor(budget=10)
+        done = []
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def prepare(*args):
+            started.set()
+            proceed.wait(5)
+            return lambda item: None
+
+        with patch('xl.trax.executor.prepare_search', prepare), patch(
+            'xl.trax.executor.GLib.idle_add', self.idle_add
+        ):
+            task = executor.start(
+                self.tracks,
+                [TracksMatcher('artist==foo')],
+                on_done=done.append,
+                index=TagIndex(lambda: self.tracks),
+            )
+            assert started.wait(5)
+            executor.cancel()
+            proceed.set()
+            time.sleep(0.1)
+        assert task.cancelled
+        assert not self.idle
+        assert not done
@@ -0,0 +1,65 @@
+import pytest
+
+from xl.trax import fuzzy
+
+
+def test_get_trigrams():
+    assert fuzzy.get_trigrams('Ab Ça') == {'  a', ' ab', 'ab ', '  c', ' ca', 'ca '}
+    assert fuzzy.get_trigrams('!!') == set()
+
+
+@pytest.mark.parametrize(
+    "text,value,similar",
+    [
+        ('beatels', 'The Beatles', True),
+        ('metallca', 'Metallica', True),
+        ('beatles', 'Metallica', False),
+        ('', 'Metallica', False),
+    ],
+)
+def test_similarity(text, value, similar):
+    assert (fuzzy.similarity(text, value) >= fuzzy.THRESHOLD) == similar
+
+
+class TestTrigramIndex:
+    def setup_method(self):
+        self.index = fuzzy.TrigramIndex()
+        for value in ('The Beatles', 'Beatles', 'Metallica', 'Beat It'):
+            self.index.add(value)
+
+    def test_search(self):
+        found = [value for value, score in self.index.search('beatels')]
+        assert found[0] == 'Beatles'
+        assert 'The Beatles' in found
+        assert 'Metallica' not in found
+        assert self.index.search('beatles')[0] == ('Beatles', 1.0)
+        assert self.index.search('xyz') == []
+
+    def test_same_as_similarity(self):
+        for text in ('beat', 'metal', 'the', 'be it'):
+            expected = {
+                value
+                for value in self.index.get_values()
+                if fuzzy.similarity(text, value) >= fuzzy.THRESHOLD
+            }
+            assert {value for value, score in self.index.search(text)} == expected
+
+    def test_remove(self):
+        self.index.remove('Beatles')
+        self.index.add('Beatlez')
+        assert len(self.index) == 4
+        found = [value for value, score in self.index.search('beatles')]
+        assert found[:2] == ['The Beatles', 'Beatlez']
+
+    def test_roundtrip(self, tmp_path):
+        location = str(tmp_path / 'music.db')
+        self.index.remove('Metallica')
+        fuzzy.write_trigrams(location, {'artist': self.index.to_data()})
+        index = fuzzy.read_trigrams(location)['artist']
+        assert sorted(index.get_values()) == sorted(self.index.get_values())
+        assert index.search('beatels') == self.index.search('beatels')
+        index.add('Metallica')
+        assert index.search('metalica')[0][0] == 'Metallica'
+
+    def test_missing(self, tmp_path):
+        assert fuzzy.read_trigrams(str(tmp_path / 'music.db')) == {}
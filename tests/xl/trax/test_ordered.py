@@ -0,0 +1,79 @@
+from xl.trax import TrackDB, track
+from xl.trax.ordered import OrderedView
+
+
+class TestOrderedView:
+    def setup_method(self):
+        self.tracks = []
+        for i in range(12):
+            tr = track.Track('/ordered/%02d.mp3' % i, scan=False)
+            tr.set_tags(
+                artist='Artist %d' % (i % 3),
+                album='Album %d' % (i % 2),
+                tracknumber=str(12 - i),
+            )
+            self.tracks.append(tr)
+        self.view = OrderedView(
+            lambda: self.tracks, [('artist',), ('album',), ('tracknumber',)]
+        )
+
+    def test_children(self):
+        children = self.view.get_children()
+        assert [count for _node, count, _track in children] == [4, 4, 4]
+        node = children[1][0]
+        albums = self.view.get_children(node)
+        assert [count for _node, count, _track in albums] == [2, 2]
+        tracks = self.view.get_tracks(albums[0][0])
+        assert [tr.get_tag_raw('tracknumber') for tr in tracks] == [['2'], ['8']]
+
+    def test_node_range(self):
+        children = self.view.get_children()
+        assert self.view.get_count(children[0][0], children[1][0]) == 8
+        tracks = self.view.get_tracks(children[1][0], children[2][0])
+        assert tracks == self.view.get_tracks()[4:]
+
+    def test_only(self):
+        only = set(self.tracks[:4])
+        children = self.view.get_children(only=only)
+        assert [count for _node, count, _track in children] == [2, 1, 1]
+        assert self.view.get_count(only=only) == 4
+        assert set(self.view.get_tracks(children[0][0], only=only)) == {
+            self.tracks[0],
+            self.tracks[3],
+        }
+
+    def test_updates(self):
+        assert len(self.view.get_children()) == 3
+        tr = track.Track('/ordered/new.mp3', scan=False)
+        tr.set_tags(artist='Artist 9', album='Album 0')
+        self.view.add_tracks([tr])
+        assert self.view.get_tracks()[-1] is tr
+
+        tr.set_tags(artist='Artist 0')
+        self.view.update_track(tr)
+        assert self.view.get_count(self.view.get_children()[0][0]) == 5
+        assert len(self.view.get_children()) == 3
+
+        self.view.remove_tracks([tr.get_loc_for_io()])
+        assert tr not in self.view.get_tracks()
+        assert self.view.get_count() == 12
+
+
+class TestTrackDBOrderedView:
+    def test_view_follows_db(self):
+        db = TrackDB('test')
+        tracks = []
+        for name in ('b', 'a', 'c'):
+            tr = track.Track('/ordered/db/%s.mp3' % name, scan=False)
+            tr._is_supported = True
+            tr.set_tags(title=name)
+            tracks.append(tr)
+        db.add_tracks(tracks[:2])
+        view = db.get_ordered_view([('title',)])
+        assert db.get_ordered_view([('title',)]) is view
+        assert view.get_tracks() == [tracks[1], tracks[0]]
+
+        db.add_tracks(tracks[2:])
+        tracks[1].set_tags(title='d')
+        db.remove_tracks(tracks[:1])
+        assert view.get_tracks() == [tracks[2], tracks[1]]
@@ -4,6 +4,7 @@ from unittest.mock import call, patch
 
 from xl.trax import search
 from xl.trax import track
+from xl.trax.trackdb import TrackDB
 import pytest
 
 
@@ -93,6 +94,36 @@ class TestInMatcher:
         assert not matcher.match(self.str)
 
 
+class TestRegexMatcher:
+    def setup_method(self):
+        self.str = get_search_result_track()
+
+    @pytest.mark.parametrize(
+        "pattern,literals",
+        [
+            (r'\bfoo\b', ('foo',)),
+            (r'foo.+bar', ('foo', 'bar')),
+            (r'ab*c', ('a', 'c')),
+            (r'a\.b', ('a.b',)),
+            (r'[abc]xyz', ('xyz',)),
+            (r'(ab)?cd', ('cd',)),
+            (r'foo|bar', ()),
+            (r'(?i)foo', ()),
+        ],
+    )
+    def test_required_literals(self, pattern, literals):
+        assert search._required_literals(pattern) == literals
+
+    def test_regex_matcher_word(self):
+        matcher = search._RegexMatcher('album', r'\bhello\b', lambda x: x)
+        self.str.track.set_tag_raw('album', 'say hello world')
+        assert matcher.match(self.str)
+        self.str.track.set_tag_raw('album', 'say helloworld')
+        assert not matcher.match(self.str)
+        self.str.track.set_tag_raw('album', 'say goodbye')
+        assert not matcher.match(self.str)
+
+
 class TestGtLtMatchers:
     def setup_method(self):
         self.str = get_search_result_track()
@@ -319,6 +350,37 @@ class TestTracksMatcher:
         else:
             assert not "We lost both parts of an or"
 
+    def test_paren_matcher_many(self):
+        matcher = search.TracksMatcher("( __rating>20 __rating<60 )")
+        assert len(matcher.matchers) == 1
+        match = matcher.matchers[0]
+        self.match_is_type(match, search._MultiMetaMatcher)
+        assert [type(ma) for ma in match.matchers] == [
+            search._GtMatcher,
+            search._LtMatcher,
+        ]
+
+    @pytest.mark.parametrize(
+        "sstr,tokens",
+        [
+            ('artist="foo bar" ! baz', ['', 'artist=foo bar', '!', 'baz']),
+            (r'foo\ bar', ['', 'foo bar']),
+            (r'title~\bfoo\b', ['', r'title~\bfoo\b']),
+        ],
+    )
+    def test_tokenize_query(self, sstr, tokens):
+        assert search._tokenize_query(sstr) == tokens
+
+    def test_parsed_queries_are_cached(self):
+        search._parse_query.cache_clear()
+        first = search.TracksMatcher("artist=foo | bar", keyword_tags=['artist'])
+        second = search.TracksMatcher("artist=foo | bar", keyword_tags=['artist'])
+        assert search._parse_query.cache_info().hits == 1
+        # every matcher gets its own conditions
+        assert first.matchers[0] is not second.matchers[0]
+        search.TracksMatcher("artist=foo | bar", keyword_tags=['album'])
+        assert search._parse_query.cache_info().misses == 2
+
     def test_match_true(self):
         matcher = search.TracksMatcher("foo", keyword_tags=['artist'])
         self.str.track.set_tag_raw('artist', 'foo')
@@ -421,3 +483,190 @@ class TestSearchTracks:
         assert next(gen).track == tracks[2]
         with pytest.raises(StopIteration):
             next(gen)
+
+
+class TestSearchIndex:
+    def setup_method(self):
+        self.db = TrackDB('test')
+        self.tracks = [
+            track.Track('/index/%s.mp3' % x, scan=False)
+            for x in ('foo', 'bar', 'baz', 'quux')
+        ]
+        for tr, artist in zip(self.tracks, ('Foooo', 'bar', 'foooooo', None)):
+            if artist:
+                tr.set_tag_raw('artist', artist)
+        for tr, rating, bpm in zip(
+            self.tracks, (80, 20, None, 60), ('120', None, '95', 'fast')
+        ):
+            if rating is not None:
+                tr.set_tag_raw('__rating', rating)
+            if bpm is not None:
+                tr.set_tag_raw('bpm', bpm)
+        self.db.add_tracks(self.tracks)
+
+    def search(self, search_string, **kwargs):
+        return [
+            srtr.track
+            for srtr in search.search_tracks_from_string(
+                self.db, search_string, keyword_tags=['artist'], **kwargs
+            )
+        ]
+
+    @pytest.mark.parametrize(
+        "sstr",
+        [
+            "foo",
+            "artist=foo",
+            "artist==bar",
+            "artist==__null__",
+            "foo | bar",
+            "! foo",
+            "artist~^f",
+            "__loc~baz",
+            "__rating>50",
+            "__rating<30",
+            "__rating==60",
+            "( __rating>60 | __rating==60 )",
+            "bpm>100",
+            "bpm<100",
+            "! bpm<100",
+            "__bitrate<0",
+            "artist~~fooo",
+            "~~fooooo",
+            "bpm~~fats",
+        ],
+    )
+    @pytest.mark.parametrize("case_sensitive", [True, False])
+    def test_same_results_as_scanning(self, sstr, case_sensitive):
+        expected = [
+            srtr.track
+            for srtr in search.search_tracks_from_string(
+                self.tracks,
+                sstr,
+                case_sensitive=case_sensitive,
+                keyword_tags=['artist'],
+            )
+        ]
+        assert self.search(sstr, case_sensitive=case_sensitive) == expected
+
+    def test_candidates(self):
+        index = self.db.get_search_index()
+        matcher = search.TracksMatcher('artist==bar')
+        assert matcher.candidates(index) == {self.tracks[1]}
+        assert search.TracksMatcher('artist~oo$').candidates(index) == {
+            self.tracks[0],
+            self.tracks[2],
+        }
+        assert search.TracksMatcher('artist<bar').candidates(index) == set()
+
+    def test_index_is_updated(self):
+        assert self.search('artist==bar') == [self.tracks[1]]
+        self.tracks[1].set_tag_raw('artist', 'baz')
+        assert self.search('artist==bar') == []
+        assert self.search('artist==baz') == [self.tracks[1]]
+
+        new = track.Track('/index/new.mp3', scan=False)
+        new.set_tag_raw('artist', 'baz')
+        self.db.add_tracks([new])
+        assert self.search('artist==baz') == [self.tracks[1], new]
+
+        self.db.remove_tracks([self.tracks[1]])
+        assert self.search('artist==baz') == [new]
+
+    def test_index_is_updated_without_event(self):
+        assert self.search('artist==bar') == [self.tracks[1]]
+        self.tracks[1].set_tags(artist='baz', notify_changed=False)
+        assert self.search('artist==bar') == []
+        assert self.search('artist==baz') == [self.tracks[1]]
+
+    def test_range_candidates(self):
+        index = self.db.get_search_index()
+        assert search.TracksMatcher('__rating>50').candidates(index) == {
+            self.tracks[0],
+            self.tracks[3],
+        }
+        # missing values compare as 0
+        assert search.TracksMatcher('bpm<100').candidates(index) == {
+            self.tracks[1],
+            self.tracks[2],
+        }
+        assert search.TracksMatcher('bpm>fast').candidates(index) == set()
+
+    def test_range_index_is_updated(self):
+        assert self.search('__rating>70') == [self.tracks[0]]
+        self.tracks[0].set_tag_raw('__rating', 40)
+        self.tracks[2].set_tag_raw('__rating', 100)
+        assert self.search('__rating>70') == [self.tracks[2]]
+        assert self.search('__rating<50') == [self.tracks[0], self.tracks[1]]
+
+        self.db.remove_tracks([self.tracks[2]])
+        assert self.search('__rating>70') == []
+
+    def test_find_similar(self):
+        index = self.db.get_search_index()
+        found = index.find_similar('artist', 'fooooo')
+        assert {tr for tr, score in found} == {self.tracks[0], self.tracks[2]}
+        assert index.find_similar('artist', 'bra') == []
+        assert index.find_similar('artist', 'bar') == [(self.tracks[1], 1.0)]
+        self.tracks[1].set_tag_raw('artist', 'foooooo')
+        assert len(index.find_similar('artist', 'fooooo')) == 3
+
+    def test_plan_checks_selective_conditions_first(self):
+        index = self.db.get_search_index()
+        list(self.search('artist==bar'))
+        matcher = search.TracksMatcher('foo artist==bar', keyword_tags=['artist'])
+        plan = matcher.explain(index).splitlines()
+        assert plan[0].startswith('AND')
+        assert plan[1].strip().startswith("artist=='bar'")
+
+    def test_compiled_match_sets_on_tags(self):
+        matcher = search.TracksMatcher('foo', keyword_tags=['artist', 'album'])
+        matcher.compile(self.db.get_search_index())
+        srtr = search.SearchResultTrack(self.tracks[2])
+        assert matcher.match(srtr)
+        assert srtr.on_tags == ['artist']
+
+
+class TestSearchSession:
+    def setup_method(self):
+        self.tracks = [track.Track('/session/%d.mp3' % i, scan=False) for i in range(4)]
+        for tr, artist in zip(self.tracks, ('Beatles', 'Beat Happening', 'ABBA', '')):
+            tr.set_tag_raw('artist', artist)
+        self.session = search.SearchSession(self.tracks)
+
+    def search(self, search_string):
+        results = self.session.search(
+            search_string, case_sensitive=False, keyword_tags=['artist']
+        )
+        return [srtr.track for srtr in results]
+
+    def test_refines_previous_results(self):
+        assert self.search('beat') == self.tracks[:2]
+        with patch.object(search, 'search_tracks', wraps=search.search_tracks) as st:
+            assert self.search('beatl') == self.tracks[:1]
+        assert st.call_args[0][0] == self.tracks[:2]
+
+    def test_unrelated_search_goes_through_all_tracks(self):
+        assert self.search('beat') == self.tracks[:2]
+        assert self.search('abba') == self.tracks[2:3]
+
+    @pytest.mark.parametrize(
+        "old, new, refines",
+        [
+            ("beat", "beatl", True),
+            ("beat", "beat les", True),
+            ("artist=beat", "artist=beatles", True),
+            ("artist==beat", "artist==beatles", False),
+            ("beat", "! beatles", False),
+            ("beat les", "beat", False),
+        ],
+    )
+    def test_refines(self, old, new, refines):
+        old = search.TracksMatcher(old, keyword_tags=['artist'])
+        new = search.TracksMatcher(new, keyword_tags=['artist'])
+        assert search._refines(new, old) == refines
+
+    def test_changed_tracks_clear_results(self):
+        assert self.search('beat') == self.tracks[:2]
+        self.session.set_tracks(self.tracks[1:])
+        assert self.search('beatl') == []
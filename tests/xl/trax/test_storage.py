@@ -0,0 +1,112 @@
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from xl import settings
+from xl.trax import Track, TrackDB, storage
+from xl.trax.journal import TrackDBJournal
+
+
+@pytest.fixture
+def sqlite_storage():
+    settings.set_option('collection/storage', 'sqlite')
+    yield
+    settings.set_option('collection/storage', 'shelf')
+
+
+class TestSQLiteShelf:
+    def test_roundtrip(self, tmp_path):
+        path = str(tmp_path / 'music.db-sqlite')
+        shelf = storage.SQLiteShelf(path)
+        tags = {'__loc': 'file:///a', 'artist': ['foo'], '__playcount': 2}
+        shelf['name'] = 'test'
+        shelf['tracks-3'] = (tags, 3, {'x': 1})
+        shelf.close()
+
+        shelf = storage.SQLiteShelf(path)
+        assert shelf['name'] == 'test'
+        assert shelf['tracks-3'] == (tags, 3, {'x': 1})
+        assert 'tracks-3' in shelf
+        assert set(shelf.keys()) == {'name', 'tracks-3'}
+
+        packed, key, attrs = shelf.read_all()['tracks-3']
+        assert (packed.loc, packed.unpack(), key, attrs) == (
+            'file:///a',
+            tags,
+            3,
+            {'x': 1},
+        )
+
+        del shelf['tracks-3']
+        assert 'tracks-3' not in shelf
+        shelf.close()
+
+    def test_indexed_columns(self, tmp_path):
+        path = str(tmp_path / 'music.db-sqlite')
+        shelf = storage.SQLiteShelf(path)
+        shelf['tracks-1'] = ({'__loc': 'file:///a', 'artist': ['a', 'b']}, 1, {})
+        shelf.close()
+
+        conn = sqlite3.connect(path)
+        assert conn.execute('SELECT loc, artist FROM tracks').fetchall() == [
+            ('file:///a', 'a / b')
+        ]
+        assert conn.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+
+
+class TestSQLiteStorage:
+    def test_save_and_load(self, tmp_path, test_tracks, sqlite_storage):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        db.add_tracks([tr])
+        db.save_to_location()
+        tr.set_tags(__playcount=3)
+        db.save_to_location()
+        assert not TrackDBJournal().exists(location)
+
+        loc = tr.get_loc_for_io()
+        del tr
+        Track._Track__tracksdict.clear()
+
+        db2 = TrackDB('test', location=location)
+        assert db2.get_track_by_loc(loc).get_tag_raw('__playcount') == 3
+
+    def test_backup_before_upgrade(self, tmp_path, test_tracks, sqlite_storage):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        db.add_tracks([Track(test_tracks.get('.mp3').filename)])
+        db.save_to_location()
+        shelf = storage.SQLiteShelf(storage.get_sqlite_path(location))
+        shelf['_dbversion'] = 1
+        shelf.close()
+
+        with patch('xl.migrations.database.handle_migration') as migrate:
+            TrackDB('test', location=location)
+        assert migrate.called
+        backup = sqlite3.connect(storage.get_sqlite_path(location) + '-1.bak')
+        assert backup.execute('SELECT COUNT(*) FROM tracks').fetchone() == (1,)
+        backup.close()
+
+    def test_migrate_from_shelf(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        db.add_tracks([tr])
+        db.save_to_location()
+        # this change is only in the journal
+        tr.set_tags(__playcount=3)
+        db.save_to_location()
+
+        loc = tr.get_loc_for_io()
+        del tr
+        Track._Track__tracksdict.clear()
+
+        settings.set_option('collection/storage', 'sqlite')
+        try:
+            db2 = TrackDB('test', location=location)
+        finally:
+            settings.set_option('collection/storage', 'shelf')
+        assert db2._storage.name == 'sqlite'
+        assert db2.get_track_by_loc(loc).get_tag_raw('__playcount') == 3
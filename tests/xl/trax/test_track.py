@@ -75,6 +75,28 @@ class Test_MetadataCacher:
         assert self.mc.remove('foo') is None
 
 
+class Test_TagValueCache:
+    def setup_method(self):
+        self.cache = track._TagValueCache(maxentries=2)
+        self.tracks = [
+            track.Track('/foo/cache%d.mp3' % i, scan=False) for i in range(3)
+        ]
+
+    def test_evicts_least_recently_used(self):
+        for tr in self.tracks[:2]:
+            self.cache.add(tr, ('title',), 'a')
+        assert self.cache.get(self.tracks[0], ('title',)) == 'a'
+        self.cache.add(self.tracks[2], ('title',), 'a')
+        assert self.cache.get(self.tracks[1], ('title',)) is None
+        assert self.cache.get(self.tracks[0], ('title',)) == 'a'
+        assert self.cache.get_stats()['size'] == 2
+
+    def test_tracks_are_not_kept_alive(self):
+        self.cache.add(self.tracks[0], ('title',), 'a')
+        del self.tracks[0]
+        assert self.cache.get_stats()['size'] == 0
+
+
 def random_str(l=8):
     return ''.join(random.choice(string.ascii_letters) for _ in range(l))
 
@@ -131,6 +153,45 @@ class TestTrack:
         tr2 = track.Track(_unpickles={'artist': ['my_artist'], '__loc': 'uri'})
         assert tr1 is tr2
 
+    def test_deferred_scans(self, test_tracks):
+        track.Track._defer_scans()
+        try:
+            tr1 = track.Track(test_tracks.get('.mp3').filename)
+            tr2 = track.Track(test_tracks.get('.ogg').filename)
+            assert tr1.get_tag_raw('title') is None
+            # the first TrackDB loaded with a track takes precedence
+            track.Track(
+                _unpickles={
+                    '__loc': tr1.get_loc_for_io(),
+                    'title': ['stored'],
+                    '__date_added': 5,
+                }
+            )
+            assert tr1.get_tag_raw('title') == ['stored']
+            assert tr1.get_tag_raw('__date_added') == 5
+            assert tr2.get_tag_raw('title') is None
+        finally:
+            track.Track._end_deferred_scans()
+        assert tr1.get_tag_raw('title') == ['stored']
+        assert tr2.get_tag_raw('title') is not None
+        # later tracks are read right away
+        tr3 = track.Track(test_tracks.get('.flac').filename)
+        assert tr3.get_tag_raw('title') is not None
+
+    def test_tag_values_are_shared(self):
+        tr1 = track.Track('/foo')
+        tr2 = track.Track('/bar')
+        tr1.set_tags(artist=['some' + ' artist'], genre=['a', 'b'])
+        tr2.set_tags(artist=['some' + ' artist'])
+        assert tr1.get_tag_raw('artist') == ['some artist']
+        assert tr1.get_tag_raw('artist')[0] is tr2.get_tag_raw('artist')[0]
+        assert tr1.get_tag_raw('genre') == ['a', 'b']
+        assert tr1.get_tag_sort('artist', join=False) == [
+            track.Track.format_sort('some artist')
+        ]
+        assert tr1.get_tag_display('artist', join=False) == ['some artist']
+        assert tr1._estimate_bytes_saved(set()) > 0
+
     def test_takes_nonurl(self, test_track):
         tr = track.Track(test_track.filename)
 
@@ -193,6 +254,43 @@ class TestTrack:
         # second, ensure that we can no longer read them
         assert not tr.read_tags()
 
+    def test_search_values_are_cached(self):
+        tr = track.Track('/foo/cached.mp3', scan=False)
+        tr.set_tag_raw('artist', ['Mötley Crüe', 'Foo'])
+        assert tr.get_tag_search_values('artist') == ('Motley Crue', 'Foo')
+        hits = track.Track.get_search_cache_stats()['hits']
+        assert tr.get_tag_search_values('artist', lower=True) == ('motley crue', 'foo')
+        assert tr.get_tag_search_values('artist') == ('Motley Crue', 'Foo')
+        assert track.Track.get_search_cache_stats()['hits'] == hits + 1
+
+        tr.set_tag_raw('artist', 'Bar')
+        assert tr.get_tag_search_values('artist') == ('Bar',)
+        assert tr.get_tag_search_values('album') == (None,)
+
+    def test_is_supported_does_not_open_file(self):
+        with patch('xl.metadata.get_format') as get_format:
+            assert track.Track('/foo/bar.mp3', scan=False).is_supported()
+            assert not track.Track('/foo/bar.txt', scan=False).is_supported()
+        assert not get_format.called
+
+    def test_read_tags_unmodified(self, test_track):
+        tr = track.Track(test_track.filename)
+        with patch('xl.metadata.get_format') as get_format:
+            assert tr.read_tags(force=False) is True
+        assert not get_format.called
+
+    def test_set_file_tags(self, test_track):
+        file_tags = track.read_file_tags(test_track.uri)
+        assert isinstance(file_tags, track.FileTags)
+        assert track.read_file_tags(test_track.uri, file_tags.tags['__modified'])
+
+        tr = track.Track(test_track.filename, scan=False)
+        tr.set_tags(title='stale', comment='stale')
+        tr.set_file_tags(file_tags)
+        assert tr.get_tag_raw('title') == file_tags.tags.get('title')
+        if file_tags.supported is not None and 'comment' in file_tags.supported:
+            assert tr.get_tag_raw('comment') == file_tags.tags.get('comment')
+
     def test_write_tags_no_perms(self, test_track_fp):
         if os.name != 'posix':
             pytest.skip("only works on POSIX")
@@ -472,6 +570,42 @@ class TestTrack:
         tr.set_tag_raw('coverart', val)
         assert tr.get_tag_sort('coverart') == ret
 
+    def test_get_sort_tag_cached(self):
+        tr = track.Track('/foo')
+        cuts = settings.get_option('collection/strip_list', [])
+        settings.set_option('collection/strip_list', [])
+        track.Track._the_cuts_cb(None, None, 'collection/strip_list')
+        try:
+            tr.set_tag_raw('artist', 'Foo Bar')
+            assert tr.get_tag_sort('artist') == 'foo bar foo bar Foo Bar Foo Bar'
+            tr.set_tag_raw('artist', 'Foo Baz')
+            assert tr.get_tag_sort('artist') == 'foo baz foo baz Foo Baz Foo Baz'
+
+            settings.set_option('collection/strip_list', ['foo'])
+            track.Track._the_cuts_cb(None, None, 'collection/strip_list')
+            assert tr.get_tag_sort('artist') == 'baz foo baz Foo Baz Foo Baz'
+        finally:
+            settings.set_option('collection/strip_list', cuts)
+            track.Track._the_cuts_cb(None, None, 'collection/strip_list')
+
+    def test_sort_cache_releases_tracks(self):
+        from xl.trax import TrackDB
+
+        tr = track.Track('/foo/sorted.mp3', scan=False)
+        tr._is_supported = True
+        tr.set_tag_raw('title', 'Foo')
+        db = TrackDB('test')
+        db.add_tracks([tr])
+        size = track._SORT_CACHE.get_stats()['size']
+        tr.get_tag_sort('title')
+        assert track._SORT_CACHE.get_stats()['size'] == size + 1
+        db.remove_tracks([tr])
+        assert track._SORT_CACHE.get_stats()['size'] == size
+
+        tr.get_tag_sort('title')
+        del tr
+        assert track._SORT_CACHE.get_stats()['size'] == size
+
     ## Display Tags
     def test_get_display_tag_loc(self):
         import sys
@@ -0,0 +1,305 @@
+import os
+import time
+from unittest.mock import patch
+
+from xl import settings
+from xl.trax import Track, TrackDB, fuzzy, snapshot
+from xl.trax.journal import TrackDBJournal, apply_records
+
+
+class TestTrackDBJournal:
+    def test_pending_changes(self):
+        journal = TrackDBJournal()
+        journal.record_added(1, 'file:///a')
+        journal.record_changed(2, 'file:///b')
+        journal.record_deleted(1)
+        assert journal.take_pending() == {1: None, 2: 'file:///b'}
+        assert len(journal) == 0
+
+    def test_restore_pending_keeps_newer_changes(self):
+        journal = TrackDBJournal()
+        journal.record_changed(1, 'file:///a')
+        pending = journal.take_pending()
+        journal.record_deleted(1)
+        journal.record_changed(2, 'file:///b')
+        journal.restore_pending(pending)
+        assert journal.take_pending() == {1: None, 2: 'file:///b'}
+
+    def test_replay(self, tmp_path):
+        location = str(tmp_path / 'music.db')
+        journal = TrackDBJournal()
+        journal.append(
+            location,
+            [TrackDBJournal.set_record('a', 1), TrackDBJournal.set_record('b', 2)],
+        )
+        journal.append(location, [TrackDBJournal.delete_record('a')])
+        assert journal.record_count == 3
+
+        pdata = {'a': 0, 'c': 3}
+        assert apply_records(pdata, journal.replay(location)) == 3
+        assert pdata == {'b': 2, 'c': 3}
+
+    def test_truncated_batch_is_ignored(self, tmp_path):
+        location = str(tmp_path / 'music.db')
+        journal = TrackDBJournal()
+        journal.append(location, [TrackDBJournal.set_record('a', 1)])
+        journal.append(location, [TrackDBJournal.set_record('b', 2)])
+        path = TrackDBJournal.get_path(location)
+        os.truncate(path, os.path.getsize(path) - 3)
+        assert list(journal.replay(location)) == [TrackDBJournal.set_record('a', 1)]
+
+    def test_compact(self, tmp_path):
+        location = str(tmp_path / 'music.db')
+        journal = TrackDBJournal()
+        journal.append(location, [TrackDBJournal.set_record('a', 1)])
+
+        class Shelf(dict):
+            def sync(self):
+                pass
+
+        pdata = Shelf()
+        journal.compact(location, pdata)
+        assert pdata == {'a': 1}
+        assert journal.record_count == 0
+        assert not os.path.exists(TrackDBJournal.get_path(location))
+
+
+class TestTrackDBSave:
+    def test_save_appends_changes_to_journal(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        db.add_tracks([tr])
+        db.save_to_location()
+
+        tr.set_tags(__playcount=3)
+        assert len(db._journal) == 1
+        db.save_to_location()
+        assert len(db._journal) == 0
+        assert db._journal.record_count == 1
+
+        loc = tr.get_loc_for_io()
+        del tr
+        Track._Track__tracksdict.clear()
+
+        db2 = TrackDB('test', location=location)
+        assert db2.get_track_by_loc(loc).get_tag_raw('__playcount') == 3
+        # the journal was replayed on top of the snapshot
+        assert db2._journal.record_count == 1
+
+    def test_removed_tracks_stay_removed(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        db.add_tracks([tr])
+        db.save_to_location()
+        db.remove_tracks([tr])
+        db.save_to_location()
+
+        Track._Track__tracksdict.clear()
+        db2 = TrackDB('test', location=location)
+        assert len(db2) == 0
+
+    def test_background_save(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        db.add_tracks([tr])
+        db.save_to_location(background=True)
+        # changes made while the save is written go into the next one
+        tr.set_tags(__playcount=3)
+        assert len(db._journal) == 1
+        db._writer.flush()
+        assert db.get_save_stats().count == 1
+
+        db.save_to_location()
+        stats = db.get_save_stats()
+        assert stats.count == 2
+        assert stats.total >= stats.longest >= stats.last > 0
+
+    def test_blocking_save_waits_for_earlier_writes(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        db.add_tracks([Track(test_tracks.get('.mp3').filename)])
+        db.save_to_location()
+
+        written = []
+        db._writer.submit(lambda: time.sleep(0.1) or written.append(True))
+        # nothing changed, but the earlier write must be done
+        db.save_to_location()
+        assert written
+
+
+class TestTrackDBSnapshot:
+    def test_roundtrip(self, tmp_path):
+        location = str(tmp_path / 'music.db')
+        tags = {'__loc': 'file:///a', 'title': ['a']}
+        snapshot.write_snapshot(
+            location,
+            3,
+            {'name': 'test'},
+            [('file:///a', snapshot.pack_tags(tags), 7, {})],
+        )
+        content = snapshot.read_snapshot(location, 3)
+        assert content['name'] == 'test'
+        packed, key, attrs = content['tracks-7']
+        assert (packed.loc, packed.unpack(), key, attrs) == ('file:///a', tags, 7, {})
+
+    def test_stale_snapshot_is_ignored(self, tmp_path):
+        location = str(tmp_path / 'music.db')
+        assert snapshot.read_snapshot(location, 0) is None
+        snapshot.write_snapshot(location, 3, {}, [])
+        assert snapshot.read_snapshot(location, 4) is None
+
+    def test_load_from_snapshot(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        db.add_tracks([tr])
+        db.save_to_location()
+        assert os.path.exists(snapshot.get_path(location))
+
+        loc = tr.get_loc_for_io()
+        title = tr.get_tag_raw('title')
+        del tr
+        Track._Track__tracksdict.clear()
+
+        db2 = TrackDB('test', location=location)
+        assert db2.get_track_by_loc(loc).get_tag_raw('title') == title
+
+    def test_missing_snapshot_is_rebuilt(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        db.add_tracks([Track(test_tracks.get('.mp3').filename)])
+        db.save_to_location()
+        snapshot.delete_snapshot(location)
+
+        db2 = TrackDB('test', location=location)
+        assert len(db2) == 1
+        db2.save_to_location()
+        assert os.path.exists(snapshot.get_path(location))
+
+    def test_lazy_load(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        tr.set_tags(title='foo')
+        db.add_tracks([tr])
+        db.save_to_location()
+
+        loc = tr.get_loc_for_io()
+        del tr
+        Track._Track__tracksdict.clear()
+
+        settings.set_option('collection/lazy_load', True)
+        try:
+            db2 = TrackDB('test', location=location)
+        finally:
+            settings.set_option('collection/lazy_load', False)
+        tr = db2.get_track_by_loc(loc)
+        assert tr._Track__packed is not None
+        assert tr.get_tag_raw('title') == ['foo']
+        assert tr._Track__packed is None
+
+
+class TestTrackDBTrigrams:
+    def test_trigrams_are_saved(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        tr.set_tags(artist='The Beatles')
+        db.add_tracks([tr])
+        assert db.get_search_index().find_similar('artist', 'beatels')
+        db.save_to_location()
+        assert 'The Beatles' in fuzzy.read_trigrams(location)['artist']
+
+        loc = tr.get_loc_for_io()
+        del tr
+        Track._Track__tracksdict.clear()
+
+        db2 = TrackDB('test', location=location)
+        index = db2.get_search_index()
+        assert index.find_similar('artist', 'beatels')[0][0].get_loc_for_io() == loc
+        # nothing changed, so there is nothing to save
+        assert index.take_trigram_data() is None
+
+    def test_trigrams_are_not_exported(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tr = Track(test_tracks.get('.mp3').filename)
+        tr.set_tags(artist='The Beatles')
+        db.add_tracks([tr])
+        db.get_search_index()
+        export = str(tmp_path / 'export.db')
+        db.save_to_location(export)
+        assert not os.path.exists(fuzzy.get_path(export))
+
+
+class TestTrackDBLoad:
+    def test_load_in_batches(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        tracks = [Track(test_tracks.get(ext).filename) for ext in ('.mp3', '.ogg')]
+        db.add_tracks(tracks)
+        db.save_to_location()
+        del tracks
+        Track._Track__tracksdict.clear()
+
+        db2 = TrackDB('test')
+        loader = db2._load_from_location(location, batch_size=1)
+        assert next(loader) == 0.5
+        assert len(db2) == 1
+        assert list(loader) == [1.0]
+        assert len(db2) == 2
+        assert db2._key == 2
+
+    def test_tracks_added_while_loading(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        filenames = [test_tracks.get(ext).filename for ext in ('.mp3', '.ogg')]
+        tracks = [Track(filename) for filename in filenames]
+        for tr in tracks:
+            tr.set_tags(__date_added=1000, __playcount=3)
+        db.add_tracks(tracks)
+        keys = {
+            tr.get_loc_for_io(): db.tracks[tr.get_loc_for_io()]._key for tr in tracks
+        }
+        db.save_to_location()
+        del tracks, tr
+        Track._Track__tracksdict.clear()
+
+        db2 = TrackDB('test')
+        db2.location = location
+        loader = db2._load_from_location(location, batch_size=1)
+        next(loader)
+        # added by a rescan before its stored record is loaded
+        added = [
+            tr for tr in map(Track, filenames) if tr.get_loc_for_io() not in db2.tracks
+        ]
+        assert len(added) == 1
+        db2.add_tracks(added)
+        assert list(loader) == [1.0]
+        loc = added[0].get_loc_for_io()
+        assert db2.tracks[loc]._key == keys[loc]
+        assert added[0].get_tag_raw('__date_added') == 1000
+        assert added[0].get_tag_raw('__playcount') == 3
+        db2.save_to_location()
+        del added
+        Track._Track__tracksdict.clear()
+
+        with patch('xl.trax.trackdb.logger.warning') as warning:
+            db3 = TrackDB('test', location=location)
+        assert len(db3) == 2
+        warning.assert_not_called()
+
+    def test_minor_version_can_be_written(self, tmp_path, test_tracks):
+        location = str(tmp_path / 'music.db')
+        db = TrackDB('test', location=location)
+        db.add_tracks([Track(test_tracks.get('.mp3').filename)])
+        db.save_to_location()
+        pdata = db._open_for_writing(location)
+        pdata['_dbversion'] = db._dbversion + 0.1
+        pdata.close()
+        # accepted when saving, as when loading
+        db._open_for_writing(location).close()
+        assert db._is_newer_version(db._dbversion + 1)
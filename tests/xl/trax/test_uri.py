@@ -0,0 +1,79 @@
+import pytest
+
+from gi.repository import Gio
+
+from xl.trax import uri
+
+
+@pytest.mark.parametrize(
+    'loc',
+    [
+        'file:///music/a.mp3',
+        'file:///music/Artist%20Name/%C3%A9t%C3%A9.ogg',
+        "file:///music/(live)/a,b+c=d&e'f~.flac",
+    ],
+)
+def test_canonical_file_uri(loc):
+    assert uri.is_canonical_file_uri(loc)
+
+
+@pytest.mark.parametrize(
+    'loc',
+    [
+        'file:///music/a b.mp3',
+        'file:///music/%41.mp3',
+        'file:///music/a%2Fb.mp3',
+        'file:///music/%c3%a9.mp3',
+        'file:///music/./a.mp3',
+        'file:///music/../a.mp3',
+        'file:///music/',
+        'file://host/music/a.mp3',
+        'http://example.com/a.mp3',
+        '/music/a.mp3',
+    ],
+)
+def test_not_canonical_file_uri(loc):
+    assert not uri.is_canonical_file_uri(loc)
+
+
+@pytest.mark.parametrize(
+    'loc',
+    [
+        'file:///music/a;b.mp3',
+        'file:///music/a%3Bb.mp3',
+        'file:///music/a%3bb.mp3',
+        'file:///music/a%3A%40b.mp3',
+        "file:///music/(live)/a,b+c=d&e'f~.flac",
+        'file:///music/a%25b%23c%3F.mp3',
+        'file:///music/a[1].mp3',
+        'file:///music/a%5B1%5D.mp3',
+    ],
+)
+def test_fast_path_matches_gio(loc):
+    uri.clear_cache()
+    if uri.is_canonical_file_uri(loc):
+        assert Gio.File.new_for_uri(loc).get_uri() == loc
+    assert uri.canonicalize(loc) == Gio.File.new_for_uri(loc).get_uri()
+
+
+def test_uri_to_path():
+    loc = 'file:///music/Artist%20Name/%C3%A9t%C3%A9.ogg'
+    assert uri.uri_to_path(loc) == '/music/Artist Name/été.ogg'
+
+
+def test_canonical_uris_skip_cache():
+    uri.clear_cache()
+    loc = 'file:///music/a.mp3'
+    assert uri.canonicalize(loc) == loc
+    assert uri.canonicalize_arg(loc) == loc
+    assert uri.get_stats() == {'fast': 2, 'hits': 0, 'misses': 0, 'cached': 0}
+
+
+def test_cache(monkeypatch):
+    uri.clear_cache()
+    monkeypatch.setattr(uri, 'CACHE_SIZE', 2)
+    for loc in ('http://a/1', 'http://a/2', 'http://a/1', 'http://a/3'):
+        uri.canonicalize(loc)
+    stats = uri.get_stats()
+    assert (stats['hits'], stats['misses'], stats['cached']) == (1, 3, 2)
+    uri.clear_cache()
@@ -1,8 +1,11 @@
 from unittest.mock import patch
 
+import pytest
+
 from gi.repository import Gio
 
 import xl.collection
+import xl.trax
 import xl.trax.search
 import xl.trax.track
 import xl.trax.util
@@ -81,3 +84,73 @@ class TestSortResultTracks:
         assert xl.trax.util.sort_result_tracks(self.fields, self.tracks, True) == list(
             reversed(self.result)
         )
+
+
+class TestTopTracks:
+    def setup_method(self):
+        self.tracks = [
+            xl.trax.track.Track(url) for url in ('/tmp/foo', '/tmp/bar', '/tmp/baz')
+        ]
+        for track, val in zip(self.tracks, 'aab'):
+            track.set_tag_raw('artist', val)
+        for track, val in zip(self.tracks, '212'):
+            track.set_tag_raw('discnumber', val)
+        self.fields = ('artist', 'discnumber')
+
+    @pytest.mark.parametrize("count", [0, 1, 2, 5])
+    @pytest.mark.parametrize("reverse", [False, True])
+    def test_same_as_sorting(self, count, reverse):
+        expected = xl.trax.util.sort_tracks(self.fields, self.tracks, reverse=reverse)
+        assert (
+            xl.trax.util.top_tracks(self.fields, self.tracks, count, reverse=reverse)
+            == expected[:count]
+        )
+
+
+class TestSearchTopTracks:
+    def setup_method(self):
+        self.db = xl.trax.TrackDB('test')
+        self.tracks = [
+            xl.trax.track.Track('/top/%d.mp3' % i, scan=False) for i in range(20)
+        ]
+        for i, track in enumerate(self.tracks):
+            track.set_tag_raw('__playcount', i % 7 + 1)
+            track.set_tag_raw('artist', 'ab'[i % 2])
+            track.set_tag_raw('title', str(i))
+        self.db.add_tracks(self.tracks)
+        self.matcher = xl.trax.search.TracksMatcher('artist==a')
+
+    @pytest.mark.parametrize("count", [1, 3, 4, 10, 30])
+    @pytest.mark.parametrize("reverse", [False, True])
+    @pytest.mark.parametrize("field", ['__playcount', 'title'])
+    def test_same_as_sorting(self, count, reverse, field):
+        fields = [field, 'title']
+        found = [
+            srtr.track
+            for srtr in xl.trax.search.search_tracks(self.tracks, [self.matcher])
+        ]
+        expected = xl.trax.util.sort_tracks(fields, found, reverse=reverse)[:count]
+        assert (
+            xl.trax.util.search_top_tracks(
+                self.db, [self.matcher], fields, count, reverse=reverse
+            )
+            == expected
+        )
+
+    def test_stops_early(self):
+        index = self.db.get_search_index()
+        seen = []
+        find_value = index.find_value
+
+        def record(tag, value):
+            tracks = find_value(tag, value)
+            seen.extend(tracks)
+            return tracks
+
+        with patch.object(index, 'find_value', record):
+            top = xl.trax.util.search_top_tracks(
+                self.db, [self.matcher], ['__playcount', 'title'], 2, reverse=True
+            )
+        assert [tr.get_tag_raw('__playcount') for tr in top] == [7, 6]
+        # only the tracks played 7, 6 and 5 times were looked at
+        assert len(seen) == 8
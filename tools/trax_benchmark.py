@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+#
+# Microbenchmarks for xl.trax. Run from the top of the source tree:
+#
+#   python3 tools/trax_benchmark.py tracks --count 50000
+#   python3 tools/trax_benchmark.py db --count 50000
+#   python3 tools/trax_benchmark.py sort --count 50000
+#
+
+import argparse
+import os.path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gi.repository import Gio  # noqa: E402
+
+from xl import common  # noqa: E402
+from xl.trax import Track, TrackDB, sort_tracks, track, uri  # noqa: E402
+
+
+def make_uris(count):
+    """
+    URIs as they appear in a collection: mostly canonical, with a few
+    that have to be escaped by Gio
+    """
+    uris = []
+    for i in range(count):
+        if i % 10 == 0:
+            uris.append('file:///music/Artist %d/Album/%02d - Song.mp3' % (i, i % 20))
+        else:
+            uris.append('file:///music/Artist%%20%d/Album/%02d.mp3' % (i, i % 20))
+    return uris
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print('%-28s %8.3fs' % (label, time.perf_counter() - start))
+    return result
+
+
+def bench_tracks(args):
+    uris = make_uris(args.count)
+
+    def gio_only():
+        for loc in uris:
+            Gio.File.new_for_uri(loc).get_uri()
+
+    def db_load():
+        # what TrackDB.load_from_location does for every track
+        return [Track(_unpickles={'__loc': loc}) for loc in uris]
+
+    def playlist_import():
+        # what playlist importers do for every entry
+        return [Track(loc, scan=False) for loc in uris]
+
+    print('%d tracks' % len(uris))
+    timed('Gio canonicalization', gio_only)
+    for label, func in (('db load', db_load), ('playlist import', playlist_import)):
+        uri.clear_cache()
+        tracks = timed(label, func)
+        print('  %s' % uri.get_stats())
+        del tracks
+
+
+def make_tracks(count):
+    tracks = []
+    for i, loc in enumerate(make_uris(count)):
+        tr = Track(loc, scan=False)
+        # the files don't exist
+        tr._is_supported = True
+        tr.set_tags(
+            title='Song %d' % i,
+            artist='Artist %d' % (i // 100),
+            album='Album %d' % (i // 10),
+            genre=['Rock', 'Pop'][i % 2],
+            tracknumber='%d/10' % (i % 10 + 1),
+            date='19%02d' % (i % 100),
+            __length=180.0 + i % 120,
+            __playcount=i % 7 + 1,
+        )
+        tracks.append(tr)
+    return tracks
+
+
+def bench_db(args):
+    tracks = make_tracks(args.count)
+    db = TrackDB('benchmark')
+    db.add_tracks(tracks)
+    print('%d tracks' % len(tracks))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        location = os.path.join(tmpdir, 'music.db')
+        timed('serialize tracks', lambda: [tr._pickles() for tr in tracks])
+        timed('full save', db._save_full, location)
+        for tr in tracks:
+            tr.set_tags(__playcount=tr.get_tag_raw('__playcount') + 1)
+        timed('save all changes', db.save_to_location, location)
+
+        del db, tracks
+        Track._Track__tracksdict.clear()
+        timed('load', TrackDB, 'benchmark', location)
+
+
+def bench_sort(args):
+    tracks = make_tracks(args.count)
+    print('%d tracks' % len(tracks))
+
+    def sort_all():
+        for fields in (common.BASE_SORT_TAGS, ('__playcount',) + common.BASE_SORT_TAGS):
+            sort_tracks(fields, tracks, artist_compilations=True)
+
+    track._SORT_CACHE.clear()
+    timed('sort (cold cache)', sort_all)
+    timed('sort (warm cache)', sort_all)
+    print('  %s' % track._SORT_CACHE.get_stats())
+    track._SORT_CACHE.maxentries = 0
+    track._SORT_CACHE.clear()
+    timed('sort (no cache)', sort_all)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    tracks = subparsers.add_parser('tracks', help='bulk creation of Track objects')
+    tracks.add_argument('--count', type=int, default=20000)
+    tracks.set_defaults(func=bench_tracks)
+
+    db = subparsers.add_parser('db', help='saving and loading a TrackDB')
+    db.add_argument('--count', type=int, default=20000)
+    db.set_defaults(func=bench_db)
+
+    sort = subparsers.add_parser('sort', help='sorting tracks by tags')
+    sort.add_argument('--count', type=int, default=20000)
+    sort.set_defaults(func=bench_sort)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -34,10 +34,26 @@ A library finds tracks in a specified directory and adds them to an associated
 collection.
 """
 
-from collections import deque
+from collections import Counter, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 import logging
+import multiprocessing
+import os
+import pickle
 import threading
-from typing import Deque, Dict, Iterable, List, MutableSequence, Optional, Set, Tuple
+import time
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    MutableSequence,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from gi.repository import (
     GLib,
@@ -45,12 +61,26 @@ from gi.repository import (
     Gio,
 )
 
-from xl import common, event, settings, trax
+from xl import common, event, metadata, settings, trax
+from xl.trax.trackdb import TrackDBIterator
 
 logger = logging.getLogger(__name__)
 
 COLLECTIONS: Set['Collection'] = set()
 
+#: Number of tracks added at a time when loading a collection in the background
+LOAD_BATCH_SIZE = 2000
+
+#: Number of files being read per worker while scanning, see _TagReader
+SCAN_QUEUE_SIZE = 16
+
+#: Suffix of the file next to a collection database, which caches the
+#: directories of its libraries, see Library.rescan
+DIRECTORIES_SUFFIX = '-directories'
+
+#: Version of the format of the directory cache, see _write_directories
+DIRECTORIES_VERSION = 1
+
 
 def get_collection_by_loc(loc: str) -> Optional['Collection']:
     """
@@ -130,7 +160,13 @@ class Collection(trax.TrackDB):
     5
     """
 
-    def __init__(self, name, location=None, pickle_attrs=[]):
+    def __init__(self, name, location=None, pickle_attrs=[], background=False):
+        """
+        :param background: if True, the tracks are loaded from location
+            on a separate thread. Tracks show up in the collection while
+            they are loaded, and a "collection_loaded" event is sent when
+            done; see also is_loaded and wait_loaded.
+        """
         global COLLECTIONS
         self.libraries: Dict[str, Library] = {}
         self._scanning = False
@@ -139,10 +175,170 @@ class Collection(trax.TrackDB):
         self._running_total_count = 0
         self._frozen = False
         self._libraries_dirty = False
-        pickle_attrs += ['_serial_libraries']
-        trax.TrackDB.__init__(self, name, location=location, pickle_attrs=pickle_attrs)
+        self._directory_caches: Optional[Dict[str, '_DirectoryCache']] = None
+        self._directories_dirty = False
+        self._directories_lock = threading.Lock()
+        pickle_attrs = pickle_attrs + ['_serial_libraries']
+        self._loaded = threading.Event()
+        # location of a save requested on the main thread while loading,
+        # which is done once loaded; see save_to_location
+        self.__pending_save: Optional[Tuple[Optional[str]]] = None
+        # arguments of a rescan requested on the main thread while
+        # loading, which is done once loaded; see rescan_libraries
+        self.__pending_rescan: Optional[Tuple[bool, bool]] = None
+        if background and location:
+            trax.TrackDB.__init__(self, name, pickle_attrs=pickle_attrs)
+            self.location = location
+            # fail early, as loading in the foreground would
+            self._open_for_writing(location).close()
+            # tracks created meanwhile, by playlists for example, take
+            # their tags from the collection rather than from their file
+            trax.Track._defer_scans()
+            self.__load()
+            self._timeout_save()
+        else:
+            trax.TrackDB.__init__(
+                self, name, location=location, pickle_attrs=pickle_attrs
+            )
+            self._loaded.set()
         COLLECTIONS.add(self)
 
+    def __iter__(self):
+        if self._loaded.is_set():
+            return trax.TrackDB.__iter__(self)
+        # tracks are still being added by the loader thread
+        return TrackDBIterator(iter(list(self.tracks.items())))
+
+    @common.threaded
+    def __load(self):
+        """
+        Loads the tracks on a separate thread, a batch at a time
+        """
+        loader = self._load_from_location(batch_size=LOAD_BATCH_SIZE)
+        try:
+            while True:
+                progress = self.__load_next(loader)
+                if progress is None:
+                    break
+                event.log_event('collection_load_progress', self, progress)
+        except Exception:
+            logger.exception("Exception occurred while loading %s", self.location)
+        finally:
+            self._loaded.set()
+            trax.Track._end_deferred_scans()
+        logger.info("Loaded %d tracks into %s", len(self.tracks), self.name)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Compact tag storage saves about %d bytes",
+                self.estimate_tag_bytes_saved(),
+            )
+        pending_save, self.__pending_save = self.__pending_save, None
+        if pending_save is not None:
+            self.save_to_location(pending_save[0])
+        event.log_event('collection_loaded', self, None)
+        pending_rescan, self.__pending_rescan = self.__pending_rescan, None
+        if pending_rescan is not None and not self._scanning:
+            self.rescan_libraries(*pending_rescan)
+
+    @common.synchronized
+    def __load_next(self, loader):
+        return next(loader, None)
+
+    def is_loaded(self) -> bool:
+        """
+        Returns whether all tracks have been loaded. Until then, the
+        collection only contains some of its tracks.
+        """
+        return self._loaded.is_set()
+
+    def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until all tracks have been loaded
+
+        :param timeout: maximum time to wait, in seconds
+        :returns: whether all tracks have been loaded
+        """
+        return self._loaded.wait(timeout)
+
+    def _wait_loaded_off_main(self) -> bool:
+        """
+        Like wait_loaded, but doesn't wait on the main thread, which
+        would freeze the UI until all tracks are loaded
+
+        :returns: whether all tracks have been loaded
+        """
+        if self.is_loaded():
+            return True
+        if threading.current_thread() is threading.main_thread():
+            return False
+        return self.wait_loaded()
+
+    def save_to_location(self, location=None, background=False):
+        # don't save a partially loaded collection; saves that must not
+        # be skipped are done by the loader thread once it is done
+        if not self.is_loaded():
+            if background:
+                return
+            if not self._wait_loaded_off_main():
+                logger.debug("Saving %s once it is loaded", self.name)
+                self.__pending_save = (location,)
+                if not self.is_loaded():
+                    return
+                # the loader finished in the meantime
+                self.__pending_save = None
+        trax.TrackDB.save_to_location(self, location, background)
+
+        with self._directories_lock:
+            if not self._directories_dirty:
+                return
+            self._directories_dirty = False
+            caches = dict(self._directory_caches)
+        location = location or self.location
+        # written after the tracks, which the caches describe
+        written = self._writer.submit(
+            lambda: self.__write_directories(location, caches)
+        )
+        if not background:
+            written.wait()
+
+    def __write_directories(
+        self, location: str, caches: Dict[str, '_DirectoryCache']
+    ) -> None:
+        try:
+            _write_directories(location, caches)
+        except Exception:
+            logger.exception("Failed to write directory cache of %s", self.name)
+
+    def _get_directory_cache(self, libloc: str) -> Optional['_DirectoryCache']:
+        """
+        :returns: the directories of the library at libloc as of its last
+            scan, see Library.rescan
+        """
+        with self._directories_lock:
+            if self._directory_caches is None:
+                location = self._saved_location or self.location
+                if location:
+                    self._directory_caches = _read_directories(location)
+                else:
+                    self._directory_caches = {}
+            return self._directory_caches.get(libloc)
+
+    def _set_directory_cache(
+        self, libloc: str, cache: Optional['_DirectoryCache']
+    ) -> None:
+        """
+        Replaces the directories of the library at libloc, which are
+        saved with the collection
+        """
+        self._get_directory_cache(libloc)
+        with self._directories_lock:
+            if cache is None:
+                if self._directory_caches.pop(libloc, None) is None:
+                    return
+            else:
+                self._directory_caches[libloc] = cache
+            self._directories_dirty = True
+
     def freeze_libraries(self) -> None:
         """
         Prevents "libraries_modified" events from being sent from individual
@@ -205,6 +401,7 @@ class Collection(trax.TrackDB):
             if tr.startswith(location):
                 to_rem.append(self.tracks[tr]._track)
         self.remove_tracks(to_rem)
+        self._set_directory_cache(library.location, None)
 
         self.serialize_libraries()
         self._dirty = True
@@ -233,6 +430,15 @@ class Collection(trax.TrackDB):
         """
         if self._scanning:
             raise Exception("Collection is already being scanned")
+        if not self._wait_loaded_off_main():
+            # scanning a partially loaded collection would add the tracks
+            # that are not loaded yet; the loader thread scans it instead
+            logger.info("Scanning %s once it is loaded", self.name)
+            self.__pending_rescan = (startup_only, force_update)
+            if not self.is_loaded():
+                return
+            # the loader finished in the meantime
+            self.__pending_rescan = None
         if len(self.libraries) == 0:
             event.log_event('scan_progress_update', self, 100)
             return  # no libraries, no need to scan :)
@@ -242,7 +448,7 @@ class Collection(trax.TrackDB):
 
         self.file_count = -1  # negative means we dont know it yet
 
-        self.__count_files()
+        self.__count_files(startup_only)
 
         scan_interval = 20
 
@@ -255,7 +461,11 @@ class Collection(trax.TrackDB):
                 continue
 
             event.add_callback(self._progress_update, 'tracks_scanned', library)
-            library.rescan(notify_interval=scan_interval, force_update=force_update)
+            library.rescan(
+                notify_interval=scan_interval,
+                force_update=force_update,
+                quick=startup_only,
+            )
             event.remove_callback(self._progress_update, 'tracks_scanned', library)
             self._running_total_count += self._running_count
             if self._scan_stopped:
@@ -275,13 +485,13 @@ class Collection(trax.TrackDB):
         self.file_count = -1
 
     @common.threaded
-    def __count_files(self):
+    def __count_files(self, quick=False):
         file_count = 0
         for library in self.libraries.values():
             if self._scan_stopped:
                 self._scanning = False
                 return
-            file_count += library._count_files()
+            file_count += library._count_files(quick)
         self.file_count = file_count
         logger.debug("File count: %s", self.file_count)
 
@@ -519,6 +729,149 @@ class LibraryMonitor(GObject.GObject):
                 self.emit('location-removed', directory)
 
 
+class _Directory(NamedTuple):
+    """
+    A directory of a library, as of its last scan
+    """
+
+    #: modification time, in seconds and microseconds
+    mtime: Tuple[int, int]
+    #: number of files in it
+    files: int
+    #: number of tracks of the collection in it
+    tracks: int
+    #: names of its subdirectories
+    subdirs: Tuple[str, ...]
+
+
+class _DirectoryCache(NamedTuple):
+    """
+    The directories of a library, see Library.rescan
+    """
+
+    #: time of the last scan that listed every directory
+    verified: float
+    #: the _Directory at each location
+    directories: Dict[str, _Directory]
+
+
+def _get_directory_mtime(gloc: Gio.File) -> Optional[Tuple[int, int]]:
+    try:
+        mtime = gloc.query_info(
+            "time::modified,time::modified-usec", Gio.FileQueryInfoFlags.NONE, None
+        ).get_modification_date_time()
+    except GLib.Error:
+        return None
+    if mtime is None:
+        return None
+    return mtime.to_unix(), mtime.get_microsecond()
+
+
+def _write_directories(location: str, caches: Dict[str, _DirectoryCache]) -> None:
+    """
+    Writes the directory cache of each library of the collection
+    database at location
+    """
+    libraries = {
+        libloc: (
+            cache.verified,
+            {loc: tuple(directory) for loc, directory in cache.directories.items()},
+        )
+        for libloc, cache in caches.items()
+    }
+    data = {'version': DIRECTORIES_VERSION, 'libraries': libraries}
+    path = location + DIRECTORIES_SUFFIX
+    new_path = path + '.new'
+    with open(new_path, 'wb') as fp:
+        pickle.dump(data, fp, pickle.HIGHEST_PROTOCOL)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(new_path, path)
+    logger.debug("Wrote directory cache to %s", path)
+
+
+def _read_directories(location: str) -> Dict[str, _DirectoryCache]:
+    """
+    Reads the directory cache of each library of the collection database
+    at location
+
+    :returns: the cache of each library, empty if there is none
+    """
+    path = location + DIRECTORIES_SUFFIX
+    try:
+        with open(path, 'rb') as fp:
+            data = pickle.loads(fp.read())
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        logger.warning("Could not read directory cache %s", path, exc_info=True)
+        return {}
+
+    try:
+        if data['version'] != DIRECTORIES_VERSION:
+            logger.debug("Ignoring directory cache %s with old format", path)
+            return {}
+        return {
+            libloc: _DirectoryCache(
+                verified,
+                {
+                    loc: _Directory._make(directory)
+                    for loc, directory in directories.items()
+                },
+            )
+            for libloc, (verified, directories) in data['libraries'].items()
+        }
+    except Exception:
+        logger.warning("Invalid directory cache %s", path, exc_info=True)
+        return {}
+
+
+class _TagReader:
+    """
+    Reads the tags of files for :meth:`Library.rescan`, on a pool of
+    worker threads or processes, which only return the tags read (see
+    :func:`xl.trax.read_file_tags`) so that the collection is only
+    changed by the scanning thread.
+
+    The number of workers is set by the ``collection/scan_workers``
+    option; with a single worker, files are read as they are submitted.
+    Worker processes are used instead of threads if the
+    ``collection/scan_processes`` option is enabled, which parses files
+    faster but costs more memory.
+    """
+
+    def __init__(self):
+        self.workers = max(1, settings.get_option('collection/scan_workers', 4))
+        self._executor: Optional[Executor] = None
+        if self.workers > 1:
+            if settings.get_option('collection/scan_processes', False):
+                # forking would copy the threads and GLib state of this
+                # process, workers are started afresh instead
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix='tag-reader'
+                )
+
+    def submit(self, loc: str, modified: float) -> 'Future[Union[bool, trax.FileTags]]':
+        if self._executor is not None:
+            return self._executor.submit(trax.read_file_tags, loc, modified)
+        future = Future()
+        future.set_result(trax.read_file_tags(loc, modified))
+        return future
+
+    def shutdown(self) -> None:
+        """
+        Stops the workers once they are done with the files they are
+        reading; cancel the other files first
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
 class Library:
     """
     Scans and watches a folder for tracks, and adds them to
@@ -622,10 +975,13 @@ class Library:
             self.scan_id = None
 
         if interval:
-            self.scan_id = GLib.timeout_add_seconds(interval, self.rescan)
+            self.scan_id = GLib.timeout_add_seconds(interval, self.__scheduled_rescan)
 
         self.scan_interval = interval
 
+    def __scheduled_rescan(self) -> bool:
+        return self.rescan(quick=True)
+
     def get_startup_scan(self) -> bool:
         return self._startup_scan
 
@@ -636,10 +992,20 @@ class Library:
 
     startup_scan = property(get_startup_scan, set_startup_scan)
 
-    def _count_files(self) -> int:
+    def _count_files(self, quick: bool = False) -> int:
         """
         Counts the number of files present in this directory
+
+        :param quick: count the files found by the last scan instead, if
+            this library was scanned before
         """
+        if quick and self.collection:
+            cache = self.collection._get_directory_cache(self.location)
+            if cache is not None:
+                return sum(
+                    1 + directory.files for directory in cache.directories.values()
+                )
+
         count = 0
         for file in common.walk(Gio.File.new_for_uri(self.location)):
             if self.collection:
@@ -741,13 +1107,182 @@ class Library:
 
         return tr
 
+    def __read_file(
+        self, reader: _TagReader, gloc: Gio.File, force_update: bool
+    ) -> Tuple[str, Optional[trax.Track], Optional[Future]]:
+        """
+        Starts reading the tags of a file found by rescan, unless it is
+        not supported
+        """
+        uri = gloc.get_uri()
+        if not uri:  # we get segfaults if this check is removed
+            return uri, None, None
+        tr = self.collection.get_track_by_loc(uri)
+        if tr is not None:
+            if not tr.is_supported():
+                tr._scan_valid = False
+                return uri, tr, None
+            modified = 0 if force_update else tr.get_tag_raw('__modified') or 0
+            return uri, tr, reader.submit(uri, modified)
+        if not metadata.is_supported(uri):
+            return uri, None, None
+        return uri, None, reader.submit(uri, 0)
+
+    def __add_files(
+        self,
+        files: List[Tuple[str, Optional[trax.Track], Optional[Future]]],
+        count: int,
+        notify_interval: Optional[int],
+    ) -> int:
+        """
+        Adds the tracks of a directory read by rescan to the collection
+
+        :returns: the number of files scanned so far
+        """
+        added = []
+        dirtracks = []
+        for uri, tr, future in files:
+            if future is None:
+                continue
+            file_tags = future.result()
+            if tr is None:
+                if not isinstance(file_tags, trax.FileTags):
+                    continue
+                tr = trax.Track(uri, scan=False)
+                # the track may already exist outside of the collection
+                tr.set_file_tags(file_tags, notify_changed=not tr._init)
+                added.append(tr)
+            elif file_tags is False:
+                tr._scan_valid = False
+            elif file_tags is not True:
+                tr.set_file_tags(file_tags)
+            dirtracks.append(tr)
+        if added:
+            self.collection.add_tracks(added)
+
+        # do this so that if we have, say, a 4000-song folder
+        # we dont get bogged down trying to keep track of them
+        # for compilation detection. Most albums have far fewer
+        # than 110 tracks anyway, so it is unlikely that this
+        # restriction will affect the heuristic's accuracy.
+        # 110 was chosen to accommodate "top 100"-style
+        # compilations.
+        if len(dirtracks) > 110:
+            logger.debug(
+                "Too many files, skipping compilation detection heuristic for %s",
+                dirtracks[0].get_tag_raw('__basedir'),
+            )
+        elif dirtracks:
+            self._check_compilations(dirtracks)
+
+        # the directory and its files
+        previous = count
+        count += 1 + len(files)
+        if notify_interval is not None and (
+            count // notify_interval != previous // notify_interval
+        ):
+            event.log_event('tracks_scanned', self, count)
+        return count
+
+    def _check_compilations(self, dirtracks: List[trax.Track]) -> None:
+        """
+        Marks the tracks of a directory that are part of a compilation,
+        see _check_compilation
+        """
+        ccheck = {}
+        compilations = deque()
+        for tr in dirtracks:
+            self._check_compilation(ccheck, compilations, tr)
+        for basedir, album in compilations:
+            base = basedir.replace('"', '\\"')
+            alb = album.replace('"', '\\"')
+            items = [
+                tr
+                for tr in dirtracks
+                if tr.get_tag_raw('__basedir') == base and
+                # FIXME: this is ugly
+                alb in "".join(tr.get_tag_raw('album') or []).lower()
+            ]
+            for item in items:
+                item.set_tag_raw('__compilation', (basedir, album))
+
+    def __walk(
+        self,
+        libloc: Gio.File,
+        cached: Dict[str, _Directory],
+        directories: Dict[str, _Directory],
+    ) -> Iterable[Tuple[Gio.File, Union[None, Gio.FileInfo, _Directory]]]:
+        """
+        Walks through the library like common.walk_with_info, and records
+        each directory listed in directories. The directories in cached
+        that were not modified since are not listed again; they are
+        yielded with their cached entry instead of None.
+        """
+        queue: Deque[Gio.File] = deque()
+        queue.append(libloc)
+
+        while len(queue) > 0:
+            dir = queue.pop()
+            uri = dir.get_uri()
+            mtime = _get_directory_mtime(dir)
+            directory = cached.get(uri)
+            if directory is not None and directory.mtime == mtime:
+                directories[uri] = directory
+                queue.extend(dir.get_child(name) for name in directory.subdirs)
+                yield dir, directory
+                continue
+
+            yield dir, None
+            files = 0
+            subdirs = []
+            try:
+                for fil, fileinfo in common.enumerate_directory(dir, libloc):
+                    if fileinfo.get_file_type() == Gio.FileType.DIRECTORY:
+                        subdirs.append(fileinfo.get_name())
+                        queue.append(fil)
+                    else:
+                        files += 1
+                        yield fil, fileinfo
+            except GLib.Error:
+                logger.exception("Unhandled exception while walking on %s.", dir)
+                continue
+            if mtime is not None:
+                directories[uri] = _Directory(mtime, files, 0, tuple(subdirs))
+
+    def __count_tracks(self, libloc: Gio.File) -> Dict[str, int]:
+        """
+        :returns: the number of tracks of the collection in each directory
+            of the library
+        """
+        prefix = libloc.get_uri()
+        return Counter(
+            loc.rpartition('/')[0]
+            for loc in list(self.collection.tracks)
+            if loc.startswith(prefix)
+        )
+
     def rescan(
-        self, notify_interval: Optional[int] = None, force_update: bool = False
+        self,
+        notify_interval: Optional[int] = None,
+        force_update: bool = False,
+        quick: bool = False,
     ) -> bool:
         """
         Rescan the associated folder and add the contained files
         to the Collection
 
+        The directories found, along with their modification time and
+        number of files and tracks, are saved with the collection. A
+        quick scan checks the modification time of each directory, and
+        skips the directories that were not changed since the last scan,
+        and that still have the same number of tracks in the collection.
+        Since changing a file does not change its directory, every
+        directory is listed again if the last scan that listed them all
+        is older than the ``collection/scan_verify_interval`` option, in
+        days (7 by default).
+
+        :param quick: skip unchanged directories, unless force_update is
+            also given
         :returns: Whether the caller should reschedule this call, due to the
             collection not being ready
         """
@@ -756,6 +1291,11 @@ class Library:
         if self.collection is None:
             return True
 
+        # wait for the collection to be loaded, or let the main thread
+        # try again later, see _wait_loaded_off_main
+        if not self.collection._wait_loaded_off_main():
+            return True
+
         if self.scanning:
             return False
 
@@ -763,64 +1303,68 @@ class Library:
         self.scanning = True
         libloc = Gio.File.new_for_uri(self.location)
 
+        cache = self.collection._get_directory_cache(self.location)
+        verify_interval = settings.get_option('collection/scan_verify_interval', 7)
+        if (
+            quick
+            and not force_update
+            and cache is not None
+            and time.time() - cache.verified < verify_interval * 86400
+        ):
+            verified = cache.verified
+            tracks = self.__count_tracks(libloc)
+            cached = {
+                uri: directory
+                for uri, directory in cache.directories.items()
+                if tracks[uri] == directory.tracks
+            }
+        else:
+            verified = time.time()
+            cached = {}
+        directories: Dict[str, _Directory] = {}
+        # the directories whose files were not listed
+        skipped = set()
+
+        reader = _TagReader()
+        # the files of each directory, oldest first, as a list of
+        # (location, track or None if new, future of its tags or None)
+        pending: Deque[list] = deque()
+        pending_files = 0
         count = 0
-        dirtracks = deque()
-        compilations = deque()
-        ccheck = {}
-        for fil in common.walk(libloc):
-            count += 1
-            type = fil.query_info(
-                "standard::type", Gio.FileQueryInfoFlags.NONE, None
-            ).get_file_type()
-            if type == Gio.FileType.DIRECTORY:
-                if dirtracks:
-                    for tr in dirtracks:
-                        self._check_compilation(ccheck, compilations, tr)
-                    for basedir, album in compilations:
-                        base = basedir.replace('"', '\\"')
-                        alb = album.replace('"', '\\"')
-                        items = [
-                            tr
-                            for tr in dirtracks
-                            if tr.get_tag_raw('__basedir') == base and
-                            # FIXME: this is ugly
-                            alb in "".join(tr.get_tag_raw('album') or []).lower()
-                        ]
-                        for item in items:
-                            item.set_tag_raw('__compilation', (basedir, album))
-                dirtracks = deque()
-                compilations = deque()
-                ccheck = {}
-            elif type == Gio.FileType.REGULAR:
-                tr = self.update_track(fil, force_update=force_update)
-                if not tr:
-                    continue
-
-                if dirtracks is not None:
-                    dirtracks.append(tr)
-                    # do this so that if we have, say, a 4000-song folder
-                    # we dont get bogged down trying to keep track of them
-                    # for compilation detection. Most albums have far fewer
-                    # than 110 tracks anyway, so it is unlikely that this
-                    # restriction will affect the heuristic's accuracy.
-                    # 110 was chosen to accommodate "top 100"-style
-                    # compilations.
-                    if len(dirtracks) > 110:
-                        logger.debug(
-                            "Too many files, skipping "
-                            "compilation detection heuristic for %s",
-                            fil.get_uri(),
-                        )
-                        dirtracks = None
-
-            if self.collection and self.collection._scan_stopped:
-                self.scanning = False
-                logger.info("Scan canceled")
-                return False
-
-            # progress update
-            if notify_interval is not None and count % notify_interval == 0:
-                event.log_event('tracks_scanned', self, count)
+        try:
+            for fil, info in self.__walk(libloc, cached, directories):
+                if info is None:  # a directory, its files follow
+                    files = []
+                    pending.append(files)
+                elif isinstance(info, _Directory):  # unchanged, skip its files
+                    skipped.add(fil.get_uri())
+                    count += 1 + info.files
+                else:
+                    files.append(self.__read_file(reader, fil, force_update))
+                    pending_files += 1
+
+                # keep the workers busy while the tracks read so far are
+                # added to the collection, once their directory is done
+                while (
+                    len(pending) > 1
+                    and pending_files > reader.workers * SCAN_QUEUE_SIZE
+                ):
+                    pending_files -= len(pending[0])
+                    count = self.__add_files(pending.popleft(), count, notify_interval)
+
+                if self.collection and self.collection._scan_stopped:
+                    for directory in pending:
+                        for _loc, _tr, future in directory:
+                            if future is not None:
+                                future.cancel()
+                    self.scanning = False
+                    logger.info("Scan canceled")
+                    return False
+
+            while pending:
+                count = self.__add_files(pending.popleft(), count, notify_interval)
+        finally:
+            reader.shutdown()
 
         # final progress update
         if notify_interval is not None:
@@ -830,7 +1374,7 @@ class Library:
         for tr in self.collection.tracks.values():
             tr = tr._track
             loc = tr.get_loc_for_io()
-            if not loc:
+            if not loc or loc.rpartition('/')[0] in skipped:
                 continue
             gloc = Gio.File.new_for_uri(loc)
             try:
@@ -847,6 +1391,19 @@ class Library:
             logger.debug("Removing %s", tr)
             self.collection.remove(tr)
 
+        tracks = self.__count_tracks(libloc)
+        for uri, directory in directories.items():
+            directories[uri] = directory._replace(tracks=tracks[uri])
+        self.collection._set_directory_cache(
+            self.location, _DirectoryCache(verified, directories)
+        )
+        if skipped:
+            logger.info(
+                "Skipped %d unchanged directories out of %d",
+                len(skipped),
+                len(directories),
+            )
+
         logger.info("Scan completed: %s", self.location)
         self.scanning = False
         return False
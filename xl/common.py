@@ -39,7 +39,7 @@ import shelve
 import subprocess
 import sys
 import threading
-from typing import Deque, Generic, Iterable, List, TypeVar
+from typing import Deque, Generic, Iterable, List, Optional, Tuple, TypeVar
 import urllib.parse
 import urllib.request
 import weakref
@@ -541,40 +541,74 @@ def walk(root: Gio.File) -> Iterable[Gio.File]:
         directory to walk through
     :returns: a generator object
     """
+    for fil, _info in walk_with_info(root):
+        yield fil
+
+
+def walk_with_info(root: Gio.File) -> Iterable[Tuple[Gio.File, Optional[Gio.FileInfo]]]:
+    """
+    Like :func:`walk`, but also yields the information enumerated about
+    each file, including its ``standard::type`` and ``time::modified``
+    attributes, so that it does not have to be queried again. The
+    directories are yielded with None.
+
+    :param root: a :class:`Gio.File` representing the
+        directory to walk through
+    :returns: a generator object of (file, info) tuples
+    """
     queue: Deque[Gio.File] = deque()
     queue.append(root)
 
     while len(queue) > 0:
         dir = queue.pop()
-        yield dir
+        yield dir, None
         try:
-            for fileinfo in dir.enumerate_children(
-                "standard::type,"
-                "standard::is-symlink,standard::name,"
-                "standard::symlink-target,time::modified",
-                Gio.FileQueryInfoFlags.NONE,
-                None,
-            ):
-                fil = dir.get_child(fileinfo.get_name())
-                # FIXME: recursive symlinks could cause an infinite loop
-                if fileinfo.get_is_symlink():
-                    target = fileinfo.get_symlink_target()
-                    if "://" not in target and not os.path.isabs(target):
-                        fil2 = dir.get_child(target)
-                    else:
-                        fil2 = Gio.File.new_for_uri(target)
-                    # already in the collection, we'll get it anyway
-                    if fil2.has_prefix(root):
-                        continue
-                type = fileinfo.get_file_type()
-                if type == Gio.FileType.DIRECTORY:
+            for fil, fileinfo in enumerate_directory(dir, root):
+                if fileinfo.get_file_type() == Gio.FileType.DIRECTORY:
                     queue.append(fil)
-                elif type == Gio.FileType.REGULAR:
-                    yield fil
+                else:
+                    yield fil, fileinfo
         except GLib.Error:  # why doesn't gio offer more-specific errors?
             logger.exception("Unhandled exception while walking on %s.", dir)
 
 
+def enumerate_directory(
+    dir: Gio.File, root: Gio.File
+) -> Iterable[Tuple[Gio.File, Gio.FileInfo]]:
+    """
+    Lists the subdirectories and regular files of a directory, as
+    :func:`walk_with_info` finds them; symbolic links to files within
+    root are left out.
+
+    :param dir: a :class:`Gio.File` representing the directory to list
+    :param root: a :class:`Gio.File` representing the directory being
+        walked through
+    :returns: a generator object of (file, info) tuples
+    :raises GLib.Error: if the directory cannot be listed
+    """
+    for fileinfo in dir.enumerate_children(
+        "standard::type,"
+        "standard::is-symlink,standard::name,"
+        "standard::symlink-target,time::modified",
+        Gio.FileQueryInfoFlags.NONE,
+        None,
+    ):
+        fil = dir.get_child(fileinfo.get_name())
+        # FIXME: recursive symlinks could cause an infinite loop
+        if fileinfo.get_is_symlink():
+            target = fileinfo.get_symlink_target()
+            if "://" not in target and not os.path.isabs(target):
+                fil2 = dir.get_child(target)
+            else:
+                fil2 = Gio.File.new_for_uri(target)
+            # already in the collection, we'll get it anyway
+            if fil2.has_prefix(root):
+                continue
+        type = fileinfo.get_file_type()
+        if type == Gio.FileType.DIRECTORY or type == Gio.FileType.REGULAR:
+            yield fil, fileinfo
+
+
 def walk_directories(root: Gio.File) -> Iterable[Gio.File]:
     """
     Walk through a Gio directory, yielding each subdirectory
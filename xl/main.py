@@ -675,26 +675,32 @@ class Exaile:
         from xl import collection
 
         try:
+            # the tracks are loaded on a separate thread, so that the
+            # rest of Exaile doesn't have to wait for them
             self.collection = collection.Collection(
-                "Collection", location=os.path.join(xdg.get_data_dir(), 'music.db')
+                "Collection",
+                location=os.path.join(xdg.get_data_dir(), 'music.db'),
+                background=True,
             )
         except common.VersionError:
             logger.exception("VersionError loading collection")
             sys.exit(1)
 
-        # Migrate covers.db. This can only be done after the collection is loaded.
-        import xl.migrations.database.covers_1to2 as mig
-
-        mig.migrate()
-
         from xl import event
 
+        event.add_ui_callback(
+            self._on_collection_loaded, 'collection_loaded', self.collection
+        )
+        if self.collection.is_loaded():
+            self._on_collection_loaded('collection_loaded', self.collection, None)
+
         # Set up the player and playback queue
         from xl import player
 
         event.log_event("player_loaded", player.PLAYER, None)
 
-        # Initialize playlist manager
+        # Initialize playlist manager. Their tracks get their tags from the
+        # collection as it loads, see Track._defer_scans
         from xl import playlist
 
         self.playlists = playlist.PlaylistManager()
@@ -792,6 +798,13 @@ class Exaile:
 
         # pylint: enable-msg=W0201
 
+    def _on_collection_loaded(self, type, collection, data):
+        # Migrate covers.db. This can only be done after the collection is
+        # loaded; migrate() does nothing if it has already run.
+        import xl.migrations.database.covers_1to2 as mig
+
+        mig.migrate()
+
     def _set_locale(self, custom_lang: str = None) -> None:
         """
         Get and set locale setting
@@ -967,6 +980,11 @@ class Exaile:
 
         covers.MANAGER.save()
 
+        # a partially loaded collection isn't saved, and the thread
+        # loading it doesn't outlive us
+        if not self.collection.is_loaded():
+            logger.info("Waiting for the collection to be loaded...")
+            self.collection.wait_loaded()
         self.collection.save_to_location()
 
         # Save order of custom playlists
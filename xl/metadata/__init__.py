@@ -29,8 +29,6 @@ import os
 from typing import Optional
 import urllib.parse
 
-from gi.repository import Gio
-
 from xl.metadata._base import BaseFormat, CoverImage, NotWritable, NotReadable
 
 from xl.metadata import (
@@ -111,6 +109,30 @@ class DummyFormat(BaseFormat):
     pass
 
 
+def _get_extension(path: str) -> str:
+    ext = os.path.splitext(path)[1]
+    ext = ext[1:]  # remove the pesky .
+    return ext.lower()
+
+
+def is_supported(loc: str) -> bool:
+    """
+    Returns whether get_format may return a Format object for the file
+    at loc. Unlike get_format, this only looks at the file extension,
+    the file is not opened.
+
+    :param loc: The location of the file as a Gio URI
+        (from Track.get_loc_for_io())
+    """
+    # imported here, as xl.trax imports this module
+    from xl.trax.uri import uri_to_path
+
+    path = uri_to_path(loc)
+    if not path:
+        return False
+    return _get_extension(path) in formats
+
+
 def get_format(loc: str) -> Optional[BaseFormat]:
     """
     get a Format object appropriate for the file at loc.
@@ -119,16 +141,15 @@ def get_format(loc: str) -> Optional[BaseFormat]:
     :param loc: The location to read from as a Gio URI
         (from Track.get_loc_for_io())
     """
-    loc = Gio.File.new_for_uri(loc).get_path()
+    # imported here, as xl.trax imports this module
+    from xl.trax.uri import uri_to_path
+
+    loc = uri_to_path(loc)
     if not loc:
         return None
 
-    ext = os.path.splitext(loc)[1]
-    ext = ext[1:]  # remove the pesky .
-    ext = ext.lower()
-
     try:
-        formatclass = formats[ext]
+        formatclass = formats[_get_extension(loc)]
     except KeyError:
         return None  # not supported
 
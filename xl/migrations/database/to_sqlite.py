@@ -0,0 +1,69 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+import logging
+import os
+
+from xl import common
+from xl.trax.journal import TrackDBJournal, apply_records
+from xl.trax.storage import SQLiteShelf
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(path, sqlite_path):
+    """
+    Copies the track database in the shelf at path, including any
+    changes still in its journal, to a new SQLite database.
+
+    The shelf itself is left alone, but it won't see any changes made
+    to the SQLite database.
+    """
+    logger.info("Migrating %s to SQLite", path)
+
+    tmp_path = sqlite_path + os.extsep + 'tmp'
+    for extra in (tmp_path, tmp_path + '-wal', tmp_path + '-shm'):
+        if os.path.exists(extra):
+            os.unlink(extra)
+
+    old_shelf = common.open_shelf(path)
+    try:
+        new_shelf = SQLiteShelf(tmp_path)
+        try:
+            for k, v in old_shelf.items():
+                new_shelf[k] = v
+            apply_records(new_shelf, TrackDBJournal().replay(path))
+        finally:
+            new_shelf.close()
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except Exception:
+            pass
+        raise
+    finally:
+        old_shelf.close()
+
+    os.replace(tmp_path, sqlite_path)
+    logger.info("Migration successfully completed!")
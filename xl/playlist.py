@@ -33,16 +33,19 @@ from gi.repository import Gio
 
 from collections import deque
 from datetime import datetime, timedelta
+import heapq
 import logging
 import operator
 import os
 import pickle
 import random
 import re
+import threading
 import time
 from typing import NamedTuple
 import urllib.parse
 import urllib.request
+import weakref
 
 from xl import common, dynamic, event, main, providers, settings, trax, xdg
 from xl.common import GioFileInputStream, GioFileOutputStream, MetadataList
@@ -68,6 +71,55 @@ class PlaylistExportOptions(NamedTuple):
     relative: bool
 
 
+#: Largest number of tracks inserted one by one in a sorted playlist,
+#: relative to the length of the playlist; more are merged in one go
+_SORTED_INSERT_RATIO = 1 / 16
+
+#: Playlists generated on the main thread while their collection was
+#: loading, with their smart playlist and collection, see
+#: SmartPlaylist.get_playlist
+_PENDING_SMART_PLAYLISTS = weakref.WeakKeyDictionary()
+
+
+def _fill_smart_playlists(type, collection, data):
+    """
+    Generates the smart playlists that waited for collection to load
+    """
+    for pl, (smart_playlist, pl_collection) in list(_PENDING_SMART_PLAYLISTS.items()):
+        if pl_collection is collection:
+            del _PENDING_SMART_PLAYLISTS[pl]
+            pl.extend(smart_playlist._search(collection))
+
+
+def _get_sort_dependencies(tags):
+    """
+    Returns the tags that the sort keys of tags are computed from, see
+    Track.get_tag_sort
+    """
+    # unknown values sort by file name
+    dependencies = {'__loc'}
+    for tag in tags:
+        dependencies.update((tag, tag + 'sort'))
+        if tag == 'albumartist':
+            dependencies.update(('artist', '__compilation'))
+    return frozenset(dependencies)
+
+
+def _bisect_sorted(keys, key, reverse):
+    """
+    Returns the position after the last of keys that sorts before or
+    with key, keys being sorted in descending order if reverse is True
+    """
+    lo, hi = 0, len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if (keys[mid] < key) if reverse else (key < keys[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
 def encode_filename(filename: str) -> str:
     """
     Converts a file name into a valid filename most
@@ -238,7 +290,7 @@ class FormatConverter:
         :param track_path: the path of the track
         :type track_path: string
         """
-        playlist_uri = Gio.File.new_for_uri(playlist_path).get_uri()
+        playlist_uri = trax.uri.canonicalize(playlist_path)
         # Track path will not be changed if it already is a fully qualified URL
         track_uri = urllib.parse.urljoin(playlist_uri, track_path.replace('\\', '/'))
 
@@ -964,8 +1016,18 @@ class Playlist:
         self.__current_position = -1
         self.__spat_position = -1
         self.__shuffle_history_counter = 1
+        # sorted mode, see sort(): the tags and order the tracks are kept
+        # in, and the sort key of each track, or None if not sorted
+        self.__sort_tags = None
+        self.__sort_reverse = False
+        self.__sort_keys = None
+        # the tags the sort keys depend on, and the positions of each
+        # track, or None until needed; see on_track_tags_changed
+        self.__sort_dependencies = frozenset()
+        self.__sort_positions = None
 
         event.add_callback(self.on_playback_track_start, "playback_track_start")
+        event.add_callback(self.on_track_tags_changed, "track_tags_changed")
 
     ### playlist-specific API ###
 
@@ -1406,7 +1468,7 @@ class Playlist:
         # Turn list of tuples into 2 tuples
         self[:] = MetadataList(*zip(*tracks))
 
-    def sort(self, tags, reverse=False):
+    def sort(self, tags, reverse=False, keep_sorted=False):
         """
         Sorts the content of the playlist
 
@@ -1414,15 +1476,87 @@ class Playlist:
         :type tags: list of strings
         :param reverse: whether the sorting shall be reversed
         :type reverse: boolean
-        """
-        data = zip(self.__tracks, self.__tracks.metadata)
-        data = trax.sort_tracks(
-            tags, data, trackfunc=operator.itemgetter(0), reverse=reverse
+        :param keep_sorted: whether tracks added by :meth:`append` and
+            :meth:`extend` are then inserted in sorted order, until
+            tracks are put at a given position
+        :type keep_sorted: boolean
+        """
+        tags = tuple(tags)
+        keys = [self.__get_sort_key(tags, track) for track in self.__tracks]
+        order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+        metadata = self.__tracks.metadata
+        self[:] = MetadataList(
+            [self.__tracks[i] for i in order], [metadata[i] for i in order]
         )
-        l = MetadataList()
-        l.extend([x[0] for x in data])
-        l.metadata = [x[1] for x in data]
-        self[:] = l
+        if keep_sorted:
+            self.__sort_tags = tags
+            self.__sort_reverse = reverse
+            self.__sort_keys = [keys[i] for i in order]
+            self.__sort_dependencies = _get_sort_dependencies(tags)
+
+    def get_sort_order(self):
+        """
+        Retrieves the order the playlist is kept in, see :meth:`sort`
+
+        :returns: the tags and whether the order is reversed, or None if
+            the playlist is not kept sorted
+        :rtype: tuple of (tuple of strings, boolean) or None
+        """
+        if self.__sort_keys is None:
+            return None
+        return self.__sort_tags, self.__sort_reverse
+
+    @staticmethod
+    def __get_sort_key(tags, track):
+        # as compared by trax.sort_tracks
+        return tuple(track.get_tag_sort(tag) for tag in tags)
+
+    def __insert_sorted(self, tracks):
+        """
+        Inserts tracks where they belong in a sorted playlist, with a
+        single playlist_tracks_added event
+        """
+        for track in tracks:
+            if not isinstance(track, trax.Track):
+                raise ValueError("Need trax.Track object, got %r" % type(track))
+        if not tracks:
+            return
+        oldpos = self.current_position
+        tags = self.__sort_tags
+        reverse = self.__sort_reverse
+        keys = self.__sort_keys
+        # sorted like sort() would, after the tracks already there
+        new = [(self.__get_sort_key(tags, track), track) for track in tracks]
+        new.sort(key=operator.itemgetter(0), reverse=reverse)
+
+        if len(new) <= len(keys) * _SORTED_INSERT_RATIO:
+            added = []
+            for key, track in new:
+                position = _bisect_sorted(keys, key, reverse)
+                keys.insert(position, key)
+                self.__tracks.insert(position, track)
+                added.append((position, track))
+        else:
+            # (key, is new, track, metadata)
+            old = zip(keys, [False] * len(keys), self.__tracks, self.__tracks.metadata)
+            merged = list(
+                heapq.merge(
+                    old,
+                    ((key, True, track, None) for key, track in new),
+                    key=operator.itemgetter(0),
+                    reverse=reverse,
+                )
+            )
+            added = [(i, x[2]) for i, x in enumerate(merged) if x[1]]
+            self.__sort_keys = [x[0] for x in merged]
+            self.__tracks[:] = MetadataList(
+                [x[2] for x in merged], [x[3] for x in merged]
+            )
+
+        self.on_tracks_changed()
+        event.log_event('playlist_tracks_added', self, added)
+        self.__adjust_current_pos(oldpos, [], added)
+        self.__needs_save = self.__dirty = True
 
     # TODO[0.4?]: drop our custom disk playlist format in favor of an
     # extended XSPF playlist (using xml namespaces?).
@@ -1538,6 +1672,7 @@ class Playlist:
             trs.append(track)
 
         self.__tracks[:] = trs
+        self.__sort_keys = None
 
         for item, val in items.items():
             if item in self.save_attrs:
@@ -1587,6 +1722,8 @@ class Playlist:
         return self.__tracks.__getitem__(i)
 
     def __setitem__(self, i, value):
+        # the tracks are put where the caller wants them
+        self.__sort_keys = None
         oldtracks = self.__getitem__(i)
         removed = MetadataList()
         added = MetadataList()
@@ -1638,6 +1775,8 @@ class Playlist:
         oldtracks = self.__getitem__(i)
         oldpos = self.current_position
         self.__tracks.__delitem__(i)
+        if self.__sort_keys is not None:
+            del self.__sort_keys[i]
         removed = MetadataList()
 
         if isinstance(i, slice):
@@ -1661,15 +1800,21 @@ class Playlist:
 
         :param other: a :class:`xl.trax.Track`
         """
-        self[len(self) : len(self)] = [other]
+        self.extend([other])
 
     def extend(self, other):
         """
         Extends the playlist by another playlist
 
+        If the playlist is kept sorted, see :meth:`sort`, the tracks are
+        inserted in sorted order instead.
+
         :param other: list of :class:`xl.trax.Track`
         """
-        self[len(self) : len(self)] = other
+        if self.__sort_keys is not None:
+            self.__insert_sorted(list(other))
+        else:
+            self[len(self) : len(self)] = other
 
     def count(self, other):
         """
@@ -1710,7 +1855,38 @@ class Playlist:
             if self.dynamic_mode != 'disabled':
                 self.__fetch_dynamic_tracks()
 
+    def on_track_tags_changed(self, event_type, track, tags):
+        """
+        Updates the sort key of a changed track in a sorted playlist, or
+        leaves sorted mode if the track is no longer in order
+        """
+        keys = self.__sort_keys
+        if keys is None or self.__sort_dependencies.isdisjoint(tags):
+            return
+        positions = self.__sort_positions
+        if positions is None:
+            positions = {}
+            for i, tr in enumerate(self.__tracks):
+                positions.setdefault(tr, []).append(i)
+            self.__sort_positions = positions
+        if track not in positions:
+            return
+        key = self.__get_sort_key(self.__sort_tags, track)
+        for i in positions[track]:
+            if key == keys[i]:
+                continue
+            before = keys[i - 1] if i > 0 else key
+            after = keys[i + 1] if i + 1 < len(keys) else key
+            if self.__sort_reverse:
+                before, after = after, before
+            if before <= key <= after:
+                keys[i] = key
+            else:
+                self.__sort_keys = None
+                return
+
     def on_tracks_changed(self, *args):
+        self.__sort_positions = None
         for idx in range(len(self.__tracks)):
             if self.__tracks.get_meta_key(idx, "playlist_current_position"):
                 self.__current_position = idx
@@ -1893,6 +2069,34 @@ class SmartPlaylist:
         if not collection:  # if there wasn't one set we might not have one
             return pl
 
+        # don't generate the playlist from a partially loaded collection;
+        # waiting would freeze the UI, so it is filled in once loaded
+        is_loaded = getattr(collection, 'is_loaded', None)
+        if is_loaded is not None and not is_loaded():
+            if threading.current_thread() is threading.main_thread():
+                logger.info("Generating %s once the collection is loaded", self.name)
+                self.__fill_when_loaded(pl, collection)
+                return pl
+            collection.wait_loaded()
+
+        pl.extend(self._search(collection))
+        return pl
+
+    def __fill_when_loaded(self, pl, collection):
+        pending = _PENDING_SMART_PLAYLISTS.values()
+        if not any(c is collection for _smart_playlist, c in pending):
+            event.add_ui_callback(
+                _fill_smart_playlists, 'collection_loaded', collection
+            )
+        _PENDING_SMART_PLAYLISTS[pl] = (self, collection)
+        if collection.is_loaded():
+            # the event may have been sent already
+            _fill_smart_playlists('collection_loaded', collection, None)
+
+    def _search(self, collection):
+        """
+        Returns the tracks of the playlist found in collection
+        """
         search_string, matchers = self._create_search_data(collection)
 
         matcher = trax.TracksMatcher(search_string, case_sensitive=False)
@@ -1902,23 +2106,28 @@ class SmartPlaylist:
         for m in matchers:
             matcher.prepend_matcher(m, self.or_match)
 
-        trs = [t.track for t in trax.search_tracks(collection, [matcher])]
-        if self.random_sort:
-            random.shuffle(trs)
+        order = False
+        if self.sort_tags:
+            order = self.sort_order
+            sort_by = [self.sort_tags] + list(common.BASE_SORT_TAGS)
         else:
-            order = False
-            if self.sort_tags:
-                order = self.sort_order
-                sort_by = [self.sort_tags] + list(common.BASE_SORT_TAGS)
-            else:
-                sort_by = common.BASE_SORT_TAGS
-            trs = trax.sort_tracks(sort_by, trs, reverse=order)
-        if self.track_count > 0 and len(trs) > self.track_count:
-            trs = trs[: self.track_count]
+            sort_by = common.BASE_SORT_TAGS
 
-        pl.extend(trs)
+        if self.track_count > 0 and not self.random_sort:
+            # only the first tracks are needed, don't sort them all
+            trs = trax.search_top_tracks(
+                collection, [matcher], sort_by, self.track_count, reverse=order
+            )
+        else:
+            trs = [t.track for t in trax.search_tracks(collection, [matcher])]
+            if self.random_sort:
+                random.shuffle(trs)
+            else:
+                trs = trax.sort_tracks(sort_by, trs, reverse=order)
+            if self.track_count > 0 and len(trs) > self.track_count:
+                trs = trs[: self.track_count]
 
-        return pl
+        return trs
 
     def _create_search_data(self, collection):
         """
@@ -31,10 +31,11 @@
 Provides the base for creating and managing Track objects.
 """
 
-from xl.trax.track import Track
+from xl.trax.track import FileTags, Track, read_file_tags
 from xl.trax.trackdb import TrackDB
 from xl.trax.search import (
     SearchResultTrack,
+    SearchSession,
     search_tracks,
     search_tracks_from_string,
     TracksMatcher,
@@ -42,6 +43,7 @@ from xl.trax.search import (
     TracksNotInList,
     match_track_from_string,
 )
+from xl.trax.executor import SearchExecutor, SearchTask
 from xl.trax.util import (
     is_valid_track,
     get_album_tracks,
@@ -49,5 +51,7 @@ from xl.trax.util import (
     get_tracks_from_uri,
     sort_tracks,
     sort_result_tracks,
+    top_tracks,
+    search_top_tracks,
     get_rating_from_tracks,
 )
@@ -0,0 +1,202 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Runs searches on the main loop without blocking it, a few tracks at a
+time, so that a slow search does not freeze the interface and a newer
+search can replace it before it completes. Searches that need the
+search index are prepared in a thread, as building the index takes a
+while on large collections.
+"""
+
+import logging
+from time import monotonic
+from typing import Callable, Collection, List, Optional
+
+from gi.repository import GLib
+
+from xl import common
+from xl.trax.search import SearchResultTrack, TracksMatcher, prepare_search
+
+logger = logging.getLogger(__name__)
+
+#: Number of tracks searched between checks of the elapsed time
+_CHECK_INTERVAL = 64
+
+
+class SearchTask:
+    """
+    A search started by :meth:`SearchExecutor.start`
+    """
+
+    def __init__(
+        self,
+        trackiter,
+        match: Optional[Callable],
+        on_results: Optional[Callable[[List[SearchResultTrack]], None]],
+        on_done: Optional[Callable[[List[SearchResultTrack]], None]],
+        budget: float,
+    ):
+        self._iter = iter(trackiter)
+        self._match = match
+        self._on_results = on_results
+        self._on_done = on_done
+        self._budget = budget
+        self._source_id = None
+        #: the results found so far
+        self.results: List[SearchResultTrack] = []
+        #: whether the search was cancelled
+        self.cancelled = False
+        #: whether the search went through all tracks
+        self.done = False
+
+    def cancel(self) -> None:
+        """
+        Stops the search, no more results are delivered
+        """
+        self.cancelled = True
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+    def run_slice(self) -> bool:
+        """
+        Searches tracks until the time budget of a slice is spent.
+
+        :returns: whether there are tracks left to search
+        """
+        if self.cancelled or self.done or self._match is None:
+            return False
+        deadline = monotonic() + self._budget
+        match = self._match
+        found = []
+        count = 0
+        for item in self._iter:
+            srtr = match(item)
+            if srtr is not None:
+                found.append(srtr)
+            count += 1
+            if count == _CHECK_INTERVAL:
+                if monotonic() >= deadline:
+                    break
+                count = 0
+        else:
+            self.done = True
+
+        if found:
+            self.results.extend(found)
+            if self._on_results is not None:
+                self._on_results(found)
+        if self.done:
+            self._source_id = None
+            if self._on_done is not None and not self.cancelled:
+                self._on_done(self.results)
+            return False
+        # a callback may have cancelled the search
+        return not self.cancelled
+
+    def _schedule(self) -> None:
+        self._source_id = GLib.idle_add(self.run_slice)
+
+    @common.threaded
+    def _prepare(self, trackiter, trackmatchers, index) -> None:
+        """
+        Prepares the search in a thread, then searches from the main loop
+        """
+        try:
+            match = prepare_search(trackiter, trackmatchers, index)
+        except Exception:
+            logger.exception("Error preparing search")
+            return
+        if not self.cancelled:
+            self._source_id = GLib.idle_add(self._run_prepared, match)
+
+    def _run_prepared(self, match: Callable) -> bool:
+        self._match = match
+        return self.run_slice()
+
+
+class SearchExecutor:
+    """
+    Runs searches a slice of time at a time from the main loop, one
+    search at a time: starting a search cancels the previous one.
+
+    :param budget: the time, in seconds, a slice may take
+    """
+
+    def __init__(self, budget: float = 0.005):
+        self.budget = budget
+        self._task: Optional[SearchTask] = None
+
+    def start(
+        self,
+        trackiter,
+        trackmatchers: Collection[TracksMatcher],
+        on_results: Optional[Callable[[List[SearchResultTrack]], None]] = None,
+        on_done: Optional[Callable[[List[SearchResultTrack]], None]] = None,
+        index=None,
+    ) -> SearchTask:
+        """
+        Starts a search, as done by :func:`xl.trax.search_tracks`, and
+        cancels the running one. The first slice runs right away, unless
+        the search uses an index: it is then prepared in a thread first.
+
+        :param on_results: called with each list of new results
+        :param on_done: called with the list of all results once every
+            track is searched
+        :returns: the search task, which can be cancelled
+        """
+        self.cancel()
+        task = SearchTask(
+            # the tracks may change while they are searched
+            list(trackiter),
+            None,
+            on_results,
+            on_done,
+            self.budget,
+        )
+        self._task = task
+        if (
+            index is not None
+            or hasattr(trackiter, 'hydrate')
+            or hasattr(trackiter, 'get_search_index')
+        ):
+            task._prepare(trackiter, trackmatchers, index)
+            return task
+        task._match = prepare_search(trackiter, trackmatchers, index)
+        if task.run_slice():
+            task._schedule()
+        return task
+
+    def cancel(self) -> None:
+        """
+        Cancels the running search, if any
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not (self._task.done or self._task.cancelled)
@@ -0,0 +1,265 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Trigram indexes, used for typo-tolerant searches of tag values.
+
+A string is split into words, and each word into the sequences of three
+characters it contains, padded with spaces at the ends. A value is
+similar to a searched text if it contains enough of the trigrams of the
+text: ``beatels`` is found in ``The Beatles``.
+
+The trigram indexes of a :class:`xl.trax.TrackDB` are saved next to its
+database, so that they don't have to be rebuilt at startup. They only
+hold tag values, so they remain usable even if the database changed;
+values that were added or removed since are reindexed when the index is
+first used.
+"""
+
+from collections import Counter
+import logging
+import math
+import os
+import pickle
+import re
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from xl.unicode import shave_marks
+
+logger = logging.getLogger(__name__)
+
+#: Tags with trigram indexes, similar values of other tags are found by
+#: comparing them all
+FUZZY_TAGS = ('artist', 'albumartist', 'album', 'title')
+
+#: Fraction of the trigrams of a searched text that a value must contain
+THRESHOLD = 0.5
+
+#: Suffix appended to the database location to get the location of its
+#: trigram indexes
+TRIGRAMS_SUFFIX = '-trigrams'
+
+#: Version of the format of saved trigram indexes. Indexes with a
+#: different version are ignored and rebuilt.
+TRIGRAMS_VERSION = 1
+
+_WORDS = re.compile(r'\w+')
+
+
+def get_trigrams(text: str) -> FrozenSet[str]:
+    """
+    Returns the trigrams of the words of text, ignoring case and marks
+    """
+    trigrams = set()
+    for word in _WORDS.findall(shave_marks(text).lower()):
+        word = '  ' + word + ' '
+        for i in range(len(word) - 2):
+            trigrams.add(word[i : i + 3])
+    return frozenset(trigrams)
+
+
+def similarity(text: str, value: str) -> float:
+    """
+    Returns the fraction of the trigrams of text found in value
+    """
+    trigrams = get_trigrams(text)
+    if not trigrams:
+        return 0.0
+    return len(trigrams & get_trigrams(value)) / len(trigrams)
+
+
+class TrigramIndex:
+    """
+    Maps trigrams to the strings containing them
+    """
+
+    def __init__(self):
+        # id -> string, None for unused ids
+        self._values: List[Optional[str]] = []
+        # id -> number of trigrams of the string
+        self._sizes: List[int] = []
+        self._ids: Dict[str, int] = {}
+        self._free: List[int] = []
+        # trigram -> ids of the strings containing it
+        self._postings: Dict[str, set] = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, value):
+        return value in self._ids
+
+    def get_values(self) -> List[str]:
+        return list(self._ids)
+
+    def add(self, value: str) -> None:
+        if value in self._ids:
+            return
+        trigrams = get_trigrams(value)
+        if self._free:
+            id = self._free.pop()
+            self._values[id] = value
+            self._sizes[id] = len(trigrams)
+        else:
+            id = len(self._values)
+            self._values.append(value)
+            self._sizes.append(len(trigrams))
+        self._ids[value] = id
+        postings = self._postings
+        for trigram in trigrams:
+            ids = postings.get(trigram)
+            if ids is None:
+                ids = postings[trigram] = set()
+            ids.add(id)
+
+    def remove(self, value: str) -> None:
+        id = self._ids.pop(value, None)
+        if id is None:
+            return
+        postings = self._postings
+        for trigram in get_trigrams(value):
+            ids = postings.get(trigram)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del postings[trigram]
+        self._values[id] = None
+        self._free.append(id)
+
+    def search(
+        self, text: str, threshold: float = THRESHOLD
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns the strings containing at least a fraction threshold of
+        the trigrams of text, with that fraction, best matches first.
+        Among strings containing as many trigrams, shorter ones come
+        first.
+        """
+        trigrams = get_trigrams(text)
+        if not trigrams:
+            return []
+        needed = max(1, math.ceil(threshold * len(trigrams)))
+        postings = sorted(
+            (self._postings.get(trigram, ()) for trigram in trigrams), key=len
+        )
+        # a string with enough trigrams is in at least one of the
+        # shortest lists, the others are only used to count them
+        split = len(postings) - needed + 1
+        counts = Counter()
+        for ids in postings[:split]:
+            counts.update(ids)
+        rest = postings[split:]
+        found = []
+        for id, count in counts.items():
+            for ids in rest:
+                if id in ids:
+                    count += 1
+            if count >= needed:
+                found.append((count, -self._sizes[id], self._values[id]))
+        found.sort(reverse=True)
+        return [(value, count / len(trigrams)) for count, size, value in found]
+
+    def to_data(self) -> dict:
+        """
+        Returns the content of the index as builtin types, for saving
+        """
+        return {
+            'values': list(self._values),
+            'sizes': list(self._sizes),
+            'postings': {
+                trigram: sorted(ids) for trigram, ids in self._postings.items()
+            },
+        }
+
+    @classmethod
+    def from_data(cls, data: dict) -> 'TrigramIndex':
+        """
+        Creates an index from the result of :meth:`to_data`
+        """
+        index = cls()
+        index._values = data['values']
+        index._sizes = data['sizes']
+        for id, value in enumerate(index._values):
+            if value is None:
+                index._free.append(id)
+            else:
+                index._ids[value] = id
+        index._postings = {
+            trigram: set(ids) for trigram, ids in data['postings'].items()
+        }
+        return index
+
+
+def get_path(location: str) -> str:
+    """
+    Returns the location of the trigram indexes belonging to a database
+    """
+    return location + TRIGRAMS_SUFFIX
+
+
+def write_trigrams(location: str, indexes: Dict[str, dict]) -> None:
+    """
+    Writes the trigram indexes for the database at location
+
+    :param indexes: the data of the index of each tag, as returned by
+        :meth:`TrigramIndex.to_data`
+    """
+    data = {'version': TRIGRAMS_VERSION, 'indexes': indexes}
+    path = get_path(location)
+    new_path = path + '.new'
+    with open(new_path, 'wb') as fp:
+        pickle.dump(data, fp, pickle.HIGHEST_PROTOCOL)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(new_path, path)
+    logger.debug("Wrote trigram indexes of %s to %s", ', '.join(indexes), path)
+
+
+def read_trigrams(location: str) -> Dict[str, TrigramIndex]:
+    """
+    Reads the trigram indexes for the database at location
+
+    :returns: the index of each tag, empty if there are none
+    """
+    path = get_path(location)
+    try:
+        with open(path, 'rb') as fp:
+            data = pickle.loads(fp.read())
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        logger.warning("Could not read trigram indexes %s", path, exc_info=True)
+        return {}
+
+    try:
+        if data['version'] != TRIGRAMS_VERSION:
+            logger.debug("Ignoring trigram indexes %s with old format", path)
+            return {}
+        return {
+            tag: TrigramIndex.from_data(index) for tag, index in data['indexes'].items()
+        }
+    except Exception:
+        logger.warning("Invalid trigram indexes %s", path, exc_info=True)
+        return {}
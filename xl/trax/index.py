@@ -0,0 +1,420 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Indexes of the tags of the tracks in a :class:`xl.trax.TrackDB`, used to
+find the tracks matching a search without going through all of them.
+"""
+
+from bisect import bisect_left, bisect_right
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from xl.trax import fuzzy
+from xl.trax.track import Track
+
+
+class TagStats(NamedTuple):
+    """
+    Statistics about the values of a tag, see :meth:`TagIndex.get_stats`
+    """
+
+    #: number of tracks in the index
+    tracks: int
+    #: number of tracks having a value for the tag
+    with_value: int
+    #: number of distinct values of the tag
+    distinct: int
+
+
+def _to_number(value) -> Optional[float]:
+    """
+    Returns value as a float, as compared by range searches, or None if
+    it is not a number
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(number):
+        return None
+    return number
+
+
+class TagIndex:
+    """
+    Maps the search values of tags to the tracks having them.
+
+    A tag is indexed the first time it is looked up, and kept up to date
+    from then on by calling :meth:`add_tracks`, :meth:`remove_tracks`
+    and :meth:`update_track` as the tracks change. The numeric values of
+    a tag are also kept sorted once it is first used in a range lookup,
+    see :meth:`find_range`, and so are the trigrams of the values of
+    :data:`xl.trax.fuzzy.FUZZY_TAGS` once they are first used in a
+    similarity search, see :meth:`find_similar`.
+
+    :param get_tracks: returns all tracks to index
+    :param load_trigrams: returns previously saved trigram indexes, as
+        returned by :func:`xl.trax.fuzzy.read_trigrams`
+    """
+
+    def __init__(
+        self,
+        get_tracks: Callable[[], Iterable[Track]],
+        load_trigrams: Optional[Callable[[], Dict[str, fuzzy.TrigramIndex]]] = None,
+    ):
+        self._get_tracks = get_tracks
+        self._load_trigrams = load_trigrams
+        self._lock = threading.RLock()
+        # track -> location it was indexed at, None until built
+        self._tracks: Optional[Dict[Track, str]] = None
+        self._locs: Dict[str, Track] = {}
+        # tag -> search value -> tracks having it
+        self._index: Dict[str, Dict[object, Set[Track]]] = {}
+        # tag -> track -> search values it was indexed with
+        self._values: Dict[str, Dict[Track, tuple]] = {}
+        # tag -> (sorted numbers, search value of each number)
+        self._numbers: Dict[str, Tuple[List[float], List[object]]] = {}
+        # tag -> trigrams of the values
+        self._trigrams: Dict[str, fuzzy.TrigramIndex] = {}
+        # trigram indexes to reuse, None until loaded
+        self._saved_trigrams: Optional[Dict[str, fuzzy.TrigramIndex]] = None
+        self._trigrams_changed = False
+
+    def clear(self) -> None:
+        """
+        Forgets everything, the index is rebuilt when it is next used
+        """
+        with self._lock:
+            self._tracks = None
+            self._locs = {}
+            self._index = {}
+            self._values = {}
+            self._numbers = {}
+            # the values are checked again when the trigrams are next used
+            if self._saved_trigrams is None:
+                self._saved_trigrams = {}
+            self._saved_trigrams.update(self._trigrams)
+            self._trigrams = {}
+
+    def get_size(self) -> int:
+        """
+        Returns the number of tracks in the index, 0 if it is not built
+        """
+        with self._lock:
+            return len(self._tracks or ())
+
+    def get_tags(self) -> List[str]:
+        """
+        Returns the tags that are indexed
+        """
+        with self._lock:
+            return list(self._index)
+
+    def find(self, tag: str, predicate: Callable[[object], bool]) -> Set[Track]:
+        """
+        Returns the tracks having a value of tag for which predicate
+        returns True. Missing tags have the value None.
+
+        The predicate is called once for every distinct value of the tag,
+        rather than once for every track.
+        """
+        with self._lock:
+            found = set()
+            for value, tracks in self.__get_tag_index(tag).items():
+                if predicate(value):
+                    found.update(tracks)
+            return found
+
+    def find_range(
+        self,
+        tag: str,
+        low: Optional[float] = None,
+        high: Optional[float] = None,
+        missing: Optional[float] = None,
+    ) -> Set[Track]:
+        """
+        Returns the tracks having a numeric value of tag strictly between
+        low and high, values that are not numbers are left out.
+
+        :param low: lower bound, None for no bound
+        :param high: upper bound, None for no bound
+        :param missing: the number tracks without the tag have, None to
+            leave them out
+        """
+        if (low is not None and math.isnan(low)) or (
+            high is not None and math.isnan(high)
+        ):
+            return set()
+        with self._lock:
+            index = self.__get_tag_index(tag)
+            keys, values = self.__get_numbers(tag, index)
+            start = 0 if low is None else bisect_right(keys, low)
+            end = len(keys) if high is None else bisect_left(keys, high)
+            found = set()
+            for value in values[start:end]:
+                found.update(index[value])
+            if (
+                missing is not None
+                and None in index
+                and (low is None or low < missing)
+                and (high is None or missing < high)
+            ):
+                found.update(index[None])
+            return found
+
+    def find_similar(
+        self, tag: str, text: str, threshold: float = fuzzy.THRESHOLD
+    ) -> List[Tuple[Track, float]]:
+        """
+        Returns the tracks having a value of tag similar to text, see
+        :mod:`xl.trax.fuzzy`, with the similarity of their most similar
+        value; most similar first.
+
+        :param threshold: the minimum similarity
+        """
+        with self._lock:
+            index = self.__get_tag_index(tag)
+            if tag in fuzzy.FUZZY_TAGS:
+                similar = self.__get_trigrams(tag, index).search(text, threshold)
+            else:
+                trigrams = fuzzy.get_trigrams(text)
+                similar = []
+                if trigrams:
+                    for value in index:
+                        if isinstance(value, str):
+                            shared = len(trigrams & fuzzy.get_trigrams(value))
+                            score = shared / len(trigrams)
+                            if score >= threshold:
+                                similar.append((value, score))
+            found = {}
+            for value, score in similar:
+                for track in index[value]:
+                    if score > found.get(track, 0):
+                        found[track] = score
+        return sorted(found.items(), key=lambda item: item[1], reverse=True)
+
+    def take_trigram_data(self) -> Optional[Dict[str, dict]]:
+        """
+        Returns the content of the trigram indexes, for saving with
+        :func:`xl.trax.fuzzy.write_trigrams`, or None if they did not
+        change since the last call
+        """
+        with self._lock:
+            if not self._trigrams_changed:
+                return None
+            self._trigrams_changed = False
+            return {tag: trigrams.to_data() for tag, trigrams in self._trigrams.items()}
+
+    def find_value(self, tag: str, value) -> Set[Track]:
+        """
+        Returns the tracks having value as one of the search values of tag
+        """
+        with self._lock:
+            return set(self.__get_tag_index(tag).get(value, ()))
+
+    def get_ordered(self, tag: str) -> Optional[List[object]]:
+        """
+        Returns the search values of tag ordered by their numeric value,
+        if every track has exactly one value of tag and it is a number.
+        The tracks in the order of their values are then found by
+        calling :meth:`find_value` for each value in turn.
+
+        :returns: list of values, or None if the tag has tracks without
+            a number, or with several values
+        """
+        with self._lock:
+            index = self.__get_tag_index(tag)
+            values = self.__get_numbers(tag, index)[1]
+            if len(values) != len(index):
+                return None
+            if sum(len(index[value]) for value in values) != len(self._tracks):
+                return None
+            return list(values)
+
+    def get_stats(self, tag: str) -> Optional[TagStats]:
+        """
+        Returns statistics about the values of tag, or None if the tag
+        is not indexed (yet)
+        """
+        with self._lock:
+            index = self._index.get(tag)
+            if index is None:
+                return None
+            with_value = len(self._tracks) - len(index.get(None, ()))
+            distinct = len(index) - (None in index)
+            return TagStats(len(self._tracks), with_value, distinct)
+
+    def add_tracks(self, tracks: Iterable[Track]) -> None:
+        with self._lock:
+            if self._tracks is None:
+                return
+            for track in tracks:
+                self.__add(track)
+
+    def remove_tracks(self, locations: Iterable[str]) -> None:
+        with self._lock:
+            if self._tracks is None:
+                return
+            for loc in locations:
+                track = self._locs.get(loc)
+                if track is not None:
+                    self.__remove(track)
+
+    def update_track(self, track: Track) -> None:
+        """
+        Re-indexes a track whose tags changed, if it is indexed
+        """
+        with self._lock:
+            if self._tracks is not None and track in self._tracks:
+                self.__remove(track)
+                self.__add(track)
+
+    def __build(self) -> None:
+        self._tracks = {}
+        for track in self._get_tracks():
+            self.__add(track)
+
+    def __get_tag_index(self, tag: str) -> Dict[object, Set[Track]]:
+        if self._tracks is None:
+            self.__build()
+        index = self._index.get(tag)
+        if index is None:
+            index = self._index[tag] = {}
+            self._values[tag] = {}
+            for track in self._tracks:
+                self.__add_values(tag, index, track)
+        return index
+
+    def __get_numbers(
+        self, tag: str, index: Dict[object, Set[Track]]
+    ) -> Tuple[List[float], List[object]]:
+        numbers = self._numbers.get(tag)
+        if numbers is None:
+            pairs = []
+            for value in index:
+                number = _to_number(value)
+                if number is not None:
+                    pairs.append((number, value))
+            pairs.sort(key=lambda pair: pair[0])
+            numbers = self._numbers[tag] = (
+                [pair[0] for pair in pairs],
+                [pair[1] for pair in pairs],
+            )
+        return numbers
+
+    def __get_trigrams(
+        self, tag: str, index: Dict[object, Set[Track]]
+    ) -> fuzzy.TrigramIndex:
+        trigrams = self._trigrams.get(tag)
+        if trigrams is not None:
+            return trigrams
+        if self._saved_trigrams is None:
+            self._saved_trigrams = {}
+            if self._load_trigrams is not None:
+                self._saved_trigrams = self._load_trigrams()
+        trigrams = self._saved_trigrams.pop(tag, None)
+        if trigrams is None:
+            trigrams = fuzzy.TrigramIndex()
+        # bring the saved index up to date
+        changed = False
+        for value in trigrams.get_values():
+            if value not in index:
+                trigrams.remove(value)
+                changed = True
+        for value in index:
+            if isinstance(value, str) and value not in trigrams:
+                trigrams.add(value)
+                changed = True
+        self._trigrams[tag] = trigrams
+        self._trigrams_changed = self._trigrams_changed or changed
+        return trigrams
+
+    def __add(self, track: Track) -> None:
+        if track in self._tracks:
+            self.__remove(track)
+        loc = track.get_loc_for_io()
+        self._tracks[track] = loc
+        self._locs[loc] = track
+        for tag, index in self._index.items():
+            self.__add_values(tag, index, track)
+
+    def __add_values(self, tag: str, index: dict, track: Track) -> None:
+        values = track.get_tag_search_values(tag)
+        self._values[tag][track] = values
+        for value in values:
+            tracks = index.get(value)
+            if tracks is None:
+                tracks = index[value] = set()
+                numbers = self._numbers.get(tag)
+                if numbers is not None:
+                    self.__insert_number(numbers, value)
+                trigrams = self._trigrams.get(tag)
+                if trigrams is not None and isinstance(value, str):
+                    trigrams.add(value)
+                    self._trigrams_changed = True
+            tracks.add(track)
+
+    @staticmethod
+    def __insert_number(numbers: Tuple[List[float], List[object]], value) -> None:
+        number = _to_number(value)
+        if number is not None:
+            keys, values = numbers
+            pos = bisect_right(keys, number)
+            keys.insert(pos, number)
+            values.insert(pos, value)
+
+    @staticmethod
+    def __delete_number(numbers: Tuple[List[float], List[object]], value) -> None:
+        number = _to_number(value)
+        if number is not None:
+            keys, values = numbers
+            pos = bisect_left(keys, number)
+            while pos < len(keys) and keys[pos] == number:
+                if values[pos] == value:
+                    del keys[pos]
+                    del values[pos]
+                    return
+                pos += 1
+
+    def __remove(self, track: Track) -> None:
+        loc = self._tracks.pop(track)
+        if self._locs.get(loc) is track:
+            del self._locs[loc]
+        for tag, index in self._index.items():
+            for value in self._values[tag].pop(track, ()):
+                tracks = index.get(value)
+                if tracks is not None:
+                    tracks.discard(track)
+                    if not tracks:
+                        del index[value]
+                        numbers = self._numbers.get(tag)
+                        if numbers is not None:
+                            self.__delete_number(numbers, value)
+                        trigrams = self._trigrams.get(tag)
+                        if trigrams is not None and isinstance(value, str):
+                            trigrams.remove(value)
+                            self._trigrams_changed = True
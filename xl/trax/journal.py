@@ -0,0 +1,223 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Append-only change journal for :class:`xl.trax.TrackDB`.
+
+Instead of rewriting every track of a database on each save, a
+:class:`TrackDB` records which of its keys were added, changed or deleted
+as that happens. A save then only serializes those entries and appends
+them to a journal file next to the database. From time to time the
+journal is compacted, i.e. replayed into the Berkeley DB shelf and
+truncated.
+"""
+
+import logging
+import os
+import pickle
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+#: Suffix appended to the database location to get the journal location
+JOURNAL_SUFFIX = '-journal'
+
+#: Number of journal records after which the journal should be compacted
+COMPACT_THRESHOLD = 5000
+
+# Operations stored in the journal
+_SET = 's'
+_DEL = 'd'
+
+Record = Tuple[str, str, object]
+
+
+class TrackDBJournal:
+    """
+    Keeps track of the shelf keys of a :class:`TrackDB` that need to be
+    written, and manages the journal file they are written to.
+
+    Pending changes are kept in memory as a mapping of track key to
+    track location (or None if the track was deleted), so that recording
+    a change is cheap no matter how often the same track changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Optional[str]] = {}
+        #: Number of records currently stored in the journal file
+        self.record_count = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record_added(self, key: int, loc: str) -> None:
+        """
+        Records that the track with the given key was added
+        """
+        with self._lock:
+            self._pending[key] = loc
+
+    def record_changed(self, key: int, loc: str) -> None:
+        """
+        Records that the tags of the track with the given key changed
+        """
+        with self._lock:
+            self._pending[key] = loc
+
+    def record_deleted(self, key: int) -> None:
+        """
+        Records that the track with the given key was removed
+        """
+        with self._lock:
+            self._pending[key] = None
+
+    def take_pending(self) -> Dict[int, Optional[str]]:
+        """
+        Returns all pending changes and forgets about them.
+
+        If writing them fails, hand them back with :meth:`restore_pending`.
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        return pending
+
+    def restore_pending(self, pending: Dict[int, Optional[str]]) -> None:
+        """
+        Puts back changes returned by :meth:`take_pending` that could not
+        be written. Changes recorded in the meantime take precedence.
+        """
+        with self._lock:
+            for key, loc in pending.items():
+                self._pending.setdefault(key, loc)
+
+    @staticmethod
+    def get_path(location: str) -> str:
+        """
+        Returns the location of the journal belonging to a database
+        """
+        return location + JOURNAL_SUFFIX
+
+    @staticmethod
+    def set_record(shelf_key: str, value) -> Record:
+        return (_SET, shelf_key, value)
+
+    @staticmethod
+    def delete_record(shelf_key: str) -> Record:
+        return (_DEL, shelf_key, None)
+
+    def append(self, location: str, records: List[Record]) -> None:
+        """
+        Appends a batch of records to the journal of the database at
+        location. The batch is flushed to disk before returning.
+        """
+        if not records:
+            return
+        data = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+        with open(self.get_path(location), 'ab') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        self.record_count += len(records)
+
+    def replay(self, location: str) -> Iterator[Record]:
+        """
+        Yields all records stored in the journal of the database at
+        location, oldest first.
+
+        A batch that was only partially written (e.g. because Exaile
+        crashed while saving) ends the replay.
+        """
+        try:
+            fp = open(self.get_path(location), 'rb')
+        except FileNotFoundError:
+            return
+        with fp:
+            while True:
+                try:
+                    batch = pickle.load(fp)
+                except EOFError:
+                    break
+                except Exception:
+                    logger.warning(
+                        "Ignoring truncated batch in %s", self.get_path(location)
+                    )
+                    break
+                yield from batch
+
+    def exists(self, location: str) -> bool:
+        """
+        Returns whether the database at location has a non-empty journal
+        """
+        try:
+            return os.path.getsize(self.get_path(location)) > 0
+        except OSError:
+            return False
+
+    def discard(self, location: str) -> None:
+        """
+        Deletes the journal of the database at location without
+        replaying it
+        """
+        try:
+            os.unlink(self.get_path(location))
+        except FileNotFoundError:
+            pass
+        self.record_count = 0
+
+    def needs_compaction(self) -> bool:
+        return self.record_count >= COMPACT_THRESHOLD
+
+    def compact(self, location: str, pdata) -> int:
+        """
+        Replays the journal of the database at location into the open
+        shelf pdata, syncs the shelf and truncates the journal.
+
+        :returns: the number of records that were replayed
+        """
+        count = apply_records(pdata, self.replay(location))
+        pdata.sync()
+        self.discard(location)
+        if count:
+            logger.debug("Compacted %d journal records into %s", count, location)
+        return count
+
+
+def apply_records(pdata, records: Iterable[Record]) -> int:
+    """
+    Applies journal records to a shelf-like mapping
+
+    :returns: the number of records applied
+    """
+    count = 0
+    for op, shelf_key, value in records:
+        if op == _SET:
+            pdata[shelf_key] = value
+        elif shelf_key in pdata:
+            del pdata[shelf_key]
+        count += 1
+    return count
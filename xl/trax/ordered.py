@@ -0,0 +1,256 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Views of the tracks of a :class:`xl.trax.TrackDB` kept sorted by the
+levels of a collection tree, so that the nodes of the tree and the
+tracks under them are read without searching and sorting the tracks
+again.
+"""
+
+from bisect import bisect_left
+import threading
+from typing import Callable, Container, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from xl.trax.track import Track
+
+
+class _Last:
+    """
+    Compares greater than anything else, to find where the entries
+    starting with a node end
+    """
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return self is not other
+
+
+_LAST = _Last()
+
+
+class OrderedView:
+    """
+    The tracks of a :class:`xl.trax.TrackDB` sorted by the tags of each
+    level of a tree, like the levels of a collection panel order.
+
+    A node of the tree is a tuple with, for each level down to the node,
+    the sort values (see :meth:`xl.trax.Track.get_tag_sort`) of the tags
+    of that level. The root is the empty tuple. Tracks having the same
+    sort values are ordered by location.
+
+    Methods taking a node also take an optional last node, a later
+    sibling of it: the range of nodes from the first to the last one is
+    then used, as if it were a single node.
+
+    The view is sorted the first time it is used, and kept up to date
+    from then on by calling :meth:`add_tracks`, :meth:`remove_tracks`
+    and :meth:`update_track` as the tracks change.
+
+    :param get_tracks: returns all tracks to sort
+    :param levels: the tags to sort by, for each level
+    :param artist_compilations: passed to
+        :meth:`xl.trax.Track.get_tag_sort`
+    """
+
+    def __init__(
+        self,
+        get_tracks: Callable[[], Iterable[Track]],
+        levels: Sequence[Sequence[str]],
+        artist_compilations: bool = False,
+    ):
+        self._get_tracks = get_tracks
+        self.levels = tuple(tuple(tags) for tags in levels)
+        self.artist_compilations = artist_compilations
+        self._lock = threading.RLock()
+        # sorted keys, None until built, and the track of each key
+        self._keys: Optional[List[tuple]] = None
+        self._tracks: List[Track] = []
+        # track -> its key
+        self._track_keys: Dict[Track, tuple] = {}
+        self._locs: Dict[str, Track] = {}
+
+    def clear(self) -> None:
+        """
+        Forgets everything, the view is sorted again when it is next used
+        """
+        with self._lock:
+            self._keys = None
+            self._tracks = []
+            self._track_keys = {}
+            self._locs = {}
+
+    def get_key(self, track: Track) -> tuple:
+        """
+        Returns the leaf node of a track, followed by its location
+        """
+        artist_compilations = self.artist_compilations
+        return tuple(
+            tuple(
+                track.get_tag_sort(tag, artist_compilations=artist_compilations)
+                for tag in tags
+            )
+            for tags in self.levels
+        ) + (track.get_loc_for_io(),)
+
+    def get_count(
+        self,
+        first: tuple = (),
+        last: Optional[tuple] = None,
+        only: Optional[Container[Track]] = None,
+    ) -> int:
+        """
+        Returns the number of tracks under a node
+
+        :param only: if not None, only count the tracks it contains
+        """
+        with self._lock:
+            start, end = self.__get_range(first, last)
+            if only is None:
+                return end - start
+            return sum(1 for track in self._tracks[start:end] if track in only)
+
+    def get_tracks(
+        self,
+        first: tuple = (),
+        last: Optional[tuple] = None,
+        only: Optional[Container[Track]] = None,
+    ) -> List[Track]:
+        """
+        Returns the tracks under a node, in order
+
+        :param only: if not None, only return the tracks it contains
+        """
+        with self._lock:
+            start, end = self.__get_range(first, last)
+            tracks = self._tracks[start:end]
+        if only is not None:
+            tracks = [track for track in tracks if track in only]
+        return tracks
+
+    def get_children(
+        self,
+        first: tuple = (),
+        last: Optional[tuple] = None,
+        only: Optional[Container[Track]] = None,
+    ) -> List[Tuple[tuple, int, Track]]:
+        """
+        Returns the children of a node, in order, as (node, number of
+        tracks, first track) tuples. The children of nodes at the last
+        level are single tracks, their nodes ending with the location of
+        the track.
+
+        :param only: if not None, only count the tracks it contains, and
+            leave out children without any of them
+        """
+        depth = len(first)
+        children = []
+        with self._lock:
+            start, end = self.__get_range(first, last)
+            keys = self._keys
+            tracks = self._tracks
+            while start < end:
+                child = keys[start][: depth + 1]
+                child_end = bisect_left(keys, child + (_LAST,), start, end)
+                if only is None:
+                    children.append((child, child_end - start, tracks[start]))
+                else:
+                    matching = [t for t in tracks[start:child_end] if t in only]
+                    if matching:
+                        children.append((child, len(matching), matching[0]))
+                start = child_end
+        return children
+
+    def add_tracks(self, tracks: Iterable[Track]) -> None:
+        with self._lock:
+            if self._keys is None:
+                return
+            for track in tracks:
+                self.__add(track)
+
+    def remove_tracks(self, locations: Iterable[str]) -> None:
+        with self._lock:
+            if self._keys is None:
+                return
+            for loc in locations:
+                track = self._locs.get(loc)
+                if track is not None:
+                    self.__remove(track)
+
+    def update_track(self, track: Track) -> None:
+        """
+        Moves a track whose tags changed, if it is in the view
+        """
+        with self._lock:
+            key = self._track_keys.get(track)
+            if key is not None and key != self.get_key(track):
+                self.__remove(track)
+                self.__add(track)
+
+    def __get_range(self, first: tuple, last: Optional[tuple]) -> Tuple[int, int]:
+        if self._keys is None:
+            self.__build()
+        keys = self._keys
+        if not first:
+            return 0, len(keys)
+        start = bisect_left(keys, first)
+        end = bisect_left(keys, (last or first) + (_LAST,), start)
+        return start, end
+
+    def __build(self) -> None:
+        pairs = []
+        for track in self._get_tracks():
+            key = self.get_key(track)
+            if track not in self._track_keys:
+                self._track_keys[track] = key
+                self._locs[key[-1]] = track
+                pairs.append((key, track))
+        pairs.sort(key=lambda pair: pair[0])
+        self._keys = [pair[0] for pair in pairs]
+        self._tracks = [pair[1] for pair in pairs]
+
+    def __add(self, track: Track) -> None:
+        if track in self._track_keys:
+            self.__remove(track)
+        key = self.get_key(track)
+        self._track_keys[track] = key
+        self._locs[key[-1]] = track
+        pos = bisect_left(self._keys, key)
+        self._keys.insert(pos, key)
+        self._tracks.insert(pos, track)
+
+    def __remove(self, track: Track) -> None:
+        key = self._track_keys.pop(track)
+        if self._locs.get(key[-1]) is track:
+            del self._locs[key[-1]]
+        pos = bisect_left(self._keys, key)
+        while pos < len(self._keys) and self._keys[pos] == key:
+            if self._tracks[pos] is track:
+                del self._keys[pos]
+                del self._tracks[pos]
+                return
+            pos += 1
@@ -24,12 +24,15 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
+from collections import OrderedDict
+import functools
 import re
 from typing import Collection
 
+from xl.trax import fuzzy
 from xl.unicode import shave_marks
 
-__all__ = ['TracksMatcher', 'search_tracks']
+__all__ = ['TracksMatcher', 'SearchSession', 'search_tracks']
 
 
 class SearchResultTrack:
@@ -46,12 +49,20 @@ class SearchResultTrack:
         self.on_tags = []
 
 
+def _lower(value):
+    return value.lower()
+
+
+def _keep_case(value):
+    return value
+
+
 class _Matcher:
     """
     Base class for match conditions
     """
 
-    __slots__ = ['tag', 'content', 'lower']
+    __slots__ = ['tag', 'content', 'lower', '_lowered']
 
     def __init__(self, tag, content, lower):
         self.tag = tag
@@ -59,22 +70,34 @@ class _Matcher:
             content = lower(content)
         self.content = content
         self.lower = lower
+        # lowercased values are cached by the track
+        self._lowered = lower is _lower
 
     def match(self, srtrack):
-        vals = srtrack.track.get_tag_search(self.tag, format=False)
-        if vals == '__null__':
-            vals = None
-        if not isinstance(vals, list):
-            vals = [vals]
-
-        for item in vals:
-            if item is not None:
-                item = self.lower(item)
-
-            if self._matches(item):
+        if self._lowered:
+            matches = self._matches
+            values = srtrack.track.get_tag_search_values(self.tag, lower=True)
+        else:
+            matches = self._matches_value
+            values = srtrack.track.get_tag_search_values(self.tag)
+        for item in values:
+            if matches(item):
                 return True
         return False
 
+    def candidates(self, index):
+        """
+        Returns the set of tracks this condition can match, as found in
+        index (a :class:`xl.trax.index.TagIndex`), or None if any track
+        could match. Tracks in the set still have to be matched.
+        """
+        return None
+
+    def _matches_value(self, item):
+        if item is not None:
+            item = self.lower(item)
+        return self._matches(item)
+
     def _matches(self, value):
         raise NotImplementedError
 
@@ -98,6 +121,18 @@ class _ExactMatcher(_Matcher):
             newcontent = self.content
         return newvalue == newcontent
 
+    def candidates(self, index):
+        if self.tag.startswith("__") and self.content is not None:
+            try:
+                content = float(self.content)
+            except (TypeError, ValueError):
+                pass
+            else:
+                return index.find_range(
+                    self.tag, low=content - 0.0001, high=content + 0.0001
+                )
+        return index.find(self.tag, self._matches_value)
+
 
 class _InMatcher(_Matcher):
     """
@@ -112,24 +147,151 @@ class _InMatcher(_Matcher):
         except TypeError:
             return False
 
+    def candidates(self, index):
+        return index.find(self.tag, self._matches_value)
+
+
+def _required_literals(pattern):
+    """
+    Returns substrings that any string matched by the regular expression
+    pattern must contain, for example ``foo`` for ``\\bfoo\\b``. Only
+    the simplest constructs are understood: literals inside groups, and
+    patterns with alternatives or inline flags, give no substrings.
+
+    :returns: tuple of strings, possibly empty
+    """
+    if '|' in pattern or '(?' in pattern:
+        return ()
+    literals = []
+    run = []
+
+    def end_run():
+        if run:
+            literals.append(''.join(run))
+            del run[:]
+
+    depth = 0
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+            if i == n:
+                return ()
+            c = pattern[i]
+            if c.isalnum() or c == '_':
+                if c in 'xuUN' or c.isdigit():
+                    # escapes that take more characters, or backreferences
+                    end_run()
+                    return tuple(literals) if depth == 0 else ()
+                # character classes and assertions like \\d or \\b
+                if depth == 0:
+                    end_run()
+            elif depth == 0:
+                run.append(c)
+        elif c == '[':
+            if depth == 0:
+                end_run()
+            # skip the character set, a leading ] or ^] is part of it
+            i += 1
+            if i < n and pattern[i] == '^':
+                i += 1
+            if i < n and pattern[i] == ']':
+                i += 1
+            while i < n and pattern[i] != ']':
+                if pattern[i] == '\\':
+                    i += 1
+                i += 1
+        elif c == '(':
+            if depth == 0:
+                end_run()
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth < 0:
+                return ()
+        elif c in '*?{':
+            # the preceding character is optional
+            if depth == 0:
+                if run:
+                    run.pop()
+                end_run()
+            if c == '{':
+                end = pattern.find('}', i)
+                if end == -1:
+                    return ()
+                i = end
+        elif c in '+.^$':
+            if depth == 0:
+                end_run()
+        elif depth == 0:
+            run.append(c)
+        i += 1
+    end_run()
+    return tuple(literals)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_regex(pattern):
+    """
+    Returns the compiled pattern and its required literals, cached for
+    searches repeating the same patterns
+    """
+    return re.compile(pattern), _required_literals(pattern)
+
 
 class _RegexMatcher(_Matcher):
     """
     Condition for regular expression matches
     """
 
+    __slots__ = ['_re', '_literals']
+
     def __init__(self, tag, content, lower):
         _Matcher.__init__(self, tag, content, lower)
-        self._re = re.compile(content)
+        self._re, self._literals = _compile_regex(content)
 
     def _matches(self, value):
         if not value:
             return False
         try:
+            # substrings are much cheaper to look for than the pattern
+            for literal in self._literals:
+                if literal not in value:
+                    return False
             return self._re.search(value) is not None
         except TypeError:
             return False
 
+    def candidates(self, index):
+        return index.find(self.tag, self._matches_value)
+
+
+class _FuzzyMatcher(_Matcher):
+    """
+    Condition for similar matches, tolerating typos, see
+    :mod:`xl.trax.fuzzy`
+    """
+
+    __slots__ = ['_trigrams']
+
+    def __init__(self, tag, content, lower):
+        _Matcher.__init__(self, tag, content, lower)
+        self._trigrams = fuzzy.get_trigrams(content or '')
+
+    def _matches(self, value):
+        if not value or not self._trigrams:
+            return False
+        try:
+            shared = len(self._trigrams & fuzzy.get_trigrams(value))
+        except TypeError:
+            return False
+        return shared >= fuzzy.THRESHOLD * len(self._trigrams)
+
+    def candidates(self, index):
+        return {track for track, score in index.find_similar(self.tag, self.content)}
+
 
 class _GtMatcher(_Matcher):
     """
@@ -144,6 +306,13 @@ class _GtMatcher(_Matcher):
             return False
         return value > content
 
+    def candidates(self, index):
+        try:
+            content = float(self.content)
+        except (TypeError, ValueError):
+            return set()
+        return index.find_range(self.tag, low=content)
+
 
 class _LtMatcher(_Matcher):
     """
@@ -161,6 +330,14 @@ class _LtMatcher(_Matcher):
             return False
         return value < content
 
+    def candidates(self, index):
+        try:
+            content = float(self.content)
+        except (TypeError, ValueError):
+            return set()
+        # missing values compare as 0
+        return index.find_range(self.tag, high=content, missing=0)
+
 
 class _NotMetaMatcher:
     """
@@ -176,6 +353,9 @@ class _NotMetaMatcher:
     def match(self, srtrack):
         return not self.matcher.match(srtrack)
 
+    def candidates(self, index):
+        return None
+
 
 class _OrMetaMatcher:
     """
@@ -191,6 +371,15 @@ class _OrMetaMatcher:
     def match(self, srtrack):
         return self.left.match(srtrack) or self.right.match(srtrack)
 
+    def candidates(self, index):
+        left = _get_candidates(self.left, index)
+        if left is None:
+            return None
+        right = _get_candidates(self.right, index)
+        if right is None:
+            return None
+        return left | right
+
 
 class _MultiMetaMatcher:
     """
@@ -209,6 +398,9 @@ class _MultiMetaMatcher:
                 return False
         return True
 
+    def candidates(self, index):
+        return _intersect_candidates(self.matchers, index)
+
 
 class _ManyMultiMetaMatcher:
     """
@@ -239,6 +431,227 @@ class _ManyMultiMetaMatcher:
                     self.tags.update(ma.tags)
         return matched
 
+    def candidates(self, index):
+        found = set()
+        for ma in self.matchers:
+            tracks = _get_candidates(ma, index)
+            if tracks is None:
+                return None
+            found |= tracks
+        return found
+
+
+def _tokenize_query(search):
+    """
+    Turns a search string into a list of tokens, in a single pass.
+    Tokens are separated by spaces outside of quotes; quotes are
+    removed, and backslashes escape the next character except in
+    regular expressions.
+    """
+    search = " " + search + " "
+
+    tokens = []
+    current = []
+    in_quotes = False
+    in_regex = False
+    n = 0
+    length = len(search)
+    while n < length:
+        c = search[n]
+        if c == "\\":
+            if not in_regex:
+                n += 1
+            if n < length:
+                current.append(search[n])
+        elif in_quotes and c != "\"":
+            current.append(c)
+        elif c == "~":
+            in_regex = True
+            current.append(c)
+        elif c == "\"":
+            in_quotes = not in_quotes  # toggle
+        elif c == " ":
+            in_regex = False
+            tokens.append(''.join(current))
+            current = []
+        else:
+            current.append(c)
+        n += 1
+    return tokens
+
+
+def _group_tokens(tokens):
+    """
+    Turns the token list into a token hierarchy: ``( ... )`` groups
+    become ``("(", tokens)``, ``! x`` becomes ``("!", [x])`` and
+    ``x | y`` becomes ``("|", [x, y])``, NOT binding tighter than OR.
+    An unclosed group ends with the query.
+    """
+    stack = []
+    items = []
+    for token in tokens:
+        if token == "(":
+            stack.append(items)
+            items = []
+        elif token == ")" and stack:
+            inner = _reduce_operators(items)
+            items = stack.pop()
+            items.append(("(", inner))
+        else:
+            items.append(token)
+    while stack:
+        inner = _reduce_operators(items)
+        items = stack.pop()
+        items.append(("(", inner))
+    items = _reduce_operators(items)
+    # longer queries tend to reject more tracks, which speeds up
+    # processing, so we put them first.
+    items.sort(key=len)
+    return items
+
+
+def _reduce_operators(items):
+    """
+    Applies the NOT and then the OR operators of a list of tokens
+    """
+    reduced = []
+    i = 0
+    while i < len(items):
+        token = items[i]
+        if token == "!":
+            reduced.append(("!", items[i + 1 : i + 2]))
+            i += 2
+        else:
+            reduced.append(token)
+            i += 1
+
+    items = reduced
+    reduced = []
+    i = 0
+    while i < len(items):
+        token = items[i]
+        if token == "|" and reduced and i + 1 < len(items):
+            reduced.append(("|", [reduced.pop(), items[i + 1]]))
+            i += 2
+        else:
+            reduced.append(token)
+            i += 1
+    return reduced
+
+
+def _tokens_to_nodes(tokens, keyword_tags):
+    """
+    Converts a token hierarchy to the syntax tree of a query, a tuple of
+    nodes which are tuples themselves:
+
+    * ``(matcher_class, tag, content)`` for a condition on a tag
+    * ``('any', nodes)`` for a keyword, matched in any of keyword_tags
+    * ``('not', nodes)``, ``('or', nodes, nodes)`` and ``('and', nodes)``
+    """
+    nodes = []
+    for token in tokens:
+        if isinstance(token, tuple):
+            op, inner = token
+            if op == "!":
+                nodes.append(('not', _tokens_to_nodes(inner, keyword_tags)))
+            elif op == "|":
+                nodes.append(
+                    (
+                        'or',
+                        _tokens_to_nodes(inner[:1], keyword_tags),
+                        _tokens_to_nodes(inner[1:], keyword_tags),
+                    )
+                )
+            else:
+                nodes.append(('and', _tokens_to_nodes(inner, keyword_tags)))
+
+        elif token == '':
+            pass
+
+        # exact match in tag
+        elif "==" in token:
+            tag, content = token.split("==", 1)
+            if content == "__null__":
+                content = None
+            nodes.append((_ExactMatcher, tag, content))
+
+        # keyword in tag
+        elif "=" in token:
+            tag, content = token.split("=", 1)
+            nodes.append((_InMatcher, tag, content.strip().strip('"')))
+
+        elif ">" in token:
+            tag, content = token.split(">", 1)
+            nodes.append((_GtMatcher, tag, content.strip().strip('"')))
+
+        elif "<" in token:
+            tag, content = token.split("<", 1)
+            nodes.append((_LtMatcher, tag, content.strip().strip('"')))
+
+        # similar to a value of tag, or of any of keyword_tags
+        elif "~~" in token:
+            tag, content = token.split("~~", 1)
+            content = content.strip().strip('"')
+            if tag:
+                nodes.append((_FuzzyMatcher, tag, content))
+            else:
+                nodes.append(
+                    (
+                        'any',
+                        tuple((_FuzzyMatcher, tag, content) for tag in keyword_tags),
+                    )
+                )
+
+        elif "~" in token:
+            tag, content = token.split("~", 1)
+            nodes.append((_RegexMatcher, tag, content.strip().strip('"')))
+
+        # plain keyword
+        else:
+            content = token.strip().strip('"')
+            nodes.append(
+                ('any', tuple((_InMatcher, tag, content) for tag in keyword_tags))
+            )
+    return tuple(nodes)
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_query(search_string, case_sensitive, keyword_tags):
+    """
+    Parses a search string into the syntax tree described in
+    _tokens_to_nodes. The trees are cached, as the same queries are
+    often made many times, for example to expand the collection panel.
+
+    :param keyword_tags: tuple of tags
+    """
+    tokens = _tokenize_query(shave_marks(search_string))
+    return _tokens_to_nodes(_group_tokens(tokens), keyword_tags)
+
+
+def _nodes_to_matchers(nodes, lower):
+    """
+    Creates the matchers for a syntax tree made by _parse_query
+    """
+    matchers = []
+    for node in nodes:
+        kind = node[0]
+        if kind == 'not':
+            inner = _nodes_to_matchers(node[1], lower)
+            matchers.append(_NotMetaMatcher(_MultiMetaMatcher(inner)))
+        elif kind == 'or':
+            left = _nodes_to_matchers(node[1], lower)
+            right = _nodes_to_matchers(node[2], lower)
+            matchers.append(
+                _OrMetaMatcher(_MultiMetaMatcher(left), _MultiMetaMatcher(right))
+            )
+        elif kind == 'and':
+            matchers.append(_MultiMetaMatcher(_nodes_to_matchers(node[1], lower)))
+        elif kind == 'any':
+            matchers.append(_ManyMultiMetaMatcher(_nodes_to_matchers(node[1], lower)))
+        else:
+            matchers.append(kind(node[1], node[2], lower))
+    return matchers
+
 
 class TracksMatcher:
     """
@@ -246,7 +659,7 @@ class TracksMatcher:
     a given track matches those criteria.
     """
 
-    __slots__ = ['matchers', 'case_sensitive', 'keyword_tags']
+    __slots__ = ['matchers', 'case_sensitive', 'keyword_tags', '_compiled']
 
     def __init__(self, search_string, case_sensitive=True, keyword_tags=None):
         """
@@ -258,11 +671,12 @@ class TracksMatcher:
         """
         self.case_sensitive = case_sensitive
         self.keyword_tags = keyword_tags or []
-        search_string = shave_marks(search_string)
-        tokens = self.__tokenize_query(search_string)
-        tokens = self.__red(tokens)
-        tokens = self.__optimize_tokens(tokens)
-        self.matchers = self.__tokens_to_matchers(tokens)
+        nodes = _parse_query(
+            search_string, bool(case_sensitive), tuple(self.keyword_tags)
+        )
+        lower = _keep_case if case_sensitive else _lower
+        self.matchers = _nodes_to_matchers(nodes, lower)
+        self._compiled = None
 
     def append_matcher(self, matcher, or_match=False):
         '''Here so you can use playlist matchers. Probably needs better impl'''
@@ -270,6 +684,7 @@ class TracksMatcher:
             self.matchers.append(matcher)
         else:
             self.matchers[-1] = _OrMetaMatcher(self.matchers[-1], matcher)
+        self._compiled = None
 
     def prepend_matcher(self, matcher, or_match=False):
         '''Here so you can use playlist matchers. Probably needs better impl'''
@@ -277,223 +692,69 @@ class TracksMatcher:
             self.matchers.insert(0, matcher)
         else:
             self.matchers[0] = _OrMetaMatcher(matcher, self.matchers[0])
+        self._compiled = None
 
     def match(self, srtrack):
         """
         Determine whether a given SearchResultTrack's internal
         Track object matches this search condition.
         """
-        for ma in self.matchers:
-            if not ma.match(srtrack):
-                break
-            if ma.tag is not None:
-                if ma.tag not in srtrack.on_tags:
-                    srtrack.on_tags.append(ma.tag)
-            elif hasattr(ma, 'tags'):
-                for t in ma.tags:
-                    if t not in srtrack.on_tags:
-                        srtrack.on_tags.append(t)
-        else:
-            return True
-        return False
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self.compile()
+        return compiled(srtrack)
 
-    def __tokens_to_matchers(self, tokens, matchers=None):
-        """
-        Converts a token hierarchy to a list of matchers
+    def compile(self, index=None):
         """
-        if not matchers:
-            matchers = []
+        Turns the conditions into a single function used by
+        :meth:`match`, checking the conditions most likely to reject a
+        track first. Their likelihood is estimated from the statistics
+        of index (a :class:`xl.trax.index.TagIndex`) if given.
 
-        # if there's no more tokens, we're done
-        try:
-            token = tokens[0]
-        except IndexError:
-            return matchers
-
-        # is it a special operator?
-        if isinstance(token, list):
-            if len(token) == 1:
-                token = token[0]
-            subtoken = token[0]
-            # NOT
-            if subtoken == "!":
-                nots = self.__tokens_to_matchers(token[1])
-                matchers.append(_NotMetaMatcher(_MultiMetaMatcher(nots)))
-            # OR
-            elif subtoken == "|":
-                left = self.__tokens_to_matchers([token[1][0]])
-                right = self.__tokens_to_matchers([token[1][1]])
-                matchers.append(
-                    _OrMetaMatcher(_MultiMetaMatcher(left), _MultiMetaMatcher(right))
-                )
-            # ()
-            elif subtoken == "(":
-                inner = self.__tokens_to_matchers([token[1]])
-                matchers.append(_MultiMetaMatcher(inner))
-            else:
-                return matchers
-
-        elif token == '':
-            pass
-
-        # normal token
-        else:
-            if not self.case_sensitive:
-                lower = lambda x: x.lower()
-            else:
-                lower = lambda x: x
-
-            # TODO: this stuff is kinda repetitive, can we consolidate
-            # it? Maybe move some of this into the matcher classes?
-
-            # exact match in tag
-            if "==" in token:
-                tag, content = token.split("==", 1)
-                if content == "__null__":
-                    content = None
-                matcher = _ExactMatcher(tag, content, lower)
-                matchers.append(matcher)
-
-            # keyword in tag
-            elif "=" in token:
-                tag, content = token.split("=", 1)
-                content = content.strip().strip('"')
-                matcher = _InMatcher(tag, content, lower)
-                matchers.append(matcher)
-
-            elif ">" in token:
-                tag, content = token.split(">", 1)
-                content = content.strip().strip('"')
-                matcher = _GtMatcher(tag, content, lower)
-                matchers.append(matcher)
-
-            elif "<" in token:
-                tag, content = token.split("<", 1)
-                content = content.strip().strip('"')
-                matcher = _LtMatcher(tag, content, lower)
-                matchers.append(matcher)
-
-            elif "~" in token:
-                tag, content = token.split("~", 1)
-                content = content.strip().strip('"')
-                matcher = _RegexMatcher(tag, content, lower)
-                matchers.append(matcher)
-
-            # plain keyword
-            else:
-                content = token.strip().strip('"')
-                mmm = []
-                for tag in self.keyword_tags:
-                    matcher = _InMatcher(tag, content, lower)
-                    mmm.append(matcher)
-                matchers.append(_ManyMultiMetaMatcher(mmm))
+        :returns: the function, which takes a :class:`SearchResultTrack`
+        """
+        plan = _QueryPlanner(index).plan_and(self.matchers)
+        check = plan.func
+        # the tags to report in on_tags, once all conditions matched
+        tagged = [
+            ma for ma in self.matchers if ma.tag is not None or hasattr(ma, 'tags')
+        ]
+
+        def match(srtrack):
+            if not check(srtrack):
+                return False
+            on_tags = srtrack.on_tags
+            for ma in tagged:
+                if ma.tag is not None:
+                    if ma.tag not in on_tags:
+                        on_tags.append(ma.tag)
+                else:
+                    for t in ma.tags:
+                        if t not in on_tags:
+                            on_tags.append(t)
+            return True
 
-        return self.__tokens_to_matchers(tokens[1:], matchers)
+        self._compiled = match
+        return match
 
-    def __tokenize_query(self, search):
-        """
-        Turns a search string into a list of tokens.
+    def explain(self, index=None):
         """
-        search = " " + search + " "
-
-        tokens = []
-        newsearch = ""
-        in_quotes = False
-        in_regex = False
-        n = 0
-        while n < len(search):
-            c = search[n]
-            if c == "\\":
-                if not in_regex:
-                    n += 1
-                try:
-                    newsearch += search[n]
-                except IndexError:
-                    pass
-            elif in_quotes and c != "\"":
-                newsearch += c
-            elif c == "~":
-                in_regex = True
-                newsearch += c
-            elif c == "\"":
-                in_quotes = not in_quotes  # toggle
-                # newsearch += c
-            elif c in ["|", "!", "(", ")"]:
-                newsearch += c
-            elif c == " ":
-                in_regex = False
-                tokens.append(newsearch)
-                newsearch = ""
-            else:
-                newsearch += c
-            n += 1
-        return tokens
+        Describes how tracks are matched, for debugging: the conditions
+        in the order they are checked, with the estimated fraction of
+        tracks they match and their estimated cost.
 
-    def __red(self, tokens):
-        """
-        Turn the token list into a token list hierarchy that is
-        easier to parse.
+        :param index: see :meth:`compile`
+        :returns: a multi-line string
         """
-        # base case since we use recursion
-        if tokens == []:
-            return []
-
-        # handle parentheses
-        elif "(" in tokens:
-            num_found = 0
-            start = None
-            end = None
-            count = 0
-            for t in tokens:
-                if t == "(":
-                    if start is None:
-                        start = count
-                    else:
-                        num_found += 1
-                elif t == ")":
-                    if end is None and num_found == 0:
-                        end = count
-                    else:
-                        num_found -= 1
-                if start and end:
-                    break
-                count += 1
-            before = tokens[:start]
-            inside = self.__red(tokens[start + 1 : end])
-            after = tokens[end + 1 :]
-            tokens = before + [["(", inside]] + after
-
-        # handle NOT
-        elif "!" in tokens:
-            start = tokens.index("!")
-            end = start + 2
-            before = tokens[:start]
-            inside = tokens[start + 1 : end]
-            after = tokens[end:]
-            tokens = before + [["!", inside]] + after
-
-        # handle OR
-        elif "|" in tokens:
-            start = tokens.index("|")
-            inside = [tokens[start - 1], tokens[start + 1]]
-            before = tokens[: start - 1]
-            after = tokens[start + 2 :]
-            tokens = before + [["|", inside]] + after
-
-        # nothing special, so just return it
-        else:
-            return tokens
+        return _QueryPlanner(index).plan_and(self.matchers).explain()
 
-        return self.__red(tokens)
-
-    def __optimize_tokens(self, tokens):
+    def candidates(self, index):
         """
-        Attempt to optimize tokens, to speed up matching.
+        Returns the set of tracks this matcher can match, as found in
+        index (a :class:`xl.trax.index.TagIndex`), or None if any track
+        could match. Tracks in the set still have to be matched.
         """
-        # longer queries tend to reject more tracks, which speeds up
-        # processing, so we put them first.
-        tokens.sort(key=len)
-        return tokens
+        return _intersect_candidates(self.matchers, index)
 
 
 class TracksInList:
@@ -513,6 +774,9 @@ class TracksInList:
     def match(self, track):
         return track.track in self._tracks
 
+    def candidates(self, index):
+        return self._tracks
+
 
 class TracksNotInList(TracksInList):
     """
@@ -522,23 +786,291 @@ class TracksNotInList(TracksInList):
     def match(self, track):
         return track.track not in self._tracks
 
+    def candidates(self, index):
+        return None
+
+
+class _Plan:
+    """
+    A compiled condition: func(srtrack) checks it, selectivity is the
+    estimated fraction of tracks it matches, and cost the estimated
+    effort of checking it, in tag lookups.
+    """
+
+    __slots__ = ['label', 'func', 'selectivity', 'cost', 'children']
+
+    def __init__(self, label, func, selectivity, cost, children=()):
+        self.label = label
+        self.func = func
+        self.selectivity = min(max(selectivity, 0.0), 1.0)
+        self.cost = cost
+        self.children = children
+
+    def explain(self, depth=0):
+        lines = [
+            '%s%s  (selectivity %.3f, cost %.1f)'
+            % ('    ' * depth, self.label, self.selectivity, self.cost)
+        ]
+        for child in self.children:
+            lines.append(child.explain(depth + 1))
+        return '\n'.join(lines)
 
-def search_tracks(trackiter, trackmatchers: Collection[TracksMatcher]):
+
+class _QueryPlanner:
+    """
+    Compiles matchers into a tree of :class:`_Plan`, ordering the
+    conditions of ANDs and ORs so that the cheapest, most decisive ones
+    are checked first. Tags without statistics are assumed to be set on
+    most tracks, with a moderate number of distinct values.
+    """
+
+    _OPERATORS = {
+        '_ExactMatcher': '==',
+        '_InMatcher': '=',
+        '_GtMatcher': '>',
+        '_LtMatcher': '<',
+        '_RegexMatcher': '~',
+        '_FuzzyMatcher': '~~',
+    }
+
+    def __init__(self, index=None):
+        self.index = index
+
+    def _tag_stats(self, tag):
+        """
+        Returns the fraction of tracks having tag and its number of
+        distinct values
+        """
+        stats = None if self.index is None else self.index.get_stats(tag)
+        if stats is None or not stats.tracks:
+            return 0.9, 50
+        return stats.with_value / stats.tracks, max(stats.distinct, 1)
+
+    def plan(self, ma):
+        if isinstance(ma, _Matcher):
+            return self.plan_value(ma)
+        if isinstance(ma, _NotMetaMatcher):
+            inner = self.plan(ma.matcher)
+            func = inner.func
+            return _Plan(
+                'NOT',
+                lambda srtr: not func(srtr),
+                1 - inner.selectivity,
+                inner.cost,
+                [inner],
+            )
+        if isinstance(ma, _OrMetaMatcher):
+            return self.plan_or([ma.left, ma.right])
+        if isinstance(ma, _MultiMetaMatcher):
+            return self.plan_and(ma.matchers)
+        if isinstance(ma, _ManyMultiMetaMatcher):
+            return self.plan_keyword(ma)
+        if isinstance(ma, TracksInList):
+            tracks = ma._tracks
+            selectivity = len(tracks) / max(len(tracks), self._index_size(), 1)
+            if isinstance(ma, TracksNotInList):
+                return _Plan(
+                    'NOT IN LIST of %d tracks' % len(tracks),
+                    lambda srtr: srtr.track not in tracks,
+                    1 - selectivity,
+                    0.1,
+                )
+            return _Plan(
+                'IN LIST of %d tracks' % len(tracks),
+                lambda srtr: srtr.track in tracks,
+                selectivity,
+                0.1,
+            )
+        # a custom matcher, we know nothing about it
+        return _Plan(type(ma).__name__, ma.match, 0.5, 1.0)
+
+    def _index_size(self):
+        if self.index is None:
+            return 0
+        return self.index.get_size()
+
+    def plan_value(self, ma):
+        label = '%s%s%r' % (
+            ma.tag,
+            self._OPERATORS.get(type(ma).__name__, ' ? '),
+            ma.content,
+        )
+        present, distinct = self._tag_stats(ma.tag)
+        cost = 1.0
+        if isinstance(ma, _ExactMatcher):
+            if ma.content is None:
+                selectivity = 1 - present
+            else:
+                selectivity = present / distinct
+        elif isinstance(ma, _InMatcher):
+            # longer substrings are less likely to be found, but no less
+            # likely than the whole value
+            selectivity = max(
+                present / distinct, present * min(1, 2 / (1 + len(ma.content or '')))
+            )
+        elif isinstance(ma, _FuzzyMatcher):
+            # typos match a few more values than the exact text
+            selectivity = min(present, 5 * present / distinct)
+            cost = 2.0
+        elif isinstance(ma, _RegexMatcher):
+            if ma._literals:
+                # most values are rejected by the substring tests
+                longest = max(len(literal) for literal in ma._literals)
+                selectivity = max(
+                    present / distinct, present * min(1, 2 / (1 + longest))
+                )
+                cost = 1.5
+            else:
+                selectivity = present / 2
+                cost = 3.0
+        else:
+            selectivity = 0.5
+        return _Plan(label, ma.match, selectivity, cost)
+
+    def plan_and(self, matchers):
+        plans = [self.plan(ma) for ma in matchers]
+        # check the conditions with the lowest cost per rejected track first
+        plans.sort(key=lambda p: p.cost / max(1 - p.selectivity, 1e-6))
+        funcs = [p.func for p in plans]
+
+        def func(srtr):
+            for f in funcs:
+                if not f(srtr):
+                    return False
+            return True
+
+        selectivity = 1.0
+        cost = 0.0
+        for p in plans:
+            cost += selectivity * p.cost
+            selectivity *= p.selectivity
+        return _Plan('AND', func, selectivity, cost, plans)
+
+    def plan_or(self, matchers):
+        plans = [self.plan(ma) for ma in matchers]
+        # check the conditions with the lowest cost per accepted track first
+        plans.sort(key=lambda p: p.cost / max(p.selectivity, 1e-6))
+        funcs = [p.func for p in plans]
+
+        def func(srtr):
+            for f in funcs:
+                if f(srtr):
+                    return True
+            return False
+
+        rejected = 1.0
+        cost = 0.0
+        for p in plans:
+            cost += rejected * p.cost
+            rejected *= 1 - p.selectivity
+        return _Plan('OR', func, 1 - rejected, cost, plans)
+
+    def plan_keyword(self, ma):
+        # every condition is checked, to know which tags matched
+        plans = [self.plan(sub) for sub in ma.matchers]
+        checks = [(sub, p.func) for sub, p in zip(ma.matchers, plans)]
+
+        def func(srtr):
+            tags = set()
+            for sub, f in checks:
+                if f(srtr):
+                    if sub.tag:
+                        tags.add(sub.tag)
+                    elif getattr(sub, 'tags', None):
+                        tags.update(sub.tags)
+            ma.tags = tags
+            return bool(tags)
+
+        rejected = 1.0
+        for p in plans:
+            rejected *= 1 - p.selectivity
+        return _Plan('ANY TAG', func, 1 - rejected, sum(p.cost for p in plans), plans)
+
+
+def _get_candidates(matcher, index):
+    """
+    Returns matcher.candidates(index), or None for matchers that don't
+    know about indexes
+    """
+    candidates = getattr(matcher, 'candidates', None)
+    if candidates is None:
+        return None
+    return candidates(index)
+
+
+def _intersect_candidates(matchers, index):
+    """
+    Returns the tracks that all of matchers can match, or None if any
+    track could match
+    """
+    found = None
+    for ma in matchers:
+        tracks = _get_candidates(ma, index)
+        if tracks is not None:
+            found = tracks if found is None else found & tracks
+    return found
+
+
+def search_tracks(trackiter, trackmatchers: Collection[TracksMatcher], index=None):
     """
     Search a set of tracks for those that match specified conditions.
 
     :param trackiter: An iterable object returning Track objects
     :param trackmatchers: A list of TrackMatcher objects
+    :param index: A :class:`xl.trax.index.TagIndex` covering all tracks
+        of trackiter, used to skip tracks that cannot match. Defaults to
+        the index of trackiter if it is a :class:`xl.trax.TrackDB`.
     """
-    for srtr in trackiter:
+    match = prepare_search(trackiter, trackmatchers, index)
+    for item in trackiter:
+        srtr = match(item)
+        if srtr is not None:
+            yield srtr
+
+
+def prepare_search(trackiter, trackmatchers: Collection[TracksMatcher], index=None):
+    """
+    Prepares the search done by :func:`search_tracks`, for going through
+    the tracks separately, for example a few at a time.
+
+    Arguments are the same as for search_tracks.
+
+    :returns: a function taking an item of trackiter, and returning a
+        :class:`SearchResultTrack` if it matches, else None
+    """
+    # load the tags of lazily loaded tracks in one go, see TrackDB.hydrate
+    hydrate = getattr(trackiter, 'hydrate', None)
+    if hydrate is not None:
+        hydrate()
+    if index is None:
+        get_search_index = getattr(trackiter, 'get_search_index', None)
+        if get_search_index is not None:
+            index = get_search_index()
+    candidates = None
+    if index is not None:
+        candidates = _intersect_candidates(trackmatchers, index)
+        for tma in trackmatchers:
+            compile = getattr(tma, 'compile', None)
+            if compile is not None:
+                compile(index)
+
+    def match(srtr):
+        if candidates is not None:
+            track = srtr.track if isinstance(srtr, SearchResultTrack) else srtr
+            if track not in candidates:
+                return None
         if not isinstance(srtr, SearchResultTrack):
             srtr = SearchResultTrack(srtr)
-        if all(tma.match(srtr) for tma in trackmatchers):
-            yield srtr
+        for tma in trackmatchers:
+            if not tma.match(srtr):
+                return None
+        return srtr
+
+    return match
 
 
 def search_tracks_from_string(
-    trackiter, search_string, case_sensitive=True, keyword_tags=None
+    trackiter, search_string, case_sensitive=True, keyword_tags=None, index=None
 ):
     """
     Convenience wrapper around search_tracks that builds matchers
@@ -552,7 +1084,7 @@ def search_tracks_from_string(
             search_string, case_sensitive=case_sensitive, keyword_tags=keyword_tags
         )
     ]
-    return search_tracks(trackiter, matchers)
+    return search_tracks(trackiter, matchers, index=index)
 
 
 def match_track_from_string(
@@ -562,3 +1094,164 @@ def match_track_from_string(
         search_string, case_sensitive=case_sensitive, keyword_tags=keyword_tags
     )
     return matcher.match(SearchResultTrack(track))
+
+
+def _implies(a, b):
+    """
+    Returns whether every track matched by matcher a is also matched
+    by matcher b, as far as we can tell
+    """
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, _InMatcher):
+        return (
+            a.tag == b.tag
+            and a.lower is b.lower
+            and isinstance(a.content, str)
+            and isinstance(b.content, str)
+            and b.content in a.content
+        )
+    if isinstance(a, _Matcher):
+        return a.tag == b.tag and a.lower is b.lower and a.content == b.content
+    if isinstance(a, _ManyMultiMetaMatcher):
+        # keywords: whatever tag a matched, b matches the same tag
+        b_by_tag = {ma.tag: ma for ma in b.matchers}
+        return len(a.matchers) == len(b_by_tag) and all(
+            ma.tag in b_by_tag and _implies(ma, b_by_tag[ma.tag]) for ma in a.matchers
+        )
+    return False
+
+
+def _refines(new, old):
+    """
+    Returns whether all tracks matched by the TracksMatcher new are also
+    matched by the TracksMatcher old: every condition of old is implied
+    by a condition of new
+    """
+    return all(any(_implies(a, b) for a in new.matchers) for b in old.matchers)
+
+
+class SearchSession:
+    """
+    Runs one search after the other over the same tracks, as when
+    searching as you type. When a search only narrows down a recent
+    one, like "beatl" after "beat", only the results of that search
+    are gone through instead of all tracks.
+
+    :param tracks: the tracks to search, see :meth:`set_tracks`
+    :param index: see :meth:`set_tracks`
+    :param cache_size: the number of recent results to keep
+    """
+
+    def __init__(self, tracks=(), index=None, cache_size=8):
+        self.cache_size = cache_size
+        #: the TracksMatcher of the last search
+        self.matcher = None
+        self._tracks = list(tracks)
+        self._index = index
+        # (search_string, case_sensitive, keyword_tags) ->
+        #     (TracksMatcher, matched tracks)
+        self._results = OrderedDict()
+
+    def set_tracks(self, tracks, index=None):
+        """
+        Sets the tracks to search. Recent results are kept if the tracks
+        are the same as before.
+
+        :param tracks: an iterable of :class:`xl.trax.Track`
+        :param index: a :class:`xl.trax.index.TagIndex` covering all
+            tracks, or None
+        """
+        if tracks is not self._tracks:
+            tracks = list(tracks)
+            if tracks != self._tracks:
+                self.clear()
+            self._tracks = tracks
+        self._index = index
+
+    def clear(self):
+        """
+        Forgets recent results. Call this when the tags of the tracks
+        may have changed.
+        """
+        self._results.clear()
+
+    def search(self, search_string, case_sensitive=True, keyword_tags=None):
+        """
+        Searches the tracks. Arguments have the same meaning as the
+        corresponding arguments of :class:`TracksMatcher`.
+
+        :returns: a list of :class:`SearchResultTrack`, in the order of
+            the tracks
+        """
+        key, tracks, index = self._prepare(search_string, case_sensitive, keyword_tags)
+        results = list(search_tracks(tracks, [self.matcher], index=index))
+        self._add_results(key, self.matcher, results)
+        return results
+
+    def start_search(
+        self,
+        executor,
+        search_string,
+        case_sensitive=True,
+        keyword_tags=None,
+        on_results=None,
+        on_done=None,
+    ):
+        """
+        Searches the tracks a few at a time, on the main loop, see
+        :class:`xl.trax.SearchExecutor`. The search cancels the previous
+        one of the executor.
+
+        :param executor: the :class:`xl.trax.SearchExecutor` to run on
+        :param on_results: called with lists of the results found so far
+        :param on_done: called with the list of all results once the
+            search completes, unless it was cancelled
+        :returns: the :class:`xl.trax.SearchTask`
+        """
+        key, tracks, index = self._prepare(search_string, case_sensitive, keyword_tags)
+        matcher = self.matcher
+
+        def done(results):
+            self._add_results(key, matcher, results)
+            if on_done is not None:
+                on_done(results)
+
+        return executor.start(
+            tracks, [matcher], on_results=on_results, on_done=done, index=index
+        )
+
+    def _prepare(self, search_string, case_sensitive, keyword_tags):
+        """
+        Creates the matcher of a search, and finds what to search
+
+        :returns: (key of the results, tracks to search, index or None)
+        """
+        keyword_tags = tuple(keyword_tags or ())
+        key = (search_string, case_sensitive, frozenset(keyword_tags))
+        matcher = TracksMatcher(
+            search_string, case_sensitive=case_sensitive, keyword_tags=keyword_tags
+        )
+        self.matcher = matcher
+
+        base = None
+        cached = self._results.get(key)
+        if cached is not None:
+            base = cached[1]
+        else:
+            for (_string, cs, tags), (old, tracks) in self._results.items():
+                if cs != case_sensitive or tags != key[2]:
+                    continue
+                if (base is None or len(tracks) < len(base)) and _refines(matcher, old):
+                    base = tracks
+
+        if base is None:
+            return key, self._tracks, self._index
+        # small enough to go through without the index
+        return key, base, None
+
+    def _add_results(self, key, matcher, results):
+        self._results[key] = (matcher, [srtr.track for srtr in results])
+        self._results.move_to_end(key)
+        while len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
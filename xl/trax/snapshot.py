@@ -0,0 +1,180 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Compact snapshots of a :class:`xl.trax.TrackDB`.
+
+Loading a track database from its Berkeley DB shelf means unpickling one
+shelf entry per track. A snapshot stores the same content as a single
+versioned, columnar blob next to the database, which can be read and
+unpickled in one go. The tags of each track are pickled separately, so
+that they can be unpickled only when the track is first used (see the
+``collection/lazy_load`` option).
+
+Snapshots are tied to a generation number stored in the shelf, which is
+increased whenever the track data in the shelf changes. A snapshot whose
+generation does not match the shelf is stale and is not used.
+"""
+
+import logging
+import os
+import pickle
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+#: Suffix appended to the database location to get the snapshot location
+SNAPSHOT_SUFFIX = '-snapshot'
+
+#: Version of the snapshot format. Snapshots with a different version
+#: are ignored and rebuilt.
+SNAPSHOT_VERSION = 2
+
+#: Shelf key holding the generation of the track data in the shelf
+GENERATION_KEY = '_generation'
+
+
+class PackedTags:
+    """
+    The tags of a track as stored in a snapshot
+    """
+
+    __slots__ = ('loc', 'data')
+
+    def __init__(self, loc: str, data: bytes):
+        #: the location of the track
+        self.loc = loc
+        #: the pickled tags
+        self.data = data
+
+    def unpack(self) -> dict:
+        return pickle.loads(self.data)
+
+
+def pack_tags(tags: dict) -> bytes:
+    """
+    Pickles the tags of a track for storing in a snapshot
+    """
+    return pickle.dumps(tags, pickle.HIGHEST_PROTOCOL)
+
+
+def get_path(location: str) -> str:
+    """
+    Returns the location of the snapshot belonging to a database
+    """
+    return location + SNAPSHOT_SUFFIX
+
+
+def write_snapshot(
+    location: str,
+    generation: int,
+    attrs: Dict[str, object],
+    tracks: Iterable[Tuple[str, bytes, int, dict]],
+) -> None:
+    """
+    Writes a snapshot for the database at location
+
+    :param generation: the generation of the shelf this snapshot matches
+    :param attrs: attributes of the TrackDB, by shelf key
+    :param tracks: (location, tags, key, attrs) tuples; the tags can
+        be already packed by :func:`pack_tags`
+    """
+    locs = []
+    tags = []
+    keys = []
+    track_attrs = []
+    for loc, t, key, a in tracks:
+        locs.append(loc)
+        tags.append(t if isinstance(t, bytes) else pack_tags(t))
+        keys.append(key)
+        track_attrs.append(a)
+
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'generation': generation,
+        'attrs': attrs,
+        'locs': locs,
+        'tags': tags,
+        'keys': keys,
+        'track_attrs': track_attrs,
+    }
+
+    path = get_path(location)
+    new_path = path + '.new'
+    with open(new_path, 'wb') as fp:
+        pickle.dump(data, fp, pickle.HIGHEST_PROTOCOL)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(new_path, path)
+    logger.debug("Wrote snapshot of %d tracks to %s", len(keys), path)
+
+
+def read_snapshot(location: str, generation: int) -> Optional[Dict[str, object]]:
+    """
+    Reads the snapshot for the database at location.
+
+    :param generation: the current generation of the shelf
+    :returns: a mapping with the same content the shelf had when the
+        snapshot was written, except that the tags of tracks are
+        :class:`PackedTags`, or None if there is no usable snapshot
+    """
+    path = get_path(location)
+    try:
+        with open(path, 'rb') as fp:
+            data = pickle.loads(fp.read())
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("Could not read snapshot %s", path, exc_info=True)
+        return None
+
+    try:
+        if data['version'] != SNAPSHOT_VERSION:
+            logger.debug("Ignoring snapshot %s with old format", path)
+            return None
+        if data['generation'] != generation:
+            logger.debug("Ignoring stale snapshot %s", path)
+            return None
+
+        content = dict(data['attrs'])
+        for loc, tags, key, attrs in zip(
+            data['locs'], data['tags'], data['keys'], data['track_attrs']
+        ):
+            content["tracks-%s" % key] = (PackedTags(loc, tags), key, attrs)
+    except Exception:
+        logger.warning("Invalid snapshot %s", path, exc_info=True)
+        return None
+
+    return content
+
+
+def delete_snapshot(location: str) -> None:
+    """
+    Deletes the snapshot for the database at location, if any
+    """
+    try:
+        os.unlink(get_path(location))
+    except FileNotFoundError:
+        pass
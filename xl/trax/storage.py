@@ -0,0 +1,330 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Storage engines for :class:`xl.trax.TrackDB`.
+
+A storage engine opens the database at a location as a shelf-like
+mapping: attributes of the TrackDB are stored under their name, and each
+track under ``"tracks-<key>"`` as a ``(tags, key, attrs)`` tuple.
+
+The default engine is a Berkeley DB shelf of pickles. Saves to it go
+through a journal and a snapshot (see :mod:`xl.trax.journal` and
+:mod:`xl.trax.snapshot`). The SQLite engine instead writes changes
+directly, in one transaction per save, and keeps commonly searched tags
+in indexed columns. The engine is chosen with the
+``collection/storage`` option.
+"""
+
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+from typing import Dict, Iterator, Optional
+
+from xl import common, settings
+from xl.trax.snapshot import PackedTags
+
+logger = logging.getLogger(__name__)
+
+
+class ShelfStorage:
+    """
+    Stores a TrackDB in a Berkeley DB shelf
+    """
+
+    name = 'shelf'
+    #: whether saves should go through the journal and snapshot
+    journaled = True
+
+    def open(self, location: str):
+        return common.open_shelf(location)
+
+    def backup(self, location: str, pdata, suffix: str) -> None:
+        """
+        Copies the database at location, open as pdata, next to it
+        """
+        shutil.copyfile(location, location + suffix)
+
+
+class SQLiteStorage:
+    """
+    Stores a TrackDB in an SQLite database next to the location
+    """
+
+    name = 'sqlite'
+    journaled = False
+
+    def open(self, location: str) -> 'SQLiteShelf':
+        path = get_sqlite_path(location)
+        if not os.path.exists(path) and os.path.exists(location):
+            from xl.migrations.database.to_sqlite import migrate
+
+            migrate(location, path)
+        return SQLiteShelf(path)
+
+    def backup(self, location: str, pdata: 'SQLiteShelf', suffix: str) -> None:
+        pdata.backup(get_sqlite_path(location) + suffix)
+
+
+#: Available storage engines, by name
+STORAGES = {storage.name: storage for storage in (ShelfStorage, SQLiteStorage)}
+
+
+def get_storage(name: Optional[str] = None):
+    """
+    Returns the storage engine with the given name, or the one set in
+    the ``collection/storage`` option
+    """
+    if name is None:
+        name = settings.get_option('collection/storage', ShelfStorage.name)
+    try:
+        return STORAGES[name]()
+    except KeyError:
+        logger.warning("Unknown storage engine %r, using the default", name)
+        return ShelfStorage()
+
+
+#: Suffix appended to the database location to get the SQLite database
+SQLITE_SUFFIX = '-sqlite'
+
+#: Version of the SQLite schema, stored as its user_version
+SQLITE_SCHEMA_VERSION = 1
+
+#: Indexed columns of the tracks table, by the tag they hold
+SQLITE_COLUMNS = {
+    '__loc': 'loc',
+    'artist': 'artist',
+    'album': 'album',
+    'albumartist': 'albumartist',
+    'genre': 'genre',
+    '__date_added': 'date_added',
+    '__rating': 'rating',
+    '__playcount': 'playcount',
+}
+
+_TRACK_PREFIX = 'tracks-'
+
+
+def get_sqlite_path(location: str) -> str:
+    """
+    Returns the location of the SQLite database belonging to a TrackDB
+    """
+    return location + SQLITE_SUFFIX
+
+
+def _column_value(value):
+    """
+    Returns the value of a tag as stored in an indexed column
+    """
+    if isinstance(value, list):
+        if not value:
+            return None
+        if len(value) == 1:
+            value = value[0]
+        else:
+            return ' / '.join(str(v) for v in value)
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+class SQLiteShelf:
+    """
+    A shelf-like mapping stored in an SQLite database.
+
+    Tracks go to the tracks table, which has indexed columns for the tags
+    in SQLITE_COLUMNS; everything else goes to the meta table. Changes
+    are written in a single transaction, which is committed by sync().
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version > SQLITE_SCHEMA_VERSION:
+            self._conn.close()
+            raise common.VersionError(
+                "%s was created on a newer Exaile version." % path
+            )
+        if version < SQLITE_SCHEMA_VERSION:
+            self._create_schema()
+
+    def _create_schema(self) -> None:
+        columns = ', '.join(
+            '%s %s' % (column, 'NUMERIC' if tag.startswith('__') else 'TEXT')
+            for tag, column in SQLITE_COLUMNS.items()
+            if column != 'loc'
+        )
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS tracks ('
+                'key INTEGER PRIMARY KEY, loc TEXT NOT NULL, %s, '
+                'tags BLOB NOT NULL, attrs BLOB NOT NULL)' % columns
+            )
+            for column in SQLITE_COLUMNS.values():
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS tracks_%s ON tracks (%s)'
+                    % (column, column)
+                )
+            self._conn.execute('PRAGMA user_version=%d' % SQLITE_SCHEMA_VERSION)
+
+    @staticmethod
+    def _track_key(key: str) -> Optional[int]:
+        if key.startswith(_TRACK_PREFIX):
+            try:
+                return int(key[len(_TRACK_PREFIX) :])
+            except ValueError:
+                pass
+        return None
+
+    def __getitem__(self, key: str):
+        track_key = self._track_key(key)
+        if track_key is None:
+            row = self._conn.execute(
+                'SELECT value FROM meta WHERE key=?', (key,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            return pickle.loads(row[0])
+
+        row = self._conn.execute(
+            'SELECT tags, attrs FROM tracks WHERE key=?', (track_key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return (pickle.loads(row[0]), track_key, pickle.loads(row[1]))
+
+    def __setitem__(self, key: str, value) -> None:
+        track_key = self._track_key(key)
+        if track_key is None:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+            )
+            return
+
+        tags, _key, attrs = value
+        columns = list(SQLITE_COLUMNS.values())
+        self._conn.execute(
+            'INSERT OR REPLACE INTO tracks (key, %s, tags, attrs) VALUES (?, %s)'
+            % (', '.join(columns), ', '.join('?' * (len(columns) + 2))),
+            [track_key]
+            + [_column_value(tags.get(tag)) for tag in SQLITE_COLUMNS]
+            + [
+                pickle.dumps(tags, pickle.HIGHEST_PROTOCOL),
+                pickle.dumps(attrs, pickle.HIGHEST_PROTOCOL),
+            ],
+        )
+
+    def __delitem__(self, key: str) -> None:
+        track_key = self._track_key(key)
+        if track_key is None:
+            cursor = self._conn.execute('DELETE FROM meta WHERE key=?', (key,))
+        else:
+            cursor = self._conn.execute('DELETE FROM tracks WHERE key=?', (track_key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        track_key = self._track_key(key)
+        if track_key is None:
+            cursor = self._conn.execute('SELECT 1 FROM meta WHERE key=?', (key,))
+        else:
+            cursor = self._conn.execute(
+                'SELECT 1 FROM tracks WHERE key=?', (track_key,)
+            )
+        return cursor.fetchone() is not None
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> Iterator[str]:
+        for (key,) in self._conn.execute('SELECT key FROM meta').fetchall():
+            yield key
+        for (key,) in self._conn.execute('SELECT key FROM tracks').fetchall():
+            yield '%s%d' % (_TRACK_PREFIX, key)
+
+    __iter__ = keys
+
+    def __len__(self) -> int:
+        return sum(
+            self._conn.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+            for table in ('meta', 'tracks')
+        )
+
+    def read_all(self) -> Dict[str, object]:
+        """
+        Reads everything in one go
+
+        :returns: a mapping like the one returned by
+            :func:`xl.trax.snapshot.read_snapshot`, where the tags of
+            tracks are :class:`xl.trax.snapshot.PackedTags`
+        """
+        content = {
+            key: pickle.loads(value)
+            for key, value in self._conn.execute('SELECT key, value FROM meta')
+        }
+        for key, loc, tags, attrs in self._conn.execute(
+            'SELECT key, loc, tags, attrs FROM tracks'
+        ):
+            content['%s%d' % (_TRACK_PREFIX, key)] = (
+                PackedTags(loc, tags),
+                key,
+                pickle.loads(attrs),
+            )
+        return content
+
+    def sync(self) -> None:
+        """
+        Commits the changes made so far
+        """
+        self._conn.commit()
+
+    def backup(self, path: str) -> None:
+        """
+        Copies the database to path, including the changes that are
+        only in its write-ahead log
+        """
+        self._conn.commit()
+        target = sqlite3.connect(path)
+        try:
+            self._conn.backup(target)
+        finally:
+            target.close()
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
@@ -25,12 +25,26 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
-from copy import deepcopy
+from collections import OrderedDict
 import logging
 import operator
+import pickle
 import re
+import sys
+import threading
 import time
-from typing import Dict, Generic, List, Optional, TypeVar, Union
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Generic,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 import unicodedata
 import weakref
 
@@ -42,6 +56,7 @@ import xl.unicode
 from xl import event, metadata, settings
 from xl.metadata.tags import disk_tags
 from xl.nls import gettext as _
+from xl.trax.uri import canonicalize, canonicalize_arg, uri_to_path
 from xl.unicode import shave_marks
 
 logger = logging.getLogger(__name__)
@@ -77,6 +92,60 @@ _no_set_raw = {'__basename', '__loc'} | disk_tags
 
 _unset = object()
 
+# tags whose values are rarely shared between tracks, so not worth interning
+_no_intern = {'__loc', 'title', 'lyrics', 'comment'}
+
+_single_list_size = sys.getsizeof([None])
+
+
+def _compact_value(tag, value):
+    """
+    Returns the value of a tag in the form it is stored in by Track.
+
+    Strings are interned, so that tracks with the same artist, album etc.
+    share them. Non-internal tags with a single string value are stored
+    as that string instead of a list.
+    """
+    if value.__class__ is list:
+        if tag in _no_intern:
+            value = list(value)
+        else:
+            value = [sys.intern(v) if v.__class__ is str else v for v in value]
+        if len(value) == 1 and value[0].__class__ is str and tag[:2] != '__':
+            return value[0]
+        return value
+    if value.__class__ is str and tag not in _no_intern:
+        return sys.intern(value)
+    return value
+
+
+def _compact_tags(tags):
+    """
+    Returns a copy of tags in the form they are stored in by Track
+    """
+    return {sys.intern(tag): _compact_value(tag, value) for tag, value in tags.items()}
+
+
+def _expand_tags(tags):
+    """
+    Returns a copy of tags stored by Track, in which all non-internal
+    tags are lists again
+    """
+    return {
+        tag: [value] if value.__class__ is str and tag[:2] != '__' else value
+        for tag, value in tags.items()
+    }
+
+
+def _shared_size(value, seen):
+    """
+    Returns the size of value if the same object was seen before
+    """
+    if id(value) in seen:
+        return sys.getsizeof(value)
+    seen.add(id(value))
+    return 0
+
 
 class _MetadataCacher(Generic[_K, _V]):
     """Time- and size-limited LRU cache"""
@@ -149,6 +218,170 @@ class _MetadataCacher(Generic[_K, _V]):
 _CACHER: _MetadataCacher['Track', BaseFormat] = _MetadataCacher()
 
 
+class _TagValueCache:
+    """
+    Size-limited cache of values computed from the tags of tracks, such
+    as those returned by Track.get_tag_search_values, so that searches
+    and sorts don't normalize the same tags over and over again. Entries
+    are grouped by track, so that they can be dropped at once when the
+    tags of a track change or it is removed from a TrackDB.
+
+    Tracks are only referenced weakly, so that the cache doesn't keep
+    them alive. Once the cache is full, the tracks whose values were used
+    least recently are evicted.
+    """
+
+    def __init__(self, maxentries: int = 200000):
+        """
+        :param maxentries: maximum number of tag values to cache
+        """
+        self.maxentries = maxentries
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        # weak references to tracks, least recently used first
+        self._tracks: 'OrderedDict[weakref.ref, Dict[tuple, Any]]' = OrderedDict()
+        # references of tracks that are gone, dropped on the next call;
+        # they are dead by the time they are appended, which may happen
+        # while the lock is held
+        self._dead: List[weakref.ref] = []
+        self._lock = threading.Lock()
+
+    def __drop_dead(self) -> None:
+        while self._dead:
+            entries = self._tracks.pop(self._dead.pop(), None)
+            if entries is not None:
+                self._size -= len(entries)
+
+    def get(self, track: 'Track', key: tuple) -> Optional[Any]:
+        with self._lock:
+            ref = weakref.ref(track)
+            entries = self._tracks.get(ref)
+            if entries is not None:
+                values = entries.get(key)
+                if values is not None:
+                    self._tracks.move_to_end(ref)
+                    self.hits += 1
+                    return values
+            self.misses += 1
+            return None
+
+    def add(self, track: 'Track', key: tuple, values: Any) -> None:
+        with self._lock:
+            self.__drop_dead()
+            if self.maxentries <= 0:
+                return
+            ref = weakref.ref(track)
+            entries = self._tracks.get(ref)
+            if entries is None:
+                # only the stored reference gets the callback
+                ref = weakref.ref(track, self._dead.append)
+                entries = self._tracks[ref] = {}
+            else:
+                self._tracks.move_to_end(ref)
+            if key not in entries:
+                self._size += 1
+            entries[key] = values
+            while self._size > self.maxentries:
+                _ref, evicted = self._tracks.popitem(last=False)
+                self._size -= len(evicted)
+
+    def remove(self, track: 'Track') -> None:
+        with self._lock:
+            self.__drop_dead()
+            entries = self._tracks.pop(weakref.ref(track), None)
+            if entries is not None:
+                self._size -= len(entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tracks = OrderedDict()
+            self._dead = []
+            self._size = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            self.__drop_dead()
+            return {'hits': self.hits, 'misses': self.misses, 'size': self._size}
+
+
+#: Held while loading the tags of a track created by Track._from_packed
+_HYDRATE_LOCK = threading.Lock()
+
+#: Held while changing the tracks whose scan is deferred, see
+#: Track._defer_scans
+_PLACEHOLDER_LOCK = threading.Lock()
+
+#: Cache of normalized tag values used by searches
+_SEARCH_CACHE = _TagValueCache()
+
+#: Cache of the values returned by Track.get_tag_sort
+_SORT_CACHE = _TagValueCache(maxentries=500000)
+_SORT_KEYS: Dict[tuple, tuple] = {}
+
+
+class FileTags(NamedTuple):
+    """
+    Tags read from a file by :func:`read_file_tags`
+    """
+
+    #: the tags, as set by :meth:`Track.set_tags`
+    tags: Dict[str, Any]
+    #: the tags the format can hold, or None if it can hold any tag
+    supported: Optional[FrozenSet[str]]
+
+
+def _read_file_tags(
+    loc: str, modified: float = 0
+) -> Union[bool, Tuple[FileTags, BaseFormat]]:
+    try:
+        # Retrieve file specific metadata
+        gloc = Gio.File.new_for_uri(loc)
+        mtime = (
+            gloc.query_info("time::modified", Gio.FileQueryInfoFlags.NONE, None)
+            .get_modification_date_time()
+            .to_unix()
+        )
+        if modified >= mtime:
+            return True
+
+        f = metadata.get_format(loc)
+        if f is None:
+            return False
+
+        # Read the tags
+        ntags = f.read_all()
+        ntags['__modified'] = mtime
+
+        # TODO: this probably breaks on non-local files
+        ntags['__basedir'] = gloc.get_parent().get_path()
+
+        supported = None if f.others else frozenset(f.tag_mapping)
+        return FileTags(ntags, supported), f
+    except Exception:
+        logger.exception("Error reading tags for %s", loc)
+        return False
+
+
+def read_file_tags(loc: str, modified: float = 0) -> Union[bool, FileTags]:
+    """
+    Reads the tags of a file, like :meth:`Track.read_tags` but without
+    a :class:`Track`, so that files can be read by worker threads or
+    processes and the tags applied later by :meth:`Track.set_file_tags`.
+
+    :param loc: the location of the file
+    :param modified: modification time the tags were last read at, the
+        tags are not read unless the file was modified since
+
+    :returns: False if unsuccessful, True if the file was not read
+        because it has not been modified, and the tags otherwise
+    """
+    result = _read_file_tags(loc, modified)
+    if isinstance(result, tuple):
+        return result[0]
+    return result
+
+
 class Track:
     """
     Represents a single track.
@@ -157,6 +390,7 @@ class Track:
     # save a little memory this way
     __slots__ = [
         "__tags",
+        "__packed",
         "_scan_valid",
         "_dirty",
         "__weakref__",
@@ -165,6 +399,13 @@ class Track:
     ]
     # this is used to enforce the one-track-per-uri rule
     __tracksdict = weakref.WeakValueDictionary()
+    # objects (usually TrackDBs) that want to know when a track's tags
+    # change, even if no event is emitted. See _add_dirty_watcher
+    __dirty_watchers = weakref.WeakSet()
+    # tracks created while a TrackDB is loaded in the background, which
+    # take their tags from it rather than from their file. See _defer_scans
+    __placeholders = weakref.WeakSet()
+    __deferred_scans = 0
     # store a copy of the settings values here - much faster (0.25 cpu
     # seconds) (see _the_cuts_cb)
     __the_cuts = settings.get_option('collection/strip_list', [])
@@ -191,7 +432,8 @@ class Track:
         # TrackDB to get loaded takes precedence, and any data in the
         # second TrackDB is consequently ignored. Thus if at all
         # possible, Tracks should NOT be persisted in more than one
-        # TrackDB at a time.
+        # TrackDB at a time. Tracks created while a TrackDB is loaded in
+        # the background are filled in by it, see _defer_scans.
         unpickles = None
         if uri is None:
             if len(args) > 2:
@@ -202,7 +444,7 @@ class Track:
                 uri = unpickles.get("__loc")
 
         if uri is not None:
-            uri = Gio.File.new_for_uri(uri).get_uri()
+            uri = canonicalize(uri)
             try:
                 tr = cls.__tracksdict[uri]
                 tr._init = False
@@ -218,7 +460,7 @@ class Track:
                     else:
                         unpickles = kwargs.get("_unpickles")
 
-                if unpickles is not None:
+                if unpickles is not None and not tr.__fill_placeholder(unpickles):
                     tags = tr.list_tags()
                     to_set = {
                         tag: values
@@ -255,6 +497,8 @@ class Track:
             return
 
         self.__tags = {}
+        # pickled tags that have not been loaded yet, see _from_packed
+        self.__packed = None
         self._scan_valid = None  # whether our last tag read attempt worked
         self._is_supported = None
 
@@ -268,11 +512,39 @@ class Track:
         elif uri:
             # notify isn't needed here because this is a new track
             self.set_loc(uri, notify_changed=False)
-            if scan:
+            if scan and not self.__defer_scan():
                 self.read_tags(notify_changed=False)
         else:
             raise ValueError("Cannot create a Track from nothing")
 
+    def __defer_scan(self) -> bool:
+        """
+        Leaves reading the tags of a new local track for later while a
+        TrackDB that may have them is loaded, see _defer_scans
+
+        :returns: whether the tags are to be read later
+        """
+        with _PLACEHOLDER_LOCK:
+            if not Track.__deferred_scans or not self.is_local():
+                return False
+            Track.__placeholders.add(self)
+            return True
+
+    def __fill_placeholder(self, pickle_obj) -> bool:
+        """
+        Takes the tags of a track whose scan was deferred from the first
+        TrackDB loaded with it
+
+        :returns: whether the track was waiting for its tags
+        """
+        with _PLACEHOLDER_LOCK:
+            if self not in Track.__placeholders:
+                return False
+            Track.__placeholders.discard(self)
+        self._unpickles(pickle_obj)
+        event.log_event('track_tags_changed', self, set(pickle_obj) - {'__loc'})
+        return True
+
     def __register(self):
         """
         Register this instance into the global registry of Track
@@ -296,9 +568,11 @@ class Track:
 
         :param loc: the location, as either a uri or a file path.
         """
+        if self.__packed is not None:
+            self._hydrate()
         self.__unregister()
-        gloc = Gio.File.new_for_commandline_arg(loc)
-        self.__tags['__loc'] = gloc.get_uri()
+        self.__tags['__loc'] = canonicalize_arg(loc)
+        self._clear_cached_values()
         self.__register()
         if notify_changed:
             event.log_event('track_tags_changed', self, {'__loc'})
@@ -327,7 +601,7 @@ class Track:
         :returns: the file path or None
         :rtype: string or NoneType
         """
-        return Gio.File.new_for_uri(self.get_loc_for_io()).get_path()
+        return uri_to_path(self.get_loc_for_io())
 
     def get_basename(self):
         """
@@ -369,7 +643,9 @@ class Track:
             f = metadata.get_format(self.get_loc_for_io())
             if f is None:
                 return False  # not a supported type
-            f.write_tags(self.__tags)
+            if self.__packed is not None:
+                self._hydrate()
+            f.write_tags(_expand_tags(self.__tags))
 
             # now that we've written the tags to disk, remove any tags that the
             # user asked to be deleted
@@ -393,7 +669,8 @@ class Track:
         :param force: If not True, then only read the tags if the file has
                       be modified.
 
-        Returns False if unsuccessful, and a Format object from
+        Returns False if unsuccessful, True if the file was not read
+        because it has not been modified, and a Format object from
         `xl.metadata` otherwise.
         """
 
@@ -401,56 +678,57 @@ class Track:
             self._scan_valid = False
             return False
 
-        loc = self.get_loc_for_io()
-        try:
-            # Retrieve file specific metadata
-            gloc = Gio.File.new_for_uri(loc)
-            mtime = (
-                gloc.query_info("time::modified", Gio.FileQueryInfoFlags.NONE, None)
-                .get_modification_date_time()
-                .to_unix()
-            )
-            f = metadata.get_format(loc)
-            if not force and self.__tags.get('__modified', 0) >= mtime:
-                return f
-
-            # Read the tags
-            ntags = f.read_all()
-            ntags['__modified'] = mtime
+        if self.__packed is not None:
+            self._hydrate()
+        modified = 0 if force else self.__tags.get('__modified', 0)
+        result = _read_file_tags(self.get_loc_for_io(), modified)
+        if result is True:
+            return True
+        if result is False:
+            self._scan_valid = False
+            return False
+        file_tags, f = result
+        self.set_file_tags(file_tags, notify_changed=notify_changed)
+        return f
 
-            # TODO: this probably breaks on non-local files
-            ntags['__basedir'] = gloc.get_parent().get_path()
+    def set_file_tags(self, file_tags: FileTags, notify_changed=True):
+        """
+        Sets the tags read from the file of this Track by
+        :func:`read_file_tags`, removing those that are no longer in
+        the file.
+        """
+        ntags = dict(file_tags.tags)
+        if '__rating' in ntags and settings.get_option(
+            'collection/write_rating_to_audio_file_metadata', False
+        ):
+            ntags['__rating'] = int(ntags['__rating'][0])
 
-            if '__rating' in ntags and settings.get_option(
-                'collection/write_rating_to_audio_file_metadata', False
-            ):
-                ntags['__rating'] = int(ntags['__rating'][0])
+        if self.__packed is not None:
+            self._hydrate()
+        if Track.__deferred_scans:
+            with _PLACEHOLDER_LOCK:
+                Track.__placeholders.discard(self)
 
-            # remove tags that could be in the file, but are in fact not
-            # in the file. Retain tags in the DB that aren't supported by
-            # the file format.
+        # remove tags that could be in the file, but are in fact not
+        # in the file. Retain tags in the DB that aren't supported by
+        # the file format.
 
-            nkeys = set(ntags.keys())
-            ekeys = {k for k in self.__tags if not k.startswith('__')}
+        nkeys = set(ntags.keys())
+        ekeys = {k for k in self.__tags if not k.startswith('__')}
 
-            # delete anything that wasn't in the new tags
-            to_del = ekeys - nkeys
+        # delete anything that wasn't in the new tags
+        to_del = ekeys - nkeys
 
-            # but if not others set, only delete supported tags
-            if not f.others:
-                to_del &= set(f.tag_mapping.keys())
+        # but if not others set, only delete supported tags
+        if file_tags.supported is not None:
+            to_del &= file_tags.supported
 
-            for tag in to_del:
-                ntags[tag] = None
+        for tag in to_del:
+            ntags[tag] = None
 
-            self.set_tags(notify_changed=notify_changed, **ntags)
+        self.set_tags(notify_changed=notify_changed, **ntags)
 
-            self._scan_valid = True
-            return f
-        except Exception:
-            self._scan_valid = False
-            logger.exception("Error reading tags for %s", loc)
-            return False
+        self._scan_valid = True
 
     def is_local(self):
         """
@@ -464,15 +742,11 @@ class Track:
 
     def is_supported(self):
         """
-        Determines if a file has a supported media format
+        Determines if a file has a supported media format, judging by
+        its extension
         """
         if self._is_supported is None:
-            loc = self.get_loc_for_io()
-            f = metadata.get_format(loc)
-            if f is None:
-                self._is_supported = False
-            else:
-                self._is_supported = True
+            self._is_supported = metadata.is_supported(self.get_loc_for_io())
 
         return self._is_supported
 
@@ -499,9 +773,15 @@ class Track:
         """
         returns a data repr of the track suitable for pickling
 
+        Tag values are shared with the track rather than copied; like
+        the tags returned by _copy_tags, they are replaced rather than
+        modified when the track changes.
+
         internal use only please
         """
-        return deepcopy(self.__tags)
+        if self.__packed is not None:
+            self._hydrate()
+        return _expand_tags(self.__tags)
 
     def _unpickles(self, pickle_obj):
         """
@@ -509,12 +789,18 @@ class Track:
 
         internal use only please
         """
-        self.__tags = deepcopy(pickle_obj)
+        tags = _compact_tags(pickle_obj)
+        with _HYDRATE_LOCK:
+            self.__tags = tags
+            self.__packed = None
+        self._clear_cached_values()
 
     def list_tags(self):
         """
         Returns a list of the names of all tags present in this Track.
         """
+        if self.__packed is not None:
+            self._hydrate()
         return [k for k, v in self.__tags.items() if v is not None] + ['__basename']
 
     def _xform_set_values(self, tag, values):
@@ -579,6 +865,8 @@ class Track:
         # tag changes can cause expensive UI updates, so don't emit the event
         # if the track hasn't actually changed
         changed = set()
+        if self.__packed is not None:
+            self._hydrate()
 
         for tag, values in kwargs.items():
             if tag in _no_set_raw:
@@ -597,18 +885,33 @@ class Track:
             # Transform and set the value. We do NOT delete the value from the tag
             # dict (which was done prior to Exaile 4), otherwise we don't know that
             # the user wanted the tag to be deleted
-            new_value = self._xform_set_values(tag, values)
+            new_value = _compact_value(tag, self._xform_set_values(tag, values))
             if self.__tags.get(tag, _unset) != new_value:
                 changed.add(tag)
-                self.__tags[tag] = new_value
+                self.__tags[sys.intern(tag)] = new_value
 
         if changed:
             self._dirty = True
+            self._clear_cached_values()
+            for watcher in self.__dirty_watchers:
+                watcher._on_track_dirty(self)
             if notify_changed:
                 event.log_event("track_tags_changed", self, changed)
 
         return changed
 
+    def __get(self, tag, default=None):
+        """
+        Returns the value of a tag, with single values of non-internal
+        tags wrapped in a list
+        """
+        value = self.__tags.get(tag)
+        if value is None:
+            return default
+        if value.__class__ is str and tag[:2] != '__':
+            return [value]
+        return value
+
     def get_tag_raw(self, tag, join=False):
         """
         Get the raw value of a tag.  For non-internal tags, the
@@ -620,6 +923,8 @@ class Track:
 
         :returns: None if the tag is not present
         """
+        if self.__packed is not None:
+            self._hydrate()
         if tag == '__basename':
             value = self.get_basename()
         elif tag == '__startoffset':
@@ -633,6 +938,8 @@ class Track:
                 value = self.__tags.get(tag)
         else:
             value = self.__tags.get(tag)
+            if value.__class__ is str and tag[:2] != '__':
+                value = [value]
 
         if join and value and not tag.startswith('__'):
             return self.join_values(value)
@@ -653,21 +960,39 @@ class Track:
             tag=="albumartist".
         :param extend_title: If the title tag is unknown, try to
             add some identifying information to it.
+
+        Joined values are cached until the tags of the track or the
+        collection/strip_list option change.
         """
+        # __rating depends on the rating/maximum option, and lists are
+        # returned as new objects that callers may modify
+        if not join or tag == '__rating':
+            return self.__compute_tag_sort(tag, join, artist_compilations)
+        key = (tag, artist_compilations and tag == 'albumartist')
+        value = _SORT_CACHE.get(self, key)
+        if value is None:
+            value = self.__compute_tag_sort(tag, True, artist_compilations)
+            # share the keys between tracks
+            _SORT_CACHE.add(self, _SORT_KEYS.setdefault(key, key), value)
+        return value
+
+    def __compute_tag_sort(self, tag, join, artist_compilations):
         # The two magic values here are to ensure that compilations
         # and unknown values are always sorted below all normal
         # values.
+        if self.__packed is not None:
+            self._hydrate()
         value = None
-        sorttag = self.__tags.get(tag + "sort")
+        sorttag = self.__get(tag + "sort")
         if sorttag and tag != "albumartist":
             value = sorttag
         elif tag == "albumartist":
             if artist_compilations and self.__tags.get('__compilation'):
-                value = self.__tags.get('albumartist', "\uffff\uffff\uffff\ufffe")
+                value = self.__get('albumartist', "\uffff\uffff\uffff\ufffe")
             else:
-                value = self.__tags.get('albumartist')
+                value = self.__get('albumartist')
                 if value is None:
-                    value = self.__tags.get('artist', "\uffff\uffff\uffff\uffff")
+                    value = self.__get('artist', "\uffff\uffff\uffff\uffff")
             if sorttag and value not in (
                 "\uffff\uffff\uffff\ufffe",
                 "\uffff\uffff\uffff\uffff",
@@ -681,9 +1006,9 @@ class Track:
             value = self.__tags.get(tag, 0)
         elif tag == 'bpm':
             try:
-                value = int(self.__tags.get(tag, [0])[0])
+                value = int(self.__get(tag, [0])[0])
             except ValueError:
-                digits = re.search(r'\d+\.?\d*', self.__tags.get(tag, [0])[0])
+                digits = re.search(r'\d+\.?\d*', self.__get(tag, [0])[0])
                 if digits:
                     value = float(digits.group())
         elif tag == '__basename':
@@ -692,7 +1017,7 @@ class Track:
         elif tag == '__rating':
             value = self.get_rating()
         else:
-            value = self.__tags.get(tag)
+            value = self.__get(tag)
 
         if value is None:
             value = "\uffff\uffff\uffff\uffff"  # unknown
@@ -734,14 +1059,16 @@ class Track:
         if tag == '__loc':
             return Gio.File.new_for_uri(self.__tags['__loc']).get_parse_name()
 
+        if self.__packed is not None:
+            self._hydrate()
         value = None
         if tag == "albumartist":
             if artist_compilations and self.__tags.get('__compilation'):
-                value = self.__tags.get('albumartist', _VARIOUSARTISTSSTR)
+                value = self.__get('albumartist', _VARIOUSARTISTSSTR)
             else:
-                value = self.__tags.get('albumartist')
+                value = self.__get('albumartist')
                 if value is None:
-                    value = self.__tags.get('artist', _UNKNOWNSTR)
+                    value = self.__get('artist', _UNKNOWNSTR)
         elif tag in ('tracknumber', 'discnumber'):
             value = self.split_numerical(self.__tags.get(tag))[0] or ""
         elif tag in ('__length', '__startoffset', '__stopoffset'):
@@ -761,7 +1088,7 @@ class Track:
         elif tag == '__basename':
             value = self.get_basename_display()
         else:
-            value = self.__tags.get(tag)
+            value = self.__get(tag)
 
         if value is None:
             value = ''
@@ -796,16 +1123,18 @@ class Track:
 
         :returns: unicode string that is used for searching
         """
+        if self.__packed is not None:
+            self._hydrate()
         extraformat = ""
         if tag == "albumartist":
             if artist_compilations and self.__tags.get('__compilation'):
-                value = self.__tags.get('albumartist', None)
+                value = self.__get('albumartist', None)
                 tag = 'albumartist'
                 extraformat += " ! __compilation==__null__"
             else:
-                value = self.__tags.get('albumartist')
+                value = self.__get('albumartist')
                 if value is None:
-                    value = self.__tags.get('artist')
+                    value = self.__get('artist')
         elif tag in ('tracknumber', 'discnumber'):
             value = self.split_numerical(self.__tags.get(tag))[0]
         elif tag in (
@@ -827,7 +1156,7 @@ class Track:
         elif tag == '__basename':
             value = self.get_basename_display()
         else:
-            value = self.__tags.get(tag)
+            value = self.__get(tag)
 
         # Quote arguments
         if value is None:
@@ -857,6 +1186,47 @@ class Track:
 
         return value
 
+    def get_tag_search_values(self, tag, lower=False):
+        """
+        Get the values of a tag as compared by searches: the values
+        from get_tag_search, unformatted, with a missing tag as None.
+        The values are cached until the tags of the track change.
+
+        :param lower: If True, lowercase the values, for case-insensitive
+            searches
+
+        :returns: tuple of unicode strings, or (None,)
+        """
+        key = (tag, lower)
+        values = _SEARCH_CACHE.get(self, key)
+        if values is None:
+            values = self.get_tag_search(tag, format=False)
+            if values == '__null__':
+                values = (None,)
+            elif isinstance(values, list):
+                values = tuple(values)
+            else:
+                values = (values,)
+            if lower:
+                values = tuple(v if v is None else v.lower() for v in values)
+            _SEARCH_CACHE.add(self, key, values)
+        return values
+
+    def _clear_cached_values(self) -> None:
+        """
+        Drops the values cached for searching and sorting this track
+        """
+        _SEARCH_CACHE.remove(self)
+        _SORT_CACHE.remove(self)
+
+    @staticmethod
+    def get_search_cache_stats():
+        """
+        Returns the number of hits and misses of the cache used by
+        get_tag_search_values, and the number of values in it
+        """
+        return _SEARCH_CACHE.get_stats()
+
     def _get_format_obj(self):
         f = _CACHER.get(self)
         if not f:
@@ -1105,6 +1475,8 @@ class Track:
         """
         if data == "collection/strip_list":
             cls._Track__the_cuts = settings.get_option('collection/strip_list', [])
+            # sort values depend on it
+            _SORT_CACHE.clear()
 
     ### Utility method intended for TrackDB ###
 
@@ -1113,6 +1485,124 @@ class Track:
         '''Internal API, returns number of track objects we have'''
         return len(cls._Track__tracksdict)
 
+    @classmethod
+    def _add_dirty_watcher(cls, watcher):
+        '''
+        Internal API, registers an object whose _on_track_dirty(track)
+        method gets called whenever the tags of any track change. Only a
+        weak reference to the watcher is kept.
+        '''
+        cls._Track__dirty_watchers.add(watcher)
+
+    @classmethod
+    def _from_canonical(cls, tags):
+        '''
+        Internal API, like Track(_unpickles=tags), but for tags that were
+        written by this class. Skips normalizing the location.
+        '''
+        tr = cls.__tracksdict.get(tags['__loc'])
+        if tr is not None:
+            return cls(_unpickles=tags)
+        tr = object.__new__(cls)
+        tr._init = False
+        tr._scan_valid = None
+        tr._is_supported = None
+        tr._dirty = False
+        tr.__tags = _compact_tags(tags)
+        tr.__packed = None
+        tr.__register()
+        return tr
+
+    @classmethod
+    def _defer_scans(cls):
+        '''
+        Internal API, called before a TrackDB is loaded in the background.
+        Until _end_deferred_scans is called, new local tracks don't read
+        their file; they take their tags from the first TrackDB loaded
+        with them instead, as if it had been loaded before.
+        '''
+        with _PLACEHOLDER_LOCK:
+            cls.__deferred_scans += 1
+
+    @classmethod
+    def _end_deferred_scans(cls):
+        '''
+        Internal API, called once a TrackDB is loaded. Reads the tags of
+        the tracks that no TrackDB had, once no more TrackDBs are loading.
+        '''
+        with _PLACEHOLDER_LOCK:
+            cls.__deferred_scans -= 1
+            if cls.__deferred_scans:
+                return
+            tracks = list(cls.__placeholders)
+            cls.__placeholders.clear()
+        for tr in tracks:
+            tr.read_tags()
+
+    @classmethod
+    def _from_packed(cls, loc, packed):
+        '''
+        Internal API, creates a track whose tags are only unpickled from
+        packed when they are first needed. loc must be canonical.
+        '''
+        if loc in cls.__tracksdict:
+            return cls(_unpickles=pickle.loads(packed))
+        tr = object.__new__(cls)
+        tr._init = False
+        tr._scan_valid = None
+        tr._is_supported = None
+        tr._dirty = False
+        tr.__tags = {'__loc': loc}
+        tr.__packed = packed
+        tr.__register()
+        return tr
+
+    def _copy_tags(self):
+        '''
+        Internal API, returns a shallow copy of the tags of this track, or
+        the pickled tags if they have not been loaded yet. Tag values are
+        replaced rather than modified, so the copy can be written out
+        without holding up changes to the track.
+        '''
+        if self.__packed is not None:
+            return self.__packed
+        return self.__tags.copy()
+
+    def _hydrate(self):
+        '''
+        Internal API, loads the tags of a track created by _from_packed
+        '''
+        if self.__packed is None:
+            return
+        with _HYDRATE_LOCK:
+            packed = self.__packed
+            if packed is not None:
+                # other threads read __tags as soon as __packed is None
+                self.__tags = _compact_tags(pickle.loads(packed))
+                self.__packed = None
+
+    def _estimate_bytes_saved(self, seen):
+        '''
+        Internal API, estimates how much memory the tags of this track
+        take less than if every track had its own strings, and every
+        value was a list. seen is a set of the ids of strings counted so
+        far, shared by all tracks counted.
+        '''
+        if self.__packed is not None:
+            return 0
+        saved = 0
+        for tag, value in self.__tags.items():
+            saved += _shared_size(tag, seen)
+            if value.__class__ is str:
+                if tag[:2] != '__':
+                    saved += _single_list_size
+                saved += _shared_size(value, seen)
+            elif value.__class__ is list:
+                for v in value:
+                    if v.__class__ is str:
+                        saved += _shared_size(v, seen)
+        return saved
+
     def _write_rating_to_disk(self):
         if not settings.get_option(
             'collection/write_rating_to_audio_file_metadata', False
@@ -25,13 +25,29 @@
 # from your version.
 
 
-from copy import deepcopy
+from copy import copy
 import logging
+import queue
+import threading
 from time import time
-from typing import Dict, Iterable, Iterator, List, Optional, Tuple
-
-from xl import common, event
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from xl import common, event, settings
 from xl.nls import gettext as _
+from xl.trax import fuzzy, snapshot, storage
+from xl.trax.index import TagIndex
+from xl.trax.journal import TrackDBJournal, apply_records
+from xl.trax.ordered import OrderedView
 from xl.trax.track import Track
 
 logger = logging.getLogger(__name__)
@@ -47,6 +63,80 @@ class TrackHolder:
         return getattr(self._track, attr)
 
 
+class SaveStats(NamedTuple):
+    """
+    Statistics about the saves of a :class:`TrackDB`. Durations are in
+    seconds, and include both capturing and writing the data.
+    """
+
+    #: number of saves done
+    count: int = 0
+    #: duration of the last save
+    last: float = 0.0
+    #: duration of all saves together
+    total: float = 0.0
+    #: duration of the longest save
+    longest: float = 0.0
+    #: how long the last save blocked the thread that asked for it
+    last_blocked: float = 0.0
+
+
+class _SaveWriter:
+    """
+    Runs the disk writes of a :class:`TrackDB` on a separate thread, in
+    the order they were submitted. The thread exits when idle.
+    """
+
+    IDLE_TIMEOUT = 30
+
+    def __init__(self, name: str):
+        self._name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, func: Callable[[], None]) -> threading.Event:
+        """
+        Queues func to be called on the writer thread
+
+        :returns: an event that is set once func has returned
+        """
+        done = threading.Event()
+        with self._lock:
+            self._queue.put((func, done))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="TrackDB writer (%s)" % self._name
+                )
+                self._thread.daemon = True
+                self._thread.start()
+        return done
+
+    def flush(self) -> None:
+        """
+        Waits until everything submitted so far has been written
+        """
+        if self._thread is not None:
+            self.submit(lambda: None).wait()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                func, done = self._queue.get(timeout=self.IDLE_TIMEOUT)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                func()
+            except Exception:
+                logger.exception("Exception in TrackDB writer")
+            finally:
+                done.set()
+
+
 class TrackDBIterator:
     def __init__(self, track_iterator: Iterator[Tuple[str, TrackHolder]]):
         self.iter = track_iterator
@@ -104,13 +194,33 @@ class TrackDB:
         self.location = location
         self._dirty = False
         self.tracks: Dict[str, TrackHolder] = {}  # key is URI of the track
-        self.pickle_attrs = pickle_attrs
-        self.pickle_attrs += ['tracks', 'name', '_key']
+        # don't modify pickle_attrs, it is usually a default argument
+        self.pickle_attrs = pickle_attrs + ['tracks', 'name', '_key']
         self._saving = False
         self._key = 0
         self._dbversion = 2.0
         self._dbminorversion = 0
-        self._deleted_keys = []
+        self._journal = TrackDBJournal()
+        # location whose database matches our state, apart from the
+        # changes recorded in the journal
+        self._saved_location = None
+        # whether the snapshot should be rebuilt at the next save
+        self._snapshot_stale = False
+        # whether tracks were loaded without their tags, see hydrate
+        self._lazy = False
+        self._storage = storage.get_storage()
+        self._writer = _SaveWriter(name)
+        # guards what the writer thread reports back: the save stats, and
+        # whether a save failed, which is taken by the next save
+        self._save_lock = threading.Lock()
+        self._save_stats = SaveStats()
+        self._save_failed = False
+        # created by get_search_index
+        self._search_index: Optional[TagIndex] = None
+        # created by get_ordered_view, keyed by levels and compilations
+        self._ordered_views: Dict[tuple, OrderedView] = {}
+        self._watching_tracks = False
+        Track._add_dirty_watcher(self)
         if location:
             self.load_from_location()
             self._timeout_save()
@@ -137,7 +247,7 @@ class TrackDB:
         """
         Callback for auto-saving.
         """
-        self.save_to_location()
+        self.save_to_location(background=True)
         return True
 
     def set_name(self, name: str) -> None:
@@ -174,6 +284,20 @@ class TrackDB:
 
         :param location: the location to load the data from
         """
+        for _progress in self._load_from_location(location):
+            pass
+
+    def _load_from_location(
+        self, location: Optional[str] = None, batch_size: Optional[int] = None
+    ) -> Iterator[float]:
+        """
+        Does the work of load_from_location. The sync lock must be held
+        whenever this generator is advanced.
+
+        Attributes are restored first. Tracks are then added in batches of
+        batch_size tracks (all at once if None), and after each batch the
+        fraction of tracks loaded so far is yielded.
+        """
         if not location:
             location = self.location
         if not location:
@@ -183,114 +307,455 @@ class TrackDB:
 
         logger.debug("Loading %s DB from %s.", self.name, location)
 
-        pdata = common.open_shelf(location)
+        self._writer.flush()
+        pdata = self._storage.open(location)
+        try:
+            source, make_track = self._open_source(location, pdata)
+
+            for attr in self.pickle_attrs:
+                if attr == 'tracks':
+                    continue
+                try:
+                    setattr(self, attr, source.get(attr, getattr(self, attr)))
+                except Exception:
+                    # FIXME: Do something about this
+                    logger.exception("Exception occurred while loading %s", location)
+
+            keys = [x for x in source.keys() if x.startswith("tracks-")]
+            background = batch_size is not None
+            if not background:
+                # replace the tracks in one go, as we always did
+                tracks = {}
+                batch_size = len(keys) or 1
+            else:
+                tracks = self.tracks
+            # tracks may be added while loading in the background
+            loaded = set()
+
+            try:
+                for start in range(0, len(keys), batch_size):
+                    for k in keys[start : start + batch_size]:
+                        p = source[k]
+                        tr = make_track(p[0])
+                        loc = tr.get_loc_for_io()
+                        if loc not in tracks:
+                            tracks[loc] = TrackHolder(tr, p[1], **p[2])
+                        elif loc not in loaded:
+                            self._merge_loaded(tracks[loc], p)
+                        else:
+                            logger.warning("Duplicate track found: %s", loc)
+                            # presumably the second track was written because of an error,
+                            # so use the first track found.
+                            if background:
+                                # deleted by the next save, the source
+                                # may not be the database itself
+                                self._journal.record_deleted(p[1])
+                            else:
+                                del source[k]
+                        loaded.add(loc)
+                    self._clear_indexes()
+                    yield min(start + batch_size, len(keys)) / len(keys)
+                self.tracks = tracks
+                self._clear_indexes()
+            except Exception:
+                # FIXME: Do something about this
+                logger.exception("Exception occurred while loading %s", location)
+        finally:
+            pdata.close()
+
+        self._saved_location = location
+        self._dirty = False
+
+    def _merge_loaded(self, holder: TrackHolder, stored: tuple) -> None:
+        """
+        Merges the stored record of a track that was added while the
+        database was being loaded in the background: the track keeps
+        the key, attributes and internal tags it was stored with, such
+        as the date it was added
+        """
+        tags, key, attrs = stored
+        if isinstance(tags, snapshot.PackedTags):
+            tags = tags.unpack()
+        loc = holder._track.get_loc_for_io()
+        self._journal.record_deleted(holder._key)
+        holder._key = key
+        holder._attrs = attrs
+        self._journal.record_changed(key, loc)
+        holder._track.set_tags(
+            **{
+                tag: value
+                for tag, value in tags.items()
+                if tag.startswith('__') and tag != '__loc'
+            }
+        )
+
+    def _open_source(self, location: str, pdata) -> Tuple[Mapping, Callable]:
+        """
+        Checks and migrates the database, and picks what to load it from
 
+        :returns: (source, make_track); source maps shelf keys to their
+            content, make_track creates a track from the stored tags
+        """
         if "_dbversion" in pdata:
-            if int(pdata['_dbversion']) > int(self._dbversion):
+            if self._is_newer_version(pdata['_dbversion']):
                 raise common.VersionError("DB was created on a newer Exaile version.")
             elif pdata['_dbversion'] < self._dbversion:
                 logger.info("Upgrading DB format....")
-                import shutil
-
-                shutil.copyfile(location, location + "-%s.bak" % pdata['_dbversion'])
+                self._storage.backup(location, pdata, "-%s.bak" % pdata['_dbversion'])
                 import xl.migrations.database as dbmig
 
                 dbmig.handle_migration(
                     self, pdata, pdata['_dbversion'], self._dbversion
                 )
+                # any snapshot predates the migration
+                pdata[snapshot.GENERATION_KEY] = (
+                    pdata.get(snapshot.GENERATION_KEY, 0) + 1
+                )
 
-        for attr in self.pickle_attrs:
-            try:
-                if 'tracks' == attr:
-                    data = {}
-                    for k in (x for x in pdata.keys() if x.startswith("tracks-")):
-                        p = pdata[k]
-                        tr = Track(_unpickles=p[0])
-                        loc = tr.get_loc_for_io()
-                        if loc not in data:
-                            data[loc] = TrackHolder(tr, p[1], **p[2])
-                        else:
-                            logger.warning("Duplicate track found: %s", loc)
-                            # presumably the second track was written because of an error,
-                            # so use the first track found.
-                            del pdata[k]
+        if not self._storage.journaled:
+            # the storage is always up to date, and can be read in one go
+            return pdata.read_all(), self._make_track_factory()
 
-                    setattr(self, attr, data)
-                else:
-                    setattr(self, attr, pdata.get(attr, getattr(self, attr)))
-            except Exception:
-                # FIXME: Do something about this
-                logger.exception("Exception occurred while loading %s", location)
+        content = None
+        if settings.get_option('collection/use_snapshot', True):
+            content = snapshot.read_snapshot(
+                location, pdata.get(snapshot.GENERATION_KEY, 0)
+            )
 
-        pdata.close()
+        if content is not None:
+            # The snapshot matches the shelf; bring it up to date with
+            # whatever was saved to the journal since. Locations in there
+            # were written by us, so they are canonical already.
+            self._journal.record_count = apply_records(
+                content, self._journal.replay(location)
+            )
+            source = content
+            make_track = self._make_track_factory()
+        else:
+            # anything saved since the last compaction is only in the journal
+            if self._journal.exists(location):
+                pdata[snapshot.GENERATION_KEY] = (
+                    pdata.get(snapshot.GENERATION_KEY, 0) + 1
+                )
+                self._journal.compact(location, pdata)
+            self._snapshot_stale = settings.get_option('collection/use_snapshot', True)
+            self._lazy = False
+            source = pdata
+            make_track = lambda tags: Track(_unpickles=tags)
 
-        self._dirty = False
+        return source, make_track
 
-    @common.synchronized
-    def save_to_location(self, location: Optional[str] = None):
+    def _make_track_factory(self) -> Callable:
+        """
+        Returns a function creating tracks from tags that we stored
+        ourselves, which may be :class:`snapshot.PackedTags`
+        """
+        lazy = settings.get_option('collection/lazy_load', False)
+        self._lazy = lazy
+
+        def make_track(tags):
+            if isinstance(tags, snapshot.PackedTags):
+                if lazy:
+                    return Track._from_packed(tags.loc, tags.data)
+                tags = tags.unpack()
+            return Track._from_canonical(tags)
+
+        return make_track
+
+    def save_to_location(
+        self, location: Optional[str] = None, background: bool = False
+    ):
         """
         Saves a pickled representation of this :class:`TrackDB` to the
         specified location.
 
+        Only the tracks that were added, changed or removed since the
+        last save are written. They are appended to a journal next to the
+        database, which is compacted into the database itself every once
+        in a while. Saving to a location that does not hold a previously
+        saved state of this :class:`TrackDB` writes all tracks.
+
+        The state to save is captured right away, but it is written to
+        disk on a separate thread, one save after the other.
+
         :param location: the location to save the data to
+        :param background: if True, return without waiting for the
+            data to be written, including that of earlier saves
         """
-        if not self._dirty:
-            for track in self.tracks.values():
-                if track._track._dirty:
-                    self._dirty = True
-                    break
+        written = self._prepare_save(location)
+        if not background:
+            if written is not None:
+                written.wait()
+            else:
+                # there may still be earlier saves being written
+                self._writer.flush()
 
-        if not self._dirty:
-            return
+    @common.synchronized
+    def _prepare_save(self, location: Optional[str]) -> Optional[threading.Event]:
+        """
+        Captures what needs to be saved, and queues it for writing
 
+        :returns: an event that is set once the data is written, or None
+            if there was nothing to write in the background
+        """
         if not location:
             location = self.location
         if not location:
             raise AttributeError(_("You did not specify a location to save the db"))
 
         if self._saving:
-            return
-        self._saving = True
+            return None
 
+        with self._save_lock:
+            if self._save_failed:
+                self._save_failed = False
+                self._dirty = True
+
+        # the trigrams only go with the database, not with its exports
+        index = self._search_index
+        if index is not None and location == self.location:
+            self._writer.submit(lambda: self._write_trigrams(location, index))
+
+        if location != self._saved_location:
+            self._save_full(location)
+            return None
+
+        changes = self._journal.take_pending()
+        if not changes and not self._dirty and not self._snapshot_stale:
+            return None
+
+        start = time()
+        records = self._make_records(changes)
+        state = None
+        if self._storage.journaled and (
+            self._journal.needs_compaction() or self._snapshot_stale
+        ):
+            state = self._capture_state()
+            self._snapshot_stale = False
+        for loc in changes.values():
+            if loc is not None:
+                holder = self.tracks.get(loc)
+                if holder is not None:
+                    holder._track._dirty = False
+        self._dirty = False
+        blocked = time() - start
+
+        return self._writer.submit(
+            lambda: self._write_changes(location, changes, records, state, blocked)
+        )
+
+    def _write_changes(
+        self,
+        location: str,
+        changes: Dict[int, Optional[str]],
+        records: list,
+        state: Optional[tuple],
+        blocked: float,
+    ) -> None:
+        """
+        Writes journal records, and compacts the journal if state holds
+        a captured state to write the snapshot from. Storages without a
+        journal get the records directly. Runs on the writer thread.
+        """
         logger.debug("Saving %s DB to %s.", self.name, location)
+        start = time()
+        try:
+            if self._storage.journaled:
+                self._journal.append(location, records)
+                if state is not None:
+                    self._compact(location, state)
+            else:
+                pdata = self._open_for_writing(location)
+                try:
+                    apply_records(pdata, records)
+                    pdata.sync()
+                finally:
+                    pdata.close()
+        except Exception:
+            logger.exception("Failed to save music DB.")
+            self._journal.restore_pending(changes)
+            # the sync lock may be held by a thread waiting for this write,
+            # so let the next save mark the attributes as dirty
+            with self._save_lock:
+                self._save_failed = True
+        self._add_save_stats(time() - start, blocked)
+
+    def _add_save_stats(self, duration: float, blocked: float) -> None:
+        with self._save_lock:
+            stats = self._save_stats
+            self._save_stats = SaveStats(
+                stats.count + 1,
+                duration + blocked,
+                stats.total + duration + blocked,
+                max(stats.longest, duration + blocked),
+                blocked,
+            )
+
+    def get_save_stats(self) -> 'SaveStats':
+        """
+        Returns statistics about the saves of this :class:`TrackDB`
+        """
+        with self._save_lock:
+            return self._save_stats
+
+    def _make_records(self, changes: Dict[int, Optional[str]]) -> list:
+        """
+        Turns pending changes into journal records
+        """
+        records = []
+        for key, loc in changes.items():
+            shelf_key = "tracks-%s" % key
+            holder = None if loc is None else self.tracks.get(loc)
+            if holder is None or holder._key != key:
+                records.append(TrackDBJournal.delete_record(shelf_key))
+            else:
+                records.append(
+                    TrackDBJournal.set_record(
+                        shelf_key,
+                        (holder._track._pickles(), key, holder._attrs.copy()),
+                    )
+                )
+
+        if self._dirty:
+            for attr in self.pickle_attrs:
+                if attr != 'tracks':
+                    records.append(
+                        TrackDBJournal.set_record(attr, copy(getattr(self, attr)))
+                    )
+            records.append(TrackDBJournal.set_record('_dbversion', self._dbversion))
+
+        return records
+
+    def _capture_state(self) -> tuple:
+        """
+        Captures everything that goes into a snapshot, cheaply enough
+        to be done while holding the sync lock: the tracks are only
+        referenced, their tags are copied by _write_snapshot. Tags that
+        change in between are newer than the database, and are also
+        recorded in the journal, which is replayed on top of the snapshot.
+
+        :returns: (attrs, tracks)
+        """
+        attrs = {
+            attr: copy(getattr(self, attr))
+            for attr in self.pickle_attrs
+            if attr != 'tracks'
+        }
+        attrs['_dbversion'] = self._dbversion
+        return attrs, list(self.tracks.items())
+
+    def _is_newer_version(self, version: float) -> bool:
+        """
+        Whether a database of version was created by a newer version of
+        Exaile; only major versions are incompatible
+        """
+        return int(version) > int(self._dbversion)
+
+    def _open_for_writing(self, location: str):
+        """
+        Opens the database at location, unless it belongs to a newer
+        version of Exaile
+        """
+        pdata = self._storage.open(location)
+        if self._is_newer_version(pdata.get('_dbversion', self._dbversion)):
+            pdata.close()
+            raise common.VersionError("DB was created on a newer Exaile.")
+        return pdata
+
+    def _compact(self, location: str, state: tuple) -> None:
+        """
+        Replays the journal into the database at location, and rebuilds
+        the snapshot from state (see _capture_state)
+        """
+        pdata = self._open_for_writing(location)
+        try:
+            generation = pdata.get(snapshot.GENERATION_KEY, 0) + 1
+            pdata[snapshot.GENERATION_KEY] = generation
+            self._journal.compact(location, pdata)
+        finally:
+            pdata.close()
+        self._write_snapshot(location, generation, state)
 
+    def _write_snapshot(self, location: str, generation: int, state: tuple) -> None:
+        """
+        Writes a snapshot of state (see _capture_state), which must match
+        the given generation of the database at location
+        """
+        if not self._storage.journaled or not settings.get_option(
+            'collection/use_snapshot', True
+        ):
+            return
+        attrs, holders = state
+        tracks = [
+            (loc, holder._track._copy_tags(), holder._key, holder._attrs.copy())
+            for loc, holder in holders
+        ]
         try:
-            pdata = common.open_shelf(location)
-            if pdata.get('_dbversion', self._dbversion) > self._dbversion:
-                raise common.VersionError("DB was created on a newer Exaile.")
+            snapshot.write_snapshot(location, generation, attrs, tracks)
+        except Exception:
+            logger.exception("Failed to write snapshot of %s DB", self.name)
+            snapshot.delete_snapshot(location)
+
+    def _save_full(self, location: str) -> None:
+        """
+        Writes every track and attribute to the database at location.
+        Unlike other saves, this is done on the calling thread.
+        """
+        # let earlier saves finish first
+        self._writer.flush()
+        start = time()
+        own_location = location == self.location
+        changes = self._journal.take_pending() if own_location else {}
+
+        self._saving = True
+        logger.debug("Saving all of %s DB to %s.", self.name, location)
+
+        try:
+            pdata = self._open_for_writing(location)
         except Exception:
             logger.exception("Failed to open music DB for writing.")
+            self._journal.restore_pending(changes)
+            self._saving = False
             return
 
-        for attr in self.pickle_attrs:
-            # bad hack to allow saving of lists/dicts of Tracks
-            if 'tracks' == attr:
-                for k, track in self.tracks.items():
-                    key = "tracks-%s" % track._key
-                    if track._track._dirty or key not in pdata:
-                        pdata[key] = (
+        try:
+            for attr in self.pickle_attrs:
+                # bad hack to allow saving of lists/dicts of Tracks
+                if 'tracks' == attr:
+                    for k, track in self.tracks.items():
+                        pdata["tracks-%s" % track._key] = (
                             track._track._pickles(),
                             track._key,
-                            deepcopy(track._attrs),
+                            track._attrs,
                         )
-            else:
-                pdata[attr] = deepcopy(getattr(self, attr))
-
-        pdata['_dbversion'] = self._dbversion
-
-        for key in self._deleted_keys:
-            key = "tracks-%s" % key
-            if key in pdata:
-                del pdata[key]
-
-        pdata.sync()
-        pdata.close()
+                else:
+                    pdata[attr] = getattr(self, attr)
 
-        for track in self.tracks.values():
-            track._track._dirty = False
+            for key, loc in changes.items():
+                if loc is None and "tracks-%s" % key in pdata:
+                    del pdata["tracks-%s" % key]
 
-        self._dirty = False
-        self._saving = False
+            generation = pdata.get(snapshot.GENERATION_KEY, 0) + 1
+            pdata[snapshot.GENERATION_KEY] = generation
+            pdata['_dbversion'] = self._dbversion
+            pdata.sync()
+        except Exception:
+            logger.exception("Failed to save music DB.")
+            self._journal.restore_pending(changes)
+            return
+        finally:
+            pdata.close()
+            self._saving = False
+
+        # whatever was in the journal is older than what we just wrote
+        self._journal.discard(location)
+        if own_location:
+            self._saved_location = location
+            self._dirty = False
+            if self._storage.journaled:
+                self._snapshot_stale = False
+                self._write_snapshot(location, generation, self._capture_state())
+        self._add_save_stats(time() - start, 0.0)
 
     def get_track_by_loc(self, loc: str) -> Optional[Track]:
         """
@@ -342,6 +807,7 @@ class TrackDB:
                 continue
             locations += [location]
             self.tracks[location] = TrackHolder(tr, self._key)
+            self._journal.record_added(self._key, location)
             self._key += 1
 
         if locations:
@@ -366,8 +832,10 @@ class TrackDB:
         for tr in tracks:
             location = tr.get_loc_for_io()
             locations += [location]
-            self._deleted_keys.append(self.tracks[location]._key)
+            self._journal.record_deleted(self.tracks[location]._key)
             del self.tracks[location]
+            # don't keep values around for tracks that are not searched
+            tr._clear_cached_values()
 
         event.log_event('tracks_removed', self, locations)
 
@@ -375,3 +843,142 @@ class TrackDB:
 
     def get_tracks(self) -> List[Track]:
         return list(self)
+
+    def estimate_tag_bytes_saved(self) -> int:
+        """
+        Estimates how much memory is saved by :class:`Track` sharing tag
+        strings between tracks and storing single tag values without a
+        list, for the tracks in this :class:`TrackDB`
+        """
+        seen = set()
+        return sum(track._estimate_bytes_saved(seen) for track in self.get_tracks())
+
+    @common.synchronized
+    def hydrate(self) -> None:
+        """
+        Loads the tags of all tracks that were loaded without them. Call
+        this before going through the tags of all tracks.
+
+        Tracks are only loaded without their tags if the
+        ``collection/lazy_load`` option is enabled; otherwise this does
+        nothing.
+        """
+        if not self._lazy:
+            return
+        for holder in self.tracks.values():
+            holder._track._hydrate()
+        self._lazy = False
+
+    @common.synchronized
+    def get_search_index(self) -> TagIndex:
+        """
+        Returns an index of the tags of the tracks in this
+        :class:`TrackDB`, which :func:`xl.trax.search_tracks` uses to
+        narrow down searches. It is kept up to date as tracks are
+        added, removed and changed.
+        """
+        if self._search_index is None:
+            self._search_index = TagIndex(self._copy_tracks, self._read_trigrams)
+            self._watch_tracks()
+        return self._search_index
+
+    @common.synchronized
+    def get_ordered_view(
+        self, levels: Iterable[Iterable[str]], artist_compilations: bool = False
+    ) -> OrderedView:
+        """
+        Returns a view of the tracks in this :class:`TrackDB` sorted by
+        the tags of each level, see :class:`xl.trax.ordered.OrderedView`.
+        Views are shared by everyone asking for the same levels, and kept
+        up to date as tracks are added, removed and changed.
+
+        :param levels: the tags to sort by, for each level
+        :param artist_compilations: passed to
+            :meth:`xl.trax.Track.get_tag_sort`
+        """
+        levels = tuple(tuple(tags) for tags in levels)
+        view = self._ordered_views.get((levels, artist_compilations))
+        if view is None:
+            view = OrderedView(self._copy_tracks, levels, artist_compilations)
+            self._ordered_views[(levels, artist_compilations)] = view
+            self._watch_tracks()
+        return view
+
+    def _copy_tracks(self) -> List[Track]:
+        # copied in one go, tracks may be added while an index is built
+        return [holder._track for holder in list(self.tracks.values())]
+
+    def _watch_tracks(self) -> None:
+        """
+        Keeps the search index and ordered views up to date
+        """
+        if self._watching_tracks:
+            return
+        self._watching_tracks = True
+        event.add_callback(self._on_tracks_added, 'tracks_added', self)
+        event.add_callback(self._on_tracks_removed, 'tracks_removed', self)
+        event.add_callback(self._on_track_tags_changed, 'track_tags_changed')
+        event.add_callback(self._on_collection_option_set, 'collection_option_set')
+
+    def _get_indexes(self) -> list:
+        indexes = list(self._ordered_views.values())
+        if self._search_index is not None:
+            indexes.append(self._search_index)
+        return indexes
+
+    def _read_trigrams(self) -> Dict[str, fuzzy.TrigramIndex]:
+        location = self._saved_location or self.location
+        if not location:
+            return {}
+        return fuzzy.read_trigrams(location)
+
+    def _write_trigrams(self, location: str, index: TagIndex) -> None:
+        """
+        Writes the trigram indexes of the search index, if they changed.
+        Runs on the writer thread.
+        """
+        data = index.take_trigram_data()
+        if data is None:
+            return
+        try:
+            fuzzy.write_trigrams(location, data)
+        except Exception:
+            logger.exception("Failed to write trigram indexes of %s DB", self.name)
+
+    def _clear_indexes(self) -> None:
+        for index in self._get_indexes():
+            index.clear()
+
+    def _on_tracks_added(self, type, trackdb, locations) -> None:
+        tracks = self.tracks
+        added = [tracks[loc]._track for loc in locations if loc in tracks]
+        for index in self._get_indexes():
+            index.add_tracks(added)
+
+    def _on_tracks_removed(self, type, trackdb, locations) -> None:
+        for index in self._get_indexes():
+            index.remove_tracks(locations)
+
+    def _on_track_tags_changed(self, type, track, tags) -> None:
+        # other tag changes go through _on_track_dirty, with or without
+        # an event
+        if '__loc' in tags:
+            for index in self._get_indexes():
+                index.update_track(track)
+
+    def _on_collection_option_set(self, type, obj, option) -> None:
+        # the sort values of all tracks depend on it
+        if option == 'collection/strip_list':
+            for view in list(self._ordered_views.values()):
+                view.clear()
+
+    def _on_track_dirty(self, track: Track) -> None:
+        """
+        Called by :class:`Track` whenever the tags of a track change
+        """
+        loc = track.get_loc_for_io()
+        holder = self.tracks.get(loc)
+        if holder is not None and holder._track is track:
+            self._journal.record_changed(holder._key, loc)
+            for index in self._get_indexes():
+                index.update_track(track)
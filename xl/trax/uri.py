@@ -0,0 +1,184 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+
+"""
+Canonical URIs for tracks.
+
+Tracks are identified by their URI in the form returned by
+``Gio.File.get_uri()``. Creating a :class:`Gio.File` just to get that
+form is comparatively slow, and it is done for every track that is
+loaded or imported. Most URIs we see are local file URIs that are
+already canonical, because we wrote them ourselves; those are recognized
+without calling into Gio. Everything else goes through Gio once and is
+remembered in a bounded cache.
+"""
+
+from collections import OrderedDict
+import re
+import threading
+from typing import Dict, Optional
+import urllib.parse
+
+from gi.repository import Gio
+
+#: Maximum number of URIs remembered by the cache
+CACHE_SIZE = 4096
+
+
+def _get_path_chars() -> str:
+    """
+    Returns the printable ASCII characters that Gio does not escape in
+    the path of a file URI, as they differ between GLib versions
+    """
+    chars = []
+    for i in range(0x21, 0x7F):
+        char = chr(i)
+        # not alone in a segment, where Gio drops "."
+        path = '/a' + char
+        if char != '/' and Gio.File.new_for_path(path).get_uri() == 'file://' + path:
+            chars.append(re.escape(char))
+    return ''.join(chars)
+
+
+# Characters that Gio does not escape in the path of a file URI
+_PATH_CHARS = _get_path_chars()
+
+_canonical_file_uri = re.compile(
+    r"file://(?:/(?:[%s]|%%[0-9A-F]{2})+)+\Z" % _PATH_CHARS
+)
+_escape = re.compile(r"%[0-9A-F]{2}")
+
+# escapes that Gio would have written out as plain characters instead,
+# or that can't be part of a file name
+_unescaped_chars = re.compile(r"[%s/\x00]\Z" % _PATH_CHARS)
+_needless_escapes = {"%%%02X" % i for i in range(128) if _unescaped_chars.match(chr(i))}
+
+_has_scheme = re.compile(r"[A-Za-z][A-Za-z0-9+.\-]*:")
+
+_lock = threading.Lock()
+_cache: 'OrderedDict[tuple, Optional[str]]' = OrderedDict()
+_stats = {'fast': 0, 'hits': 0, 'misses': 0}
+
+
+def is_canonical_file_uri(uri: str) -> bool:
+    """
+    Returns whether uri is a local file URI that Gio would return as is
+    """
+    if not _canonical_file_uri.match(uri):
+        return False
+    if '/.' in uri:
+        # Gio removes . and .. path segments
+        for segment in uri[7:].split('/'):
+            if segment in ('.', '..'):
+                return False
+    if '%' in uri:
+        for escape in _escape.findall(uri):
+            if escape in _needless_escapes:
+                return False
+    return True
+
+
+def _count_fast() -> None:
+    with _lock:
+        _stats['fast'] += 1
+
+
+def _cached(key: tuple, compute) -> Optional[str]:
+    with _lock:
+        try:
+            value = _cache[key]
+        except KeyError:
+            pass
+        else:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return value
+
+    value = compute()
+
+    with _lock:
+        _stats['misses'] += 1
+        _cache[key] = value
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def canonicalize(uri: str) -> str:
+    """
+    Returns the same as ``Gio.File.new_for_uri(uri).get_uri()``
+    """
+    if is_canonical_file_uri(uri):
+        _count_fast()
+        return uri
+    return _cached(('uri', uri), lambda: Gio.File.new_for_uri(uri).get_uri())
+
+
+def canonicalize_arg(loc: str) -> str:
+    """
+    Returns the same as ``Gio.File.new_for_commandline_arg(loc).get_uri()``,
+    where loc is either a URI or a file path
+    """
+    if is_canonical_file_uri(loc):
+        _count_fast()
+        return loc
+    if not loc.startswith('/') and not _has_scheme.match(loc):
+        # relative to the current directory, which may change
+        return Gio.File.new_for_commandline_arg(loc).get_uri()
+    return _cached(
+        ('arg', loc), lambda: Gio.File.new_for_commandline_arg(loc).get_uri()
+    )
+
+
+def uri_to_path(uri: str) -> Optional[str]:
+    """
+    Returns the same as ``Gio.File.new_for_uri(uri).get_path()``
+    """
+    if is_canonical_file_uri(uri):
+        _count_fast()
+        return urllib.parse.unquote(uri[7:], errors='surrogateescape')
+    return _cached(('path', uri), lambda: Gio.File.new_for_uri(uri).get_path())
+
+
+def get_stats() -> Dict[str, int]:
+    """
+    Returns counters of how URIs were canonicalized:
+
+    * fast: URIs that were already canonical
+    * hits: URIs found in the cache
+    * misses: URIs that had to go through Gio
+    """
+    with _lock:
+        return dict(_stats, cached=len(_cache))
+
+
+def clear_cache() -> None:
+    """
+    Empties the cache and resets the counters
+    """
+    with _lock:
+        _cache.clear()
+        for key in _stats:
+            _stats[key] = 0
@@ -24,7 +24,8 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
-from typing import Callable, Iterable, List, Optional, TypeVar
+import heapq
+from typing import Callable, Iterable, List, Optional, Sequence, TypeVar
 
 from gi.repository import Gio
 from gi.repository import GLib
@@ -35,6 +36,13 @@ from xl.trax.search import search_tracks, TracksMatcher
 
 _T = TypeVar('_T')
 
+#: Tags whose sort value only depends on their number as searched, and
+#: never decreases when it increases, so that the tracks can be taken in
+#: order from :meth:`xl.trax.index.TagIndex.get_ordered`.
+_ORDERED_SORT_TAGS = frozenset(
+    ('__date_added', '__last_played', '__length', '__playcount', '__rating')
+)
+
 
 def is_valid_track(location: str) -> bool:
     """
@@ -122,6 +130,120 @@ def sort_tracks(
     return sorted(items, key=keyfunc, reverse=reverse)
 
 
+def top_tracks(
+    fields: Iterable[str],
+    items: Iterable[_T],
+    count: int,
+    trackfunc: Optional[Callable[[_T], Track]] = None,
+    reverse: bool = False,
+    artist_compilations: bool = False,
+) -> List[_T]:
+    """
+    Returns the first count tracks as sorted by :func:`sort_tracks`,
+    without sorting all of them: only the best count tracks seen so far
+    are kept while going through items.
+
+    :param count: the number of tracks to return
+
+    Other params are the same as for sort_tracks.
+    """
+    if count <= 0:
+        return []
+    fields = list(fields)
+    if trackfunc is None:
+        trackfunc = lambda tr: tr
+    keyfunc = lambda tr: [
+        trackfunc(tr).get_tag_sort(field, artist_compilations=artist_compilations)
+        for field in fields
+    ]
+    # same results, including for ties, as sorted(...)[:count]
+    if reverse:
+        return heapq.nlargest(count, items, key=keyfunc)
+    return heapq.nsmallest(count, items, key=keyfunc)
+
+
+def search_top_tracks(
+    trackiter,
+    trackmatchers: Iterable[TracksMatcher],
+    fields: Sequence[str],
+    count: int,
+    reverse: bool = False,
+    artist_compilations: bool = False,
+    index=None,
+) -> List[Track]:
+    """
+    Searches tracks and returns the first count tracks found, as sorted
+    by :func:`sort_tracks`.
+
+    If the first sort field is a number that can be looked up in order
+    in the search index (of trackiter, if it is a
+    :class:`xl.trax.TrackDB`), tracks are searched from the first to the
+    last in that order, and the search stops once count tracks are found.
+
+    :param trackiter: the tracks to search
+    :param trackmatchers: list of :class:`TracksMatcher`
+    :param fields: tag names to sort by
+    :param count: the number of tracks to return
+    :param reverse: whether to sort in reversed order
+    :param index: see :func:`xl.trax.search_tracks`
+    """
+    if count <= 0:
+        return []
+    trackmatchers = list(trackmatchers)
+    hydrate = getattr(trackiter, 'hydrate', None)
+    if hydrate is not None:
+        hydrate()
+    if index is None:
+        get_search_index = getattr(trackiter, 'get_search_index', None)
+        if get_search_index is not None:
+            index = get_search_index()
+
+    values = None
+    if index is not None and fields and fields[0] in _ORDERED_SORT_TAGS:
+        values = index.get_ordered(fields[0])
+    if values is None:
+        found = (srtr.track for srtr in search_tracks(trackiter, trackmatchers, index))
+        return top_tracks(
+            fields,
+            found,
+            count,
+            reverse=reverse,
+            artist_compilations=artist_compilations,
+        )
+
+    if reverse:
+        values.reverse()
+    first = fields[0]
+    found = []
+
+    def ordered():
+        last_key = None
+        for value in values:
+            tracks = index.find_value(first, value)
+            if not tracks:
+                continue
+            # tracks with the same value have the same sort key, so
+            # every track sorted before the last one found is found
+            # once a group with another key starts
+            key = next(iter(tracks)).get_tag_sort(
+                first, artist_compilations=artist_compilations
+            )
+            if len(found) >= count and key != last_key:
+                return
+            last_key = key
+            yield from tracks
+
+    for srtr in search_tracks(ordered(), trackmatchers, index):
+        found.append(srtr.track)
+    return top_tracks(
+        fields,
+        found,
+        count,
+        reverse=reverse,
+        artist_compilations=artist_compilations,
+    )
+
+
 def sort_result_tracks(fields, trackiter, reverse=False, artist_compilations=False):
     """
     Sorts SearchResultTracks, ie. the output from a search.
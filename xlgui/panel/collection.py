@@ -208,9 +208,17 @@ class CollectionPanel(panel.Panel):
         self._check_collection_empty()
         self._setup_images()
         self._connect_events()
+        # the order of the tree, and the one it is being reloaded with
         self.order = None
+        self._loading_order = None
         self.tracks = []
         self.sorted_tracks = []
+        # on_tags of the tracks found by the search, None without keyword
+        self._result_tags = None
+        self._searched_keyword = ''
+        self._search_session = trax.SearchSession()
+        # searches without blocking while typing, see load_tree
+        self._search_executor = trax.SearchExecutor()
 
         event.add_ui_callback(
             self._check_collection_empty, 'libraries_modified', collection
@@ -274,6 +282,9 @@ class CollectionPanel(panel.Panel):
         event.add_ui_callback(
             self.refresh_tracks_in_tree, 'tracks_removed', self.collection
         )
+        event.add_ui_callback(
+            self._on_collection_loaded, 'collection_loaded', self.collection
+        )
 
     def on_refresh_button_press_event(self, button, event):
         """
@@ -424,7 +435,8 @@ class CollectionPanel(panel.Panel):
             (lambda m, i, d: m.get_value(i, 1) is None), None
         )
 
-        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object)
+        # icon, text, search query, (first, last) node of the ordered view
+        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object, object)
 
         self.tree.connect("row-expanded", self.on_expanded)
 
@@ -432,11 +444,10 @@ class CollectionPanel(panel.Panel):
         """
         finds tracks matching a given iter.
         """
-        self.load_subtree(iter)
-        search = self.get_node_search_terms(iter)
-        matcher = trax.TracksMatcher(search)
-        srtrs = trax.search_tracks(self.tracks, [matcher])
-        return [x.track for x in srtrs]
+        nodes = self.model.get_value(iter, 3)
+        if nodes is None:
+            return []
+        return self._get_ordered_view().get_tracks(*nodes, only=self._result_tags)
 
     def append_to_playlist(self, item=None, event=None, replace=False):
         """
@@ -486,9 +497,11 @@ class CollectionPanel(panel.Panel):
         return " ".join(queries)
 
     def refresh_tags_in_tree(self, type, track, tags):
+        # recent search results may no longer be right
+        self._search_session.clear()
         if (
             settings.get_option('gui/sync_on_tag_change', True)
-            and bool(tags & self.order.all_sort_tags())
+            and bool(tags & self._loading_order.all_sort_tags())
             and self.collection.loc_is_member(track.get_loc_for_io())
         ):
             self._refresh_tags_in_tree()
@@ -496,6 +509,14 @@ class CollectionPanel(panel.Panel):
     def refresh_tracks_in_tree(self, type, obj, loc):
         self._refresh_tags_in_tree()
 
+    def _on_collection_loaded(self, type, collection, data):
+        """
+        Called when a collection that was loaded in the background is
+        complete
+        """
+        self.resort_tracks()
+        self.load_tree()
+
     @common.glib_wait(500)
     def _refresh_tags_in_tree(self):
         """
@@ -510,31 +531,40 @@ class CollectionPanel(panel.Panel):
         self.load_tree()
         return False
 
+    def _get_ordered_view(self, order=None):
+        """
+        Returns the tracks of the collection sorted by the given order,
+        by default the order of the tree. The collection keeps it sorted
+        as tracks change.
+        """
+        if order is None:
+            order = self.order
+        levels = [order.get_sort_tags(i) for i in range(len(order))]
+        return self.collection.get_ordered_view(levels)
+
     def resort_tracks(self):
-        # import time
-        # print("sorting...", time.clock())
-        self.sorted_tracks = trax.sort_tracks(
-            self.order.get_sort_tags(0), self.collection.get_tracks()
-        )
-        # print("sorted.", time.clock())
+        if self._loading_order is None:
+            return
+        self.sorted_tracks = self._get_ordered_view(self._loading_order).get_tracks()
+        self._search_session.clear()
 
     def load_tree(self):
         """
         Loads the Gtk.TreeView for this collection panel.
 
         Loads tracks based on the current keyword, or all the tracks in
-        the collection associated with this panel
+        the collection associated with this panel.
+
+        The tracks are searched a few at a time from the main loop, and
+        the tree is reloaded once they are all searched. Reloading again
+        before then cancels the previous reload. Until then, the tree
+        keeps its order, which its rows were built for.
         """
         logger.debug("Reloading collection tree")
-        self.current_start_count = self.start_count
-        self.tree.set_model(None)
-        self.model.clear()
+        order = self.orders[self.choice.get_active()]
 
-        self.root = None
-        oldorder = self.order
-        self.order = self.orders[self.choice.get_active()]
-
-        if not oldorder or oldorder != self.order:
+        if not self._loading_order or self._loading_order != order:
+            self._loading_order = order
             self.resort_tracks()
 
         # save the active view setting
@@ -542,14 +572,39 @@ class CollectionPanel(panel.Panel):
 
         keyword = self.keyword.strip()
         tags = list(SEARCH_TAGS)
-        tags += self.order.all_search_tags()
+        tags += order.all_search_tags()
         tags = list(set(tags))  # uniquify list to speed up search
 
-        self.tracks = list(
-            trax.search_tracks_from_string(
-                self.sorted_tracks, keyword, case_sensitive=False, keyword_tags=tags
-            )
+        self._searched_keyword = keyword
+        self._search_session.set_tracks(
+            self.sorted_tracks, self.collection.get_search_index()
         )
+        self._search_session.start_search(
+            self._search_executor,
+            keyword,
+            case_sensitive=False,
+            keyword_tags=tags,
+            on_done=self._on_tree_search_done,
+        )
+
+    def _on_tree_search_done(self, results):
+        """
+        Called when the tracks to show were found by load_tree
+        """
+        logger.debug(
+            "Search value cache: %(hits)d hits, %(misses)d misses, %(size)d values",
+            trax.Track.get_search_cache_stats(),
+        )
+        self.current_start_count = self.start_count
+        self.tree.set_model(None)
+        self.model.clear()
+        self.root = None
+        self.order = self._loading_order
+        self.tracks = results
+        if self._searched_keyword:
+            self._result_tags = {srtr.track: srtr.on_tags for srtr in results}
+        else:
+            self._result_tags = None
 
         self.load_subtree(None)
 
@@ -608,16 +663,8 @@ class CollectionPanel(panel.Panel):
         if previously_loaded:
             return
 
-        search = self.get_node_search_terms(parent)
-
         try:
             tags = self.order.get_sort_tags(depth)
-            matchers = [trax.TracksMatcher(search)]
-            srtrs = trax.search_tracks(self.tracks, matchers)
-            # sort only if we are not on top level, because tracks are
-            # already sorted by fist order
-            if depth > 0:
-                srtrs = trax.sort_result_tracks(tags, srtrs)
         except IndexError:
             return  # at the bottom of the tree
         try:
@@ -628,88 +675,72 @@ class CollectionPanel(panel.Panel):
         if depth == len(self.order) - 1:
             bottom = True
 
+        # the nodes of the view are read directly instead of searching
+        # and sorting the tracks, filtered by the current search if any
+        view = self._get_ordered_view()
+        first, last = ((), None) if parent is None else self.model.get_value(parent, 3)
+        only = self._result_tags
+        if bottom:
+            children = [
+                (view.get_key(track), 1, track)
+                for track in view.get_tracks(first, last, only)
+            ]
+        else:
+            children = view.get_children(first, last, only)
+
+        # [text, search query, first node, last node, count, first track]
+        rows = []
+        for node, count, track in children:
+            tagval = self.order.format_track(depth, track)
+            match_query = " ".join([track.get_tag_search(t, format=True) for t in tags])
+            if bottom:
+                match_query += " " + track.get_tag_search("__loc", format=True)
+            # Different *sort tags can cause nodes to differ but still
+            # produce identical entries in the displayed tree, so these
+            # are merged into a single entry.
+            elif rows and rows[-1][0] == tagval and rows[-1][1] == match_query:
+                rows[-1][3] = node
+                rows[-1][4] += count
+                continue
+            rows.append([tagval, match_query, node, node, count, track])
+
         display_counts = settings.get_option('gui/display_track_counts', True)
         draw_seps = settings.get_option('gui/draw_separators', True)
-        last_char = ''
-        last_val = ''
-        last_dval = ''
-        last_matchq = ''
-        count = 0
-        first = True
-        path = None
-        expanded = False
+        deeper_tags = []
+        for i in range(depth + 1, len(self.order)):
+            deeper_tags.extend(self.order.get_sort_tags(i))
+        last_char = None
         to_expand = []
 
-        for srtr in srtrs:
-            # The value returned by get_tag_sort() may be of other
-            # typa than str (e.g., an int for track number), hence
-            # explicit conversion via str() is necessary.
-            stagvals = [str(srtr.track.get_tag_sort(x)) for x in tags]
-            stagval = " ".join(stagvals)
-            if last_val != stagval or bottom:
-                tagval = self.order.format_track(depth, srtr.track)
-                match_query = " ".join(
-                    [srtr.track.get_tag_search(t, format=True) for t in tags]
-                )
-                if bottom:
-                    match_query += " " + srtr.track.get_tag_search("__loc", format=True)
-
-                # Different *sort tags can cause stagval to not match
-                # but the below code will produce identical entries in
-                # the displayed tree.  This condition checks to ensure
-                # that new entries are added if and only if they will
-                # display different results, avoiding that problem.
-                if match_query != last_matchq or tagval != last_dval or bottom:
-                    if display_counts and path and not bottom:
-                        iter = self.model.get_iter(path)
-                        val = self.model.get_value(iter, 1)
-                        val = "%s (%s)" % (val, count)
-                        self.model.set_value(iter, 1, val)
-                        count = 0
-
-                    last_val = stagval
-                    last_dval = tagval
-                    if depth == 0 and draw_seps:
-                        val = srtr.track.get_tag_sort(tags[0])
-                        char = first_meaningful_char(val)
-                        if first:
-                            last_char = char
-                        else:
-                            if char != last_char and last_char != '':
-                                self.model.append(parent, [None, None, None])
-                            last_char = char
-                    first = False
-
-                    last_matchq = match_query
-                    iter = self.model.append(parent, [image, tagval, match_query])
-                    path = self.model.get_path(iter)
-                    expanded = False
-                    if not bottom:
-                        self.model.append(iter, [None, None, None])
-            count += 1
-            if not expanded:
-                alltags = []
-                for i in range(depth + 1, len(self.order)):
-                    alltags.extend(self.order.get_sort_tags(i))
-                for t in alltags:
-                    if t in srtr.on_tags:
-                        # keep original path intact for following block
-                        newpath = path
+        for tagval, match_query, first_node, last_node, count, track in rows:
+            if depth == 0 and draw_seps:
+                char = first_meaningful_char(track.get_tag_sort(tags[0]))
+                if last_char not in (None, '', char):
+                    self.model.append(parent, [None, None, None, None])
+                last_char = char
+
+            if display_counts and not bottom:
+                tagval = "%s (%s)" % (tagval, count)
+            iter = self.model.append(
+                parent, [image, tagval, match_query, (first_node, last_node)]
+            )
+            if bottom:
+                continue
+            self.model.append(iter, [None, None, None, None])
+
+            if only is not None:
+                for result in view.get_tracks(first_node, last_node, only):
+                    on_tags = only[result]
+                    if any(t in on_tags for t in deeper_tags):
+                        path = self.model.get_path(iter)
                         if depth > 0:
                             # for some reason, nested iters are always
                             # off by one in the terminal entry.
-                            newpath = Gtk.TreePath.new_from_indices(
-                                newpath[:-1] + [newpath[-1] - 1]
+                            path = Gtk.TreePath.new_from_indices(
+                                path[:-1] + [path[-1] - 1]
                             )
-                        to_expand.append(newpath)
-                        expanded = True
-
-        if display_counts and path and not bottom:
-            iter = self.model.get_iter(path)
-            val = self.model.get_value(iter, 1)
-            val = "%s (%s)" % (val, count)
-            self.model.set_value(iter, 1, val)
-            count = 0
+                        to_expand.append(path)
+                        break
 
         if (
             settings.get_option("gui/expand_enabled", True)
@@ -791,10 +822,7 @@ class CollectionDragTreeView(DragTreeView):
         :return: list of tracks [xl.trax.Track]
         """
         it = self.get_model().get_iter(path)
-        search = self.container.get_node_search_terms(it)
-        matcher = trax.TracksMatcher(search)
-        for i in trax.search_tracks(self.container.tracks, [matcher]):
-            yield i.track
+        return self.container._find_tracks(it)
 
 
 # vim: et sts=4 sw=4
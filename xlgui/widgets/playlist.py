@@ -871,6 +871,12 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
         self.selection.set_mode(Gtk.SelectionMode.MULTIPLE)
 
         self._filter_matcher = None
+        self._filter_session = trax.SearchSession()
+        # searches the playlist without blocking while typing
+        self._filter_executor = trax.SearchExecutor()
+        # tracks the filter was applied to, and those it matched
+        self._filter_searched = set()
+        self._filter_matched = set()
 
         self._sort_columns = list(common.BASE_SORT_TAGS)  # Column sort order
 
@@ -896,6 +902,9 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
         )
 
         event.add_ui_callback(self.on_option_set, "gui_option_set", destroy_with=self)
+        event.add_ui_callback(
+            self.on_track_tags_changed, "track_tags_changed", destroy_with=self
+        )
         event.add_ui_callback(
             self.on_playback_start,
             "playback_track_start",
@@ -941,7 +950,9 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
         """
 
         if filter_string is None:
+            self._filter_executor.cancel()
             self._filter_matcher = None
+            self._filter_session.clear()
             self._refilter()
         else:
             # Merge default columns and currently enabled columns
@@ -949,19 +960,40 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
                 playlist_columns.DEFAULT_COLUMNS
                 + [c.name for c in self.get_columns()[1:]]
             )
-            self._filter_matcher = trax.TracksMatcher(
-                filter_string, case_sensitive=False, keyword_tags=keyword_tags
-            )
+            # narrows down the previous results while typing
+            tracks = self.playlist[:]
+            session = self._filter_session
+            session.set_tracks(tracks)
             logger.debug(
                 "Filtering playlist %r by %r.", self.playlist.name, filter_string
             )
-            self._refilter()
-            logger.debug(
-                "Filtering playlist %r by %r completed.",
-                self.playlist.name,
+
+            def on_done(results):
+                self._filter_searched = set(tracks)
+                self._filter_matched = {srtr.track for srtr in results}
+                self._filter_matcher = session.matcher
+                self._refilter()
+                logger.debug(
+                    "Filtering playlist %r by %r completed.",
+                    self.playlist.name,
+                    filter_string,
+                )
+
+            # replaces the search for the previous filter, if still running
+            session.start_search(
+                self._filter_executor,
                 filter_string,
+                case_sensitive=False,
+                keyword_tags=keyword_tags,
+                on_done=on_done,
             )
 
+    def on_track_tags_changed(self, type, track, tags):
+        # the model redraws the track later on, which filters it again
+        if track in self._filter_searched:
+            self._filter_searched.discard(track)
+            self._filter_session.clear()
+
     def get_selection_count(self):
         """
         Returns the number of items currently selected in the
@@ -1194,6 +1226,9 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
     def _modelfilter_visible_func(self, model, iter, data):
         if self._filter_matcher is not None:
             track = model.get_value(iter, 0)
+            if track in self._filter_searched:
+                return track in self._filter_matched
+            # added since the filter was set
             return self._filter_matcher.match(trax.SearchResultTrack(track))
         return True
 
@@ -1264,7 +1299,7 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
         # kill performance
         self.get_selection().unselect_all()
         with self.handler_block(self._cursor_changed):
-            self.playlist.sort(self._sort_columns, reverse=reverse)
+            self.playlist.sort(self._sort_columns, reverse=reverse, keep_sorted=True)
 
     def on_option_set(self, typ, obj, data):
         if data == "gui/columns" or data == 'gui/playlist_font':